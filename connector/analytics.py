@@ -0,0 +1,297 @@
+#!/usr/bin/python3
+
+
+import json
+import os
+import sys
+import numpy
+from csv import DictWriter
+from enum import Enum
+from argparse import ArgumentParser
+from backup_reader import add_reader_arguments, reader_from_args
+from opensearch_common import read_language_types, read_license_names, BUCKET_METRICS, GPL, LANGUAGE_CONSTRUCTION, \
+    popularity_bounds
+
+
+class OutputFormat(Enum):
+    CSV = "csv"
+    JSON = "json"
+
+
+    def __str__(self):
+        return self.value
+
+
+class Index:
+    def __init__(self):
+        self.ids = dict()
+        self.names = []
+
+
+    def __call__(self, name):
+        id = self.ids.get(name)
+        if id is None:
+            id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return id
+
+
+class Corpus:
+    def __init__(self, reader, language_types):
+        self.languages = Index()
+        self.licenses = Index()
+        # The same names the repos uploader writes, so both report sets agree
+        self.license_names = read_license_names(reader)
+
+        repo_metrics = {metric: [] for metric in BUCKET_METRICS}
+        repo_license = []
+        row_repo = []
+        row_language = []
+        row_values = {field: [] for field in ["files", "blank", "comment", "code"]}
+        for doc in reader.repos():
+            repo = len(repo_license)
+            for metric in BUCKET_METRICS:
+                repo_metrics[metric].append(doc[metric] or 0)
+            repo_license.append(self.licenses(doc["license_key"]))
+            for language, info in doc["languages"].items():
+                row_repo.append(repo)
+                row_language.append(self.languages(language))
+                row_values["files"].append(info["files"])
+                row_values["blank"].append(info["blank"] if "blank" in info else info["blank "])
+                row_values["comment"].append(info["comment"])
+                row_values["code"].append(info["code"])
+
+        self.repo_count = len(repo_license)
+        self.repo_metrics = {metric: numpy.array(values, dtype=numpy.int64) for metric, values in repo_metrics.items()}
+        self.repo_license = numpy.array(repo_license, dtype=numpy.int64)
+        self.row_repo = numpy.array(row_repo, dtype=numpy.int64)
+        self.row_language = numpy.array(row_language, dtype=numpy.int64)
+        self.row_values = {field: numpy.array(values, dtype=numpy.int64) for field, values in row_values.items()}
+
+        self.types = Index()
+        self.types(GPL)
+        self.language_type = numpy.array([self.types(language_types.get(name, GPL))
+                                          for name in self.languages.names], dtype=numpy.int64)
+        self.row_type = self.language_type[self.row_language] if len(row_language) else self.row_language
+        self.row_dsl = self.row_type != self.types.ids[GPL]
+
+
+    def repo_sum(self, field, mask):
+        return numpy.bincount(self.row_repo[mask], weights=self.row_values[field][mask], minlength=self.repo_count)
+
+
+def __ratio(numerator, denominator):
+    numerator = numpy.asarray(numerator, dtype=numpy.float64)
+    denominator = numpy.asarray(denominator, dtype=numpy.float64)
+    return numpy.divide(numerator, denominator, out=numpy.zeros_like(numerator), where=denominator != 0)
+
+
+def __class_masks(corpus):
+    return [(GPL, ~corpus.row_dsl), ("DSL", corpus.row_dsl)]
+
+
+def report_line_ratios(corpus):
+    rows = []
+    total = sum(int(corpus.row_values[field].sum()) for field in ["code", "comment", "blank"])
+    for name, mask in __class_masks(corpus):
+        code, comment, blank = (int(corpus.row_values[field][mask].sum()) for field in ["code", "comment", "blank"])
+        rows.append({
+            "class": name,
+            "code": code,
+            "comment": comment,
+            "blank": blank,
+            "comment_per_code": float(__ratio(comment, code)),
+            "blank_per_code": float(__ratio(blank, code)),
+            "share_of_all_lines": float(__ratio(code + comment + blank, total))
+        })
+    return rows
+
+
+def report_lines_per_file(corpus):
+    rows = []
+    for name, mask in __class_masks(corpus):
+        files = int(corpus.row_values["files"][mask].sum())
+        code = int(corpus.row_values["code"][mask].sum())
+        lines = code + int(corpus.row_values["comment"][mask].sum()) + int(corpus.row_values["blank"][mask].sum())
+        rows.append({
+            "class": name,
+            "files": files,
+            "code_per_file": float(__ratio(code, files)),
+            "lines_per_file": float(__ratio(lines, files))
+        })
+    return rows
+
+
+def report_dsl_share_by_popularity(corpus):
+    dsl_code = corpus.repo_sum("code", corpus.row_dsl)
+    all_code = corpus.repo_sum("code", numpy.ones_like(corpus.row_dsl))
+    share = __ratio(dsl_code, all_code)
+    rows = []
+    for metric in BUCKET_METRICS:
+        values = corpus.repo_metrics[metric]
+        # popularity_bucket of every repository at once
+        buckets = numpy.where(values > 0, numpy.floor(numpy.log10(numpy.maximum(values, 1))).astype(numpy.int64) + 1, 0)
+        bucket_count = int(buckets.max()) + 1 if len(buckets) else 0
+        repos = numpy.bincount(buckets, minlength=bucket_count)
+        share_sum = numpy.bincount(buckets, weights=share, minlength=bucket_count)
+        dsl_sum = numpy.bincount(buckets, weights=dsl_code, minlength=bucket_count)
+        code_sum = numpy.bincount(buckets, weights=all_code, minlength=bucket_count)
+        for bucket in numpy.nonzero(repos)[0]:
+            bucket_from, bucket_to = popularity_bounds(int(bucket))
+            rows.append({
+                "metric": metric,
+                "from": bucket_from,
+                "to": bucket_to,
+                "repos": int(repos[bucket]),
+                "mean_dsl_share": float(share_sum[bucket] / repos[bucket]),
+                "dsl_code_share": float(__ratio(dsl_sum[bucket], code_sum[bucket]))
+            })
+    return rows
+
+
+def report_dsl_by_domain(corpus):
+    type_count = len(corpus.types.names)
+    rows = []
+    sums = {field: numpy.bincount(corpus.row_type, weights=corpus.row_values[field], minlength=type_count)
+            for field in ["files", "code", "comment", "blank"]}
+    repo_type = numpy.unique(corpus.row_repo * type_count + corpus.row_type)
+    repos = numpy.bincount(repo_type % type_count, minlength=type_count)
+    for type_id, name in enumerate(corpus.types.names):
+        if GPL == name:
+            continue
+        rows.append({
+            "type": name,
+            "repos": int(repos[type_id]),
+            "files": int(sums["files"][type_id]),
+            "code": int(sums["code"][type_id]),
+            "comment": int(sums["comment"][type_id]),
+            "blank": int(sums["blank"][type_id])
+        })
+    return sorted(rows, key=lambda row: -row["code"])
+
+
+def report_dsl_with_gpl(corpus, top_gpl=20):
+    gpl_rows = ~corpus.row_dsl
+    gpl_ids = numpy.unique(corpus.row_language[gpl_rows])
+    repos_per_gpl = numpy.bincount(corpus.row_language[gpl_rows], minlength=len(corpus.languages.names))
+    gpl_ids = gpl_ids[numpy.argsort(-repos_per_gpl[gpl_ids])][:top_gpl]
+    if 0 == len(gpl_ids):
+        return []
+    gpl_column = numpy.full(len(corpus.languages.names), -1, dtype=numpy.int64)
+    gpl_column[gpl_ids] = numpy.arange(len(gpl_ids))
+
+    # Sparse (repository, GPL column) and (repository, DSL type) pairs, a repository counts once per pair
+    selected = gpl_rows & (gpl_column[corpus.row_language] >= 0)
+    gpl_pairs = numpy.unique(corpus.row_repo[selected] * len(gpl_ids) + gpl_column[corpus.row_language[selected]])
+    gpl_repo, gpl_col = numpy.divmod(gpl_pairs, len(gpl_ids))
+    type_count = len(corpus.types.names)
+    dsl_pairs = numpy.unique(corpus.row_repo[corpus.row_dsl] * type_count + corpus.row_type[corpus.row_dsl])
+    dsl_repo, dsl_type = numpy.divmod(dsl_pairs, type_count)
+
+    # Every GPL pair is joined with the DSL pairs of its repository, they are contiguous since the pairs are sorted
+    first = numpy.searchsorted(dsl_repo, gpl_repo, side="left")
+    counts = numpy.searchsorted(dsl_repo, gpl_repo, side="right") - first
+    gpl_index = numpy.repeat(numpy.arange(len(gpl_repo)), counts)
+    dsl_index = numpy.repeat(first - (numpy.cumsum(counts) - counts), counts) + numpy.arange(int(counts.sum()))
+    together = numpy.bincount(gpl_col[gpl_index] * type_count + dsl_type[dsl_index],
+                              minlength=len(gpl_ids) * type_count).reshape(len(gpl_ids), type_count)
+    repos_per_column = numpy.bincount(gpl_col, minlength=len(gpl_ids))
+    rows = []
+    for column, language in enumerate(gpl_ids):
+        gpl_repos = int(repos_per_column[column])
+        for type_id in numpy.nonzero(together[column])[0]:
+            rows.append({
+                "gpl": corpus.languages.names[language],
+                "dsl_type": corpus.types.names[type_id],
+                "repos": int(together[column, type_id]),
+                "share_of_gpl_repos": float(__ratio(together[column, type_id], gpl_repos))
+            })
+    return rows
+
+
+def report_language_construction(corpus):
+    type_id = corpus.types.ids.get(LANGUAGE_CONSTRUCTION)
+    if type_id is None:
+        return []
+    mask = corpus.row_type == type_id
+    language_count = len(corpus.languages.names)
+    repos = numpy.bincount(corpus.row_language[mask], minlength=language_count)
+    files = numpy.bincount(corpus.row_language[mask], weights=corpus.row_values["files"][mask], minlength=language_count)
+    code = numpy.bincount(corpus.row_language[mask], weights=corpus.row_values["code"][mask], minlength=language_count)
+    rows = [{
+        "language": corpus.languages.names[language],
+        "repos": int(repos[language]),
+        "files": int(files[language]),
+        "code": int(code[language])
+    } for language in numpy.nonzero(repos)[0]]
+    return sorted(rows, key=lambda row: -row["repos"])
+
+
+def report_code_share_by_license(corpus):
+    license_count = len(corpus.licenses.names)
+    row_license = corpus.repo_license[corpus.row_repo]
+    repos = numpy.bincount(corpus.repo_license, minlength=license_count)
+    rows = []
+    for name, mask in __class_masks(corpus):
+        code = numpy.bincount(row_license[mask], weights=corpus.row_values["code"][mask], minlength=license_count)
+        rows.append((name, code))
+    gpl_code, dsl_code = rows[0][1], rows[1][1]
+    share = __ratio(dsl_code, gpl_code + dsl_code)
+    return sorted([{
+        "license_key": key,
+        "license_name": corpus.license_names.get(key, key),
+        "repos": int(repos[license]),
+        "gpl_code": int(gpl_code[license]),
+        "dsl_code": int(dsl_code[license]),
+        "dsl_code_share": float(share[license])
+    } for license, key in enumerate(corpus.licenses.names)], key=lambda row: -row["repos"])
+
+
+REPORTS = {
+    "line_ratios": report_line_ratios,
+    "lines_per_file": report_lines_per_file,
+    "dsl_share_by_popularity": report_dsl_share_by_popularity,
+    "dsl_by_domain": report_dsl_by_domain,
+    "dsl_with_gpl": report_dsl_with_gpl,
+    "language_construction": report_language_construction,
+    "code_share_by_license": report_code_share_by_license
+}
+
+
+def write_reports(reports, out_dir, output_format):
+    if out_dir is None:
+        json.dump(reports, sys.stdout, ensure_ascii=False, indent=2)
+        return
+    os.makedirs(out_dir, exist_ok=True)
+    for name, rows in reports.items():
+        if OutputFormat.JSON == output_format:
+            with open(f"{out_dir}/{name}.json", 'w') as jsonFile:
+                json.dump(rows, jsonFile, ensure_ascii=False, indent=2)
+            continue
+        with open(f"{out_dir}/{name}.csv", 'w', newline='') as csvFile:
+            if not rows:
+                continue
+            writer = DictWriter(csvFile, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        prog="analytics.py",
+        description="Compute analytical reports from backup")
+    parser.add_argument("-b", "--backup", type=str, help="Backup directory")
+    parser.add_argument("-c", "--csv", type=str, help="CSV with languages info")
+    parser.add_argument("-o", "--out", type=str, default=None, help="Output directory, JSON to stdout if not set")
+    parser.add_argument("-f", "--format", type=OutputFormat, choices=list(OutputFormat), default=OutputFormat.CSV,
+                        help="Output format for files in output directory")
+    parser.add_argument("-r", "--report", type=str, action="append", choices=list(REPORTS), default=None,
+                        help="Report to compute, all if not set")
+    add_reader_arguments(parser)
+    args = parser.parse_args()
+
+    reader = reader_from_args(args.backup, args)
+    corpus = Corpus(reader, read_language_types(args.csv))
+    reader.report_errors()
+    reports = {name: REPORTS[name](corpus) for name in (args.report or REPORTS)}
+    write_reports(reports, args.out, args.format)
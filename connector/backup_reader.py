@@ -0,0 +1,164 @@
+import json
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from enum import Enum
+from backup_storage import StorageType, SqliteStorage
+
+
+BadFile = namedtuple("BadFile", ["path", "error"])
+
+
+class JsonBackend(Enum):
+    STDLIB = "json"
+    ORJSON = "orjson"
+
+
+    def __str__(self):
+        return self.value
+
+
+def __loads(backend):
+    if JsonBackend.ORJSON == backend:
+        try:
+            import orjson
+            return orjson.loads
+        except ImportError:
+            pass
+    return json.loads
+
+
+def read_dir(dir, backend=JsonBackend.STDLIB):
+    loads = __loads(backend)
+    entries = []
+    errors = []
+    for filename in os.listdir(dir):
+        filepath = f"{dir}/{filename}"
+        if not filename.endswith(".json") or not os.path.isfile(filepath):
+            continue
+        try:
+            with open(filepath, "rb") as jsonFile:
+                entries.append((filepath, loads(jsonFile.read())))
+        except Exception as e:
+            errors.append(BadFile(filepath, f"{type(e).__name__}: {e}"))
+    return entries, errors
+
+
+class BackupReader:
+    def __init__(self, backup_dir, processes=None, json_backend=JsonBackend.STDLIB,
+                 storage_type=StorageType.DIRECTORY, bad_files=None):
+        self.backup_dir = backup_dir
+        self.bad_files = bad_files
+        self.processes = processes or os.cpu_count() or 1
+        self.json_backend = json_backend
+        self.storage_type = storage_type
+        self.errors = []
+
+
+    def __flat_entries(self, dir):
+        if not os.path.isdir(dir):
+            return
+        entries, errors = read_dir(dir, self.json_backend)
+        self.errors += errors
+        yield from entries
+
+
+    def __owner_entries(self, parent_dir):
+        if not os.path.isdir(parent_dir):
+            return
+        subdirs = (f"{parent_dir}/{subdir}" for subdir in os.listdir(parent_dir))
+        subdirs = (subdir for subdir in subdirs if os.path.isdir(subdir))
+        if 1 == self.processes:
+            for subdir in subdirs:
+                yield from self.__flat_entries(subdir)
+            return
+
+        # Only a bounded number of owner directories is decoded ahead of the consumer
+        with ProcessPoolExecutor(max_workers=self.processes) as executor:
+            running = set()
+            for subdir in subdirs:
+                if len(running) >= 2 * self.processes:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        entries, errors = future.result()
+                        self.errors += errors
+                        yield from entries
+                running.add(executor.submit(read_dir, subdir, self.json_backend))
+            while running:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    entries, errors = future.result()
+                    self.errors += errors
+                    yield from entries
+
+
+    def __catalog_entries(self, table):
+        storage = SqliteStorage(self.backup_dir)
+        try:
+            for doc in getattr(storage, table)():
+                yield None, doc
+        finally:
+            storage.close()
+
+
+    def repo_entries(self):
+        if StorageType.SQLITE == self.storage_type:
+            return self.__catalog_entries("repos")
+        return self.__owner_entries(f"{self.backup_dir}/repos")
+
+
+    def skipped_entries(self):
+        if StorageType.SQLITE == self.storage_type:
+            return self.__catalog_entries("skipped")
+        return self.__owner_entries(f"{self.backup_dir}/skipped")
+
+
+    def language_entries(self):
+        if StorageType.SQLITE == self.storage_type:
+            return self.__catalog_entries("languages")
+        return self.__flat_entries(f"{self.backup_dir}/langs")
+
+
+    def license_entries(self):
+        if StorageType.SQLITE == self.storage_type:
+            return self.__catalog_entries("licenses")
+        return self.__flat_entries(f"{self.backup_dir}/licenses")
+
+
+    def repos(self):
+        return (doc for _, doc in self.repo_entries())
+
+
+    def skipped(self):
+        return (doc for _, doc in self.skipped_entries())
+
+
+    def languages(self):
+        return (doc for _, doc in self.language_entries())
+
+
+    def licenses(self):
+        return (doc for _, doc in self.license_entries())
+
+
+    def report_errors(self):
+        if self.bad_files is not None:
+            with open(self.bad_files, "w") as reportFile:
+                for error in self.errors:
+                    reportFile.write(json.dumps(error._asdict()) + "\n")
+        for error in self.errors:
+            print(f"Bad json file '{error.path}': {error.error}", file=sys.stderr)
+
+
+def add_reader_arguments(parser):
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="Processes decoding the backup")
+    parser.add_argument("--json-backend", type=JsonBackend, choices=list(JsonBackend), default=JsonBackend.STDLIB,
+                        help="JSON decoder")
+    parser.add_argument("--storage", type=StorageType, choices=list(StorageType), default=StorageType.DIRECTORY,
+                        help="Backup storage backend")
+    parser.add_argument("--bad-files", type=str, default=None, help="Write bad backup files report (JSON lines)")
+
+
+def reader_from_args(backup_dir, args):
+    return BackupReader(backup_dir, args.processes, args.json_backend, args.storage, args.bad_files)
@@ -0,0 +1,260 @@
+import base64
+import json
+import os
+import sqlite3
+import sys
+import metrics
+from enum import Enum
+from threading import Lock
+
+
+class StorageType(Enum):
+    DIRECTORY = "dir"
+    SQLITE = "sqlite"
+
+
+    def __str__(self):
+        return self.value
+
+
+def language_file_name(name):
+    return f"{str(base64.urlsafe_b64encode(name.encode('ascii')))[2:-1]}.json"
+
+
+def normalize_languages(languages):
+    # Older connector versions stored the cloc blank count under "blank " with a trailing space
+    for info in languages.values():
+        if "blank " in info:
+            blank = info.pop("blank ")
+            info.setdefault("blank", blank)
+    return languages
+
+
+class DirectoryStorage:
+    def __init__(self, backup_dir):
+        self.backup_dir = backup_dir
+        self.repos_dir = f"{backup_dir}/repos/"
+        self.langs_dir = f"{backup_dir}/langs/"
+        self.licenses_dir = f"{backup_dir}/licenses/"
+        self.skipped_dir = f"{backup_dir}/skipped/"
+        for dir in [self.repos_dir, self.langs_dir, self.licenses_dir, self.skipped_dir]:
+            os.makedirs(dir, exist_ok=True)
+
+
+    @staticmethod
+    def __write_json(kind, path, doc):
+        # Write then rename, so an interrupted run never leaves a truncated file behind
+        with metrics.storage_latency.time(storage="dir", kind=kind):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as jsonFile:
+                jsonFile.write(json.dumps(doc))
+            os.replace(tmp_path, path)
+
+
+    @staticmethod
+    def __read_jsons(dir):
+        for filename in os.listdir(dir):
+            filepath = f"{dir}/{filename}"
+            if filename.endswith(".json") and os.path.isfile(filepath):
+                with open(filepath, 'r') as jsonFile:
+                    try:
+                        yield json.load(jsonFile)
+                    except Exception:
+                        print(f"Bad json file '{filepath}'", file=sys.stderr)
+
+
+    @staticmethod
+    def __read_owner_jsons(parent_dir):
+        for subdir in os.listdir(parent_dir):
+            subdirPath = f"{parent_dir}/{subdir}"
+            if os.path.isdir(subdirPath):
+                yield from DirectoryStorage.__read_jsons(subdirPath)
+
+
+    def has_repo(self, owner, repo):
+        return os.path.exists(f"{self.repos_dir}/{owner}/{repo}.json")
+
+
+    def get_repo(self, owner, repo):
+        try:
+            with open(f"{self.repos_dir}/{owner}/{repo}.json", 'r') as jsonFile:
+                return json.load(jsonFile)
+        except (OSError, ValueError):
+            return None
+
+
+    def add_repo(self, doc):
+        owner_dir = f"{self.repos_dir}/{doc['owner']}"
+        os.makedirs(owner_dir, exist_ok=True)
+        DirectoryStorage.__write_json("repo", f"{owner_dir}/{doc['repo']}.json", doc)
+
+
+    def has_language(self, name):
+        return os.path.exists(f"{self.langs_dir}/{language_file_name(name)}")
+
+
+    def add_language(self, doc):
+        DirectoryStorage.__write_json("language", f"{self.langs_dir}/{language_file_name(doc['name'])}", doc)
+
+
+    def has_license(self, key):
+        return os.path.exists(f"{self.licenses_dir}/{key}.json")
+
+
+    def add_license(self, doc):
+        DirectoryStorage.__write_json("license", f"{self.licenses_dir}/{doc['key']}.json", doc)
+
+
+    def add_skipped(self, doc):
+        owner_dir = f"{self.skipped_dir}/{doc['owner']}"
+        os.makedirs(owner_dir, exist_ok=True)
+        DirectoryStorage.__write_json("skipped", f"{owner_dir}/{doc['repo']}.json", doc)
+
+
+    def repos(self):
+        return DirectoryStorage.__read_owner_jsons(self.repos_dir)
+
+
+    def languages(self):
+        return DirectoryStorage.__read_jsons(self.langs_dir)
+
+
+    def licenses(self):
+        return DirectoryStorage.__read_jsons(self.licenses_dir)
+
+
+    def skipped(self):
+        return DirectoryStorage.__read_owner_jsons(self.skipped_dir)
+
+
+    def durable(self):
+        return True
+
+
+    def commit(self):
+        pass
+
+
+    def close(self):
+        pass
+
+
+class SqliteStorage:
+    catalog_name = "catalog.sqlite"
+    schema = [
+        "CREATE TABLE IF NOT EXISTS repos (owner TEXT NOT NULL, repo TEXT NOT NULL, doc TEXT NOT NULL, "
+        "PRIMARY KEY (owner, repo)) WITHOUT ROWID",
+        "CREATE TABLE IF NOT EXISTS langs (name TEXT PRIMARY KEY, doc TEXT NOT NULL) WITHOUT ROWID",
+        "CREATE TABLE IF NOT EXISTS licenses (key TEXT PRIMARY KEY, doc TEXT NOT NULL) WITHOUT ROWID",
+        "CREATE TABLE IF NOT EXISTS skipped (owner TEXT NOT NULL, repo TEXT NOT NULL, doc TEXT NOT NULL, "
+        "PRIMARY KEY (owner, repo)) WITHOUT ROWID"
+    ]
+
+
+    def __init__(self, backup_dir, batch_size=100):
+        os.makedirs(backup_dir, exist_ok=True)
+        self.path = f"{backup_dir}/{SqliteStorage.catalog_name}"
+        self.batch_size = batch_size
+        self.pending = 0
+        self.lock = Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        for statement in SqliteStorage.schema:
+            self.connection.execute(statement)
+        self.connection.commit()
+
+
+    def __exists(self, query, params):
+        with self.lock:
+            return self.connection.execute(query, params).fetchone() is not None
+
+
+    def __write(self, kind, query, params):
+        with self.lock, metrics.storage_latency.time(storage="sqlite", kind=kind):
+            self.connection.execute(query, params)
+            self.pending += 1
+            if self.pending >= self.batch_size:
+                self.connection.commit()
+                self.pending = 0
+
+
+    def __scan(self, query):
+        # Writes through this connection change what an open scan returns, writers scan through another SqliteStorage
+        cursor = self.connection.cursor()
+        for (doc,) in cursor.execute(query):
+            yield json.loads(doc)
+
+
+    def has_repo(self, owner, repo):
+        return self.__exists("SELECT 1 FROM repos WHERE owner = ? AND repo = ?", (owner, repo))
+
+
+    def get_repo(self, owner, repo):
+        with self.lock:
+            row = self.connection.execute("SELECT doc FROM repos WHERE owner = ? AND repo = ?", (owner, repo)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+
+    def add_repo(self, doc):
+        self.__write("repo", "INSERT OR REPLACE INTO repos VALUES (?, ?, ?)",
+                     (doc["owner"], doc["repo"], json.dumps(doc)))
+
+
+    def has_language(self, name):
+        return self.__exists("SELECT 1 FROM langs WHERE name = ?", (name,))
+
+
+    def add_language(self, doc):
+        self.__write("language", "INSERT OR REPLACE INTO langs VALUES (?, ?)", (doc["name"], json.dumps(doc)))
+
+
+    def has_license(self, key):
+        return self.__exists("SELECT 1 FROM licenses WHERE key = ?", (key,))
+
+
+    def add_license(self, doc):
+        self.__write("license", "INSERT OR REPLACE INTO licenses VALUES (?, ?)", (doc["key"], json.dumps(doc)))
+
+
+    def add_skipped(self, doc):
+        self.__write("skipped", "INSERT OR REPLACE INTO skipped VALUES (?, ?, ?)",
+                     (doc["owner"], doc["repo"], json.dumps(doc)))
+
+
+    def repos(self):
+        return self.__scan("SELECT doc FROM repos ORDER BY owner, repo")
+
+
+    def languages(self):
+        return self.__scan("SELECT doc FROM langs ORDER BY name")
+
+
+    def licenses(self):
+        return self.__scan("SELECT doc FROM licenses ORDER BY key")
+
+
+    def skipped(self):
+        return self.__scan("SELECT doc FROM skipped ORDER BY owner, repo")
+
+
+    def durable(self):
+        with self.lock:
+            return 0 == self.pending
+
+
+    def commit(self):
+        with self.lock:
+            self.connection.commit()
+            self.pending = 0
+
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+
+
+def open_storage(backup_dir, storage_type=StorageType.DIRECTORY):
+    if StorageType.SQLITE == storage_type:
+        return SqliteStorage(backup_dir)
+    return DirectoryStorage(backup_dir)
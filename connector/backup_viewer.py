@@ -3,60 +3,39 @@
 
 from argparse import ArgumentParser
 from enum import Enum
-import os
-import json
 import sys
 from csv import DictWriter
+from backup_reader import add_reader_arguments, reader_from_args
+from columnar_export import ExportFormat, export_backup
 
 
 class BackupType(Enum):
     REPOS = 'repos'
     LANGS = 'langs'
     LICENSES = 'licenses'
+    SKIPPED = 'skipped'
 
 
     def __str__(self):
         return self.value
 
 
-def __read_jsons(dir):
-    licenses = []
-    for filename in os.listdir(dir):
-        filepath = f"{dir}/{filename}"
-        if os.path.isfile(filepath):
-            with open(filepath, 'r') as jsonFile:
-                try:
-                    licenses.append(json.load(jsonFile))
-                except Exception:
-                    print(f"Bad json file '{filepath}'", file=sys.stderr)
-    return licenses
-
-
-def __print_jsons_simple(dir, fieldnames=None):
-    jsons = __read_jsons(dir)
-    if fieldnames is not None:
-        fields = fieldnames
-    else:
-        fields = set()
-        for jsonObject in jsons:
-            for key in jsonObject.keys():
-                fields.add(key)
-    writer = DictWriter(sys.stdout, fieldnames=fields)
+def __print_jsons_simple(jsons, fieldnames):
+    writer = DictWriter(sys.stdout, extrasaction='ignore', fieldnames=fieldnames)
     writer.writeheader()
     writer.writerows(jsons)
 
 
-def print_licenses(dir):
-    __print_jsons_simple(f"{dir}/licenses", ["key", "name", "spdx_id", "url", "node_id"])
+def print_licenses(reader):
+    __print_jsons_simple(reader.licenses(), ["key", "name", "spdx_id", "url", "node_id"])
 
 
-def print_langs(dir):
-    __print_jsons_simple(f"{dir}/langs", ["name", "type"])
+def print_langs(reader):
+    __print_jsons_simple(reader.languages(), ["name", "type"])
 
 
-def print_repos(dir):
-    parent_dir = f"{dir}/repos"
-    writer = DictWriter(sys.stdout, extrasaction='ignore', fieldnames=[
+def print_repos(reader):
+    __print_jsons_simple(reader.repos(), [
         "owner",
         "repo",
         "language",
@@ -65,19 +44,23 @@ def print_repos(dir):
         "watchers",
         "license_key"
     ])
-    writer.writeheader()
-    for subdir in os.listdir(parent_dir):
-        subdirPath = f"{parent_dir}/{subdir}"
-        if os.path.isdir(subdirPath):
-            jsons = __read_jsons(subdirPath)
-            writer.writerows(jsons)
+
+
+def print_skipped(reader):
+    __print_jsons_simple(reader.skipped(), [
+        "owner",
+        "repo",
+        "size",
+        "reason"
+    ])
 
 
 if __name__ == "__main__":
     choicer = {
         BackupType.REPOS: print_repos,
         BackupType.LANGS: print_langs,
-        BackupType.LICENSES: print_licenses
+        BackupType.LICENSES: print_licenses,
+        BackupType.SKIPPED: print_skipped
     }
 
     parser = ArgumentParser(
@@ -85,6 +68,18 @@ if __name__ == "__main__":
         description="View backup")
     parser.add_argument("-t", "--type", type=BackupType, choices=list(BackupType), help="Data type")
     parser.add_argument("-d", "--dir", type=str, help="Backup directory")
+    parser.add_argument("-e", "--export", type=str, default=None,
+                        help="Export repos and repo languages as columnar files into this directory")
+    parser.add_argument("-f", "--format", type=ExportFormat, choices=list(ExportFormat), default=ExportFormat.PARQUET,
+                        help="Columnar export format")
+    parser.add_argument("--row-group-size", type=int, default=65536, help="Rows per exported row group")
+    add_reader_arguments(parser)
     args = parser.parse_args()
 
-    choicer[args.type](args.dir)
+    reader = reader_from_args(args.dir, args)
+    if args.export is not None:
+        count = export_backup(reader, args.export, args.format, args.row_group_size)
+        print(f"Exported repos: {count}", file=sys.stderr)
+    else:
+        choicer[args.type](reader)
+    reader.report_errors()
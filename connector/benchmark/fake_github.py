@@ -0,0 +1,247 @@
+#!/usr/bin/python3
+
+
+from argparse import ArgumentParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Lock, Thread
+from urllib.parse import urlparse, parse_qs
+import hashlib
+import json
+import math
+import re
+import time
+from synthetic_backup import repo_infos
+
+
+class RateLimiter:
+    def __init__(self, limits, window):
+        self.limits = limits
+        self.window = window
+        self.used = dict()
+        self.lock = Lock()
+
+
+    def take(self, token, resource):
+        limit = self.limits[resource]
+        now = time.time()
+        window_start = now - now % self.window
+        reset = int(math.ceil(window_start + self.window))
+        with self.lock:
+            key = (token, resource, window_start)
+            used = self.used.get(key, 0)
+            if used >= limit:
+                return False, limit, 0, reset
+            self.used[key] = used + 1
+            return True, limit, limit - used - 1, reset
+
+
+    def peek(self, token, resource):
+        limit = self.limits[resource]
+        now = time.time()
+        window_start = now - now % self.window
+        with self.lock:
+            used = self.used.get((token, resource, window_start), 0)
+        return limit, max(0, limit - used), int(math.ceil(window_start + self.window))
+
+
+class FakeGitHub(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+    def __init__(self, address, infos, per_page_max=100, search_limit=30, core_limit=5000, window=60):
+        super().__init__(address, FakeGitHubHandler)
+        self.infos = dict()
+        self.names = []
+        self.requests = {"search": 0, "core": 0, "graphql": 0, "limited": 0, "not_modified": 0}
+        self.requests_lock = Lock()
+        self.add_repos(infos)
+        self.per_page_max = per_page_max
+        self.limiter = RateLimiter({"search": search_limit, "core": core_limit, "graphql": core_limit}, window)
+
+
+    def reset(self, infos):
+        self.infos.clear()
+        self.names.clear()
+        self.add_repos(infos)
+        with self.requests_lock:
+            for key in self.requests:
+                self.requests[key] = 0
+
+
+    def add_repos(self, infos):
+        for info in infos:
+            if info["full_name"] not in self.infos:
+                self.names.append(info["full_name"])
+            self.infos[info["full_name"]] = info
+
+
+    def count(self, kind):
+        with self.requests_lock:
+            self.requests[kind] += 1
+
+
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+    def search(self, query, page, per_page):
+        # Qualifiers are ignored, the first term matches repository names like GitHub matches words
+        term = query.split(" ")[0].lower()
+        found = [name for name in self.names if term in name.split("/")[1].lower()]
+        # GitHub serves at most 1000 results per query
+        start = (page - 1) * per_page
+        items = [self.infos[name] for name in found[start:min(start + per_page, 1000)]]
+        return {"total_count": len(found), "incomplete_results": False, "items": items}
+
+
+def graphql_node(info):
+    license = info["license"]
+    return {
+        "name": info["name"],
+        "nameWithOwner": info["full_name"],
+        "owner": {"login": info["owner"]["login"]},
+        "url": info["html_url"],
+        "diskUsage": info["size"],
+        "forkCount": info["forks_count"],
+        "stargazerCount": info["stargazers_count"],
+        "pushedAt": info["pushed_at"],
+        "createdAt": info["created_at"],
+        "updatedAt": info["updated_at"],
+        "licenseInfo": {
+            "key": license["key"],
+            "name": license["name"],
+            "spdxId": license["spdx_id"],
+            "url": license["url"]
+        } if license else None,
+        "primaryLanguage": {"name": info["language"]} if info["language"] else None
+    }
+
+
+def start_server(server):
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return thread
+
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, Nagle would delay every keep-alive response
+    disable_nagle_algorithm = True
+
+
+    def log_message(self, format, *args):
+        pass
+
+
+    def __send(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or dict()).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+    @staticmethod
+    def __rate_limit_headers(resource, limit, remaining, reset):
+        return {
+            "X-RateLimit-Limit": str(limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(reset),
+            "X-RateLimit-Resource": resource
+        }
+
+
+    def __resolve(self, url):
+        if "/search/repositories" == url.path:
+            params = parse_qs(url.query)
+            page = int(params.get("page", ["1"])[0])
+            per_page = min(int(params.get("per_page", ["30"])[0]), self.server.per_page_max)
+            return 200, self.server.search(params.get("q", [""])[0], page, per_page)
+        parts = url.path.strip("/").split("/")
+        if 3 == len(parts) and "repos" == parts[0]:
+            info = self.server.infos.get(f"{parts[1]}/{parts[2]}")
+            if info is not None:
+                return 200, info
+        return 404, {"message": "Not Found"}
+
+
+    def do_POST(self):
+        if "/graphql" != urlparse(self.path).path:
+            self.__send(404, {"message": "Not Found"})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        token = self.headers.get("Authorization", "")
+        allowed, limit, remaining, reset = self.server.limiter.take(token, "graphql")
+        headers = FakeGitHubHandler.__rate_limit_headers("graphql", limit, remaining, reset)
+        if not allowed:
+            # GraphQL reports an exhausted limit as an error of a successful response
+            self.server.count("limited")
+            self.__send(200, {"errors": [{"type": "RATE_LIMITED", "message": "API rate limit exceeded"}]}, headers)
+            return
+        self.server.count("graphql")
+
+        # Only aliased repository lookups are understood
+        variables = request.get("variables") or dict()
+        data = dict()
+        errors = []
+        for alias, owner, name in re.findall(r"(\w+): repository\(owner: \$(\w+), name: \$(\w+)\)", request["query"]):
+            info = self.server.infos.get(f"{variables[owner]}/{variables[name]}")
+            data[alias] = graphql_node(info) if info is not None else None
+            if info is None:
+                errors.append({"type": "NOT_FOUND", "path": [alias], "message": "Could not resolve to a Repository"})
+        answer = {"data": data}
+        if errors:
+            answer["errors"] = errors
+        self.__send(200, answer, headers)
+
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        resource = "search" if url.path.startswith("/search/") else "core"
+        token = self.headers.get("Authorization", "")
+        status, body = self.__resolve(url)
+        etag = f"\"{hashlib.sha1(json.dumps(body).encode('utf-8')).hexdigest()}\""
+        if 200 == status and self.headers.get("If-None-Match") == etag:
+            # Like GitHub, a not modified answer does not count against the primary rate limit
+            self.server.count("not_modified")
+            headers = FakeGitHubHandler.__rate_limit_headers(resource, *self.server.limiter.peek(token, resource))
+            headers["ETag"] = etag
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+
+        allowed, limit, remaining, reset = self.server.limiter.take(token, resource)
+        headers = FakeGitHubHandler.__rate_limit_headers(resource, limit, remaining, reset)
+        if not allowed:
+            self.server.count("limited")
+            self.__send(403, {"message": "API rate limit exceeded"}, headers)
+            return
+        self.server.count(resource)
+        if 200 == status:
+            headers["ETag"] = etag
+        self.__send(status, body, headers)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        prog="fake_github.py",
+        description="Local GitHub REST API stand-in")
+    parser.add_argument("-p", "--port", type=int, default=8080, help="Port")
+    parser.add_argument("-o", "--owners", type=int, default=100, help="Number of owners")
+    parser.add_argument("-r", "--repos", type=int, default=10, help="Repositories per owner")
+    parser.add_argument("--search-limit", type=int, default=30, help="Search requests per window and token")
+    parser.add_argument("--core-limit", type=int, default=5000, help="Core requests per window and token")
+    parser.add_argument("--window", type=int, default=60, help="Rate limit window in seconds")
+    args = parser.parse_args()
+
+    server = FakeGitHub(("127.0.0.1", args.port), repo_infos(args.owners, args.repos), 100,
+                        args.search_limit, args.core_limit, args.window)
+    print(f"Serving {len(server.names)} repositories on {server.url()}")
+    server.serve_forever()
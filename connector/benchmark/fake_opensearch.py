@@ -0,0 +1,368 @@
+#!/usr/bin/python3
+
+
+from argparse import ArgumentParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Lock
+from urllib.parse import urlparse, parse_qs
+import gzip
+import itertools
+import json
+
+
+class FakeOpenSearch(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+    def __init__(self, address):
+        super().__init__(address, FakeOpenSearchHandler)
+        self.lock = Lock()
+        self.indices = dict()
+        self.scrolls = dict()
+        self.scroll_ids = itertools.count()
+        self.requests = {"bulk": 0, "bulk_items": 0, "index": 0, "search": 0}
+
+
+    def reset(self):
+        with self.lock:
+            self.indices.clear()
+            self.scrolls.clear()
+            for key in self.requests:
+                self.requests[key] = 0
+
+
+    def create_index(self, name, body):
+        settings = {key: str(value) for key, value in body.get("settings", dict()).get("index", dict()).items()}
+        self.indices[name] = {"settings": settings, "mappings": body.get("mappings", dict()), "docs": dict()}
+
+
+    def write(self, index, action, id, source):
+        docs = self.indices.setdefault(index, {"settings": dict(), "mappings": dict(), "docs": dict()})["docs"]
+        if "delete" == action:
+            if docs.pop(id, None) is None:
+                return 404, "not_found"
+            return 200, "deleted"
+        if "create" == action and id in docs:
+            return 409, None
+        if "update" == action and "script" in source:
+            return self.__script_update(docs, id, source)
+        if "update" == action:
+            if id not in docs:
+                if not source.get("doc_as_upsert"):
+                    return 404, None
+                docs[id] = dict()
+            docs[id].update(source.get("doc", dict()))
+            return 200, "updated"
+        result = "updated" if id in docs else "created"
+        docs[id] = source
+        return 200 if "updated" == result else 201, result
+
+
+    @staticmethod
+    def __script_update(docs, id, source):
+        # Painless is not interpreted, only the counter script of opensearch_rollup.py is emulated
+        if id in docs:
+            doc = dict(docs[id])
+        elif source.get("scripted_upsert"):
+            doc = dict(source.get("upsert", dict()))
+        else:
+            return 404, None
+        params = source["script"].get("params", dict())
+        # Stricter than the script: a missing field fails like unguarded Painless arithmetic on null,
+        # so upserts without every counter are caught
+        for field, value in params.get("add", dict()).items():
+            if doc.get(field) is None:
+                return 400, None
+            doc[field] = doc[field] + value
+        for ratio, numerator, denominator in params.get("ratios", []):
+            if doc.get(numerator) is None or doc.get(denominator) is None:
+                return 400, None
+            doc[ratio] = doc[numerator] / doc[denominator] if doc[denominator] else 0.0
+        if doc.get("repos", 1) <= 0:
+            docs.pop(id, None)
+            return 200, "deleted"
+        docs[id] = doc
+        return 200, "updated"
+
+
+def field_values(source, field):
+    values = [source]
+    for part in field.split("."):
+        found = []
+        for value in values:
+            if isinstance(value, dict) and part in value:
+                found += value[part] if isinstance(value[part], list) else [value[part]]
+        values = found
+    return [value for value in values if value is not None]
+
+
+def aggregate(sources, aggs):
+    # Only the aggregations opensearch_report.py sends: sum, avg, terms and range
+    result = dict()
+    for name, spec in aggs.items():
+        sub_aggs = spec.get("aggs", spec.get("aggregations", dict()))
+        if "sum" in spec or "avg" in spec:
+            kind = "sum" if "sum" in spec else "avg"
+            values = [value for source in sources for value in field_values(source, spec[kind]["field"])]
+            if "sum" == kind:
+                result[name] = {"value": float(sum(values))}
+            else:
+                result[name] = {"value": sum(values) / len(values) if values else None}
+        elif "terms" in spec:
+            terms = spec["terms"]
+            include = terms.get("include")
+            groups = dict()
+            for source in sources:
+                for value in set(field_values(source, terms["field"])):
+                    if include is None or value in include:
+                        groups.setdefault(value, []).append(source)
+            keys = sorted(groups, key=lambda key: (-len(groups[key]), key))[:terms.get("size", 10)]
+            result[name] = {"buckets": [dict(aggregate(groups[key], sub_aggs), key=key, doc_count=len(groups[key]))
+                                        for key in keys]}
+        elif "range" in spec:
+            buckets = []
+            for bounds in spec["range"]["ranges"]:
+                selected = [source for source in sources
+                            if any(bounds.get("from", float("-inf")) <= value < bounds.get("to", float("inf"))
+                                   for value in field_values(source, spec["range"]["field"]))]
+                bucket = dict(aggregate(selected, sub_aggs), doc_count=len(selected))
+                bucket.update({key: bounds[key] for key in ["key", "from", "to"] if key in bounds})
+                buckets.append(bucket)
+            result[name] = {"buckets": buckets}
+    return result
+
+
+class FakeOpenSearchHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, Nagle would delay every keep-alive response
+    disable_nagle_algorithm = True
+
+
+    def log_message(self, format, *args):
+        pass
+
+
+    def __send(self, status, body=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if "HEAD" != self.command:
+            self.wfile.write(data)
+
+
+    def __error(self, status, error_type):
+        self.__send(status, {"error": {"type": error_type, "reason": error_type}, "status": status})
+
+
+    def __body(self):
+        data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if "gzip" == self.headers.get("Content-Encoding"):
+            data = gzip.decompress(data)
+        return data.decode("utf-8")
+
+
+    def __bulk(self, default_index, body):
+        lines = [line for line in body.split("\n") if line.strip()]
+        items = []
+        errors = False
+        with self.server.lock:
+            position = 0
+            while position < len(lines):
+                action, meta = next(iter(json.loads(lines[position]).items()))
+                position += 1
+                source = None
+                if "delete" != action:
+                    source = json.loads(lines[position])
+                    position += 1
+                index = meta.get("_index", default_index)
+                status, result = self.server.write(index, action, meta["_id"], source)
+                item = {"_index": index, "_id": meta["_id"], "status": status}
+                if result is None:
+                    errors = True
+                    item["error"] = {"type": {404: "document_missing_exception", 400: "script_exception"}.get(
+                        status, "version_conflict_engine_exception")}
+                else:
+                    item["result"] = result
+                items.append({action: item})
+            self.server.requests["bulk"] += 1
+            self.server.requests["bulk_items"] += len(items)
+        self.__send(200, {"took": 1, "errors": errors, "items": items})
+
+
+    def __search(self, index, query, body):
+        request = json.loads(body) if body else dict()
+        fields = request.get("_source")
+        with self.server.lock:
+            self.server.requests["search"] += 1
+            docs = list(self.server.indices.get(index, {"docs": dict()})["docs"].items())
+        # Only the term query opensearch_report.py sends
+        term = request.get("query", dict()).get("term")
+        if term is not None:
+            (field, value), = term.items()
+            value = value["value"] if isinstance(value, dict) else value
+            docs = [(id, source) for id, source in docs if value in field_values(source, field)]
+        hits = []
+        for id, source in docs:
+            if isinstance(fields, list):
+                source = {key: value for key, value in source.items() if key in fields}
+            hits.append({"_index": index, "_id": id, "_score": 1.0, "_source": source})
+        size = int(query.get("size", [request.get("size", 10)])[0])
+        response = {"took": 1, "timed_out": False, "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+                    "hits": {"total": {"value": len(hits), "relation": "eq"}}}
+        if "scroll" in query:
+            scroll_id = str(next(self.server.scroll_ids))
+            with self.server.lock:
+                self.server.scrolls[scroll_id] = (hits[size:], size)
+            response["_scroll_id"] = scroll_id
+        response["hits"]["hits"] = hits[:size]
+        aggs = request.get("aggs", request.get("aggregations"))
+        if aggs is not None:
+            response["aggregations"] = aggregate([source for _, source in docs], aggs)
+        self.__send(200, response)
+
+
+    def __mget(self, default_index, body):
+        request = json.loads(body)
+        requested = [(default_index, id) for id in request.get("ids", [])]
+        requested += [(doc.get("_index", default_index), doc["_id"]) for doc in request.get("docs", [])]
+        docs = []
+        with self.server.lock:
+            self.server.requests["search"] += 1
+            for index, id in requested:
+                source = self.server.indices.get(index, {"docs": dict()})["docs"].get(id)
+                doc = {"_index": index, "_id": id, "found": source is not None}
+                if source is not None:
+                    doc["_source"] = source
+                docs.append(doc)
+        self.__send(200, {"docs": docs})
+
+
+    def __scroll(self, body):
+        scroll_id = json.loads(body)["scroll_id"]
+        with self.server.lock:
+            hits, size = self.server.scrolls.get(scroll_id, ([], 0))
+            self.server.scrolls[scroll_id] = (hits[size:], size)
+        self.__send(200, {"_scroll_id": scroll_id, "took": 1, "timed_out": False,
+                          "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+                          "hits": {"hits": hits[:size]}})
+
+
+    def __handle(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [part for part in url.path.split("/") if part]
+        body = self.__body() if "Content-Length" in self.headers else ""
+        indices = self.server.indices
+
+        if not parts:
+            self.__send(200, {"name": "fake", "version": {"number": "2.9.0", "distribution": "opensearch"}})
+        elif "_bulk" == parts[-1]:
+            self.__bulk(parts[0] if 2 == len(parts) else None, body)
+        elif ["_search", "scroll"] == parts:
+            if "DELETE" == self.command:
+                with self.server.lock:
+                    for scroll_id in json.loads(body or "{}").get("scroll_id", []):
+                        self.server.scrolls.pop(scroll_id, None)
+                self.__send(200, {"succeeded": True, "num_freed": 1})
+            else:
+                self.__scroll(body)
+        elif "_refresh" == parts[-1]:
+            self.__send(200, {"_shards": {"total": 1, "successful": 1, "failed": 0}})
+        elif 1 == len(parts):
+            name = parts[0]
+            with self.server.lock:
+                exists = name in indices
+                if "PUT" == self.command and not exists:
+                    self.server.create_index(name, json.loads(body) if body else dict())
+                elif "DELETE" == self.command and exists:
+                    del indices[name]
+                elif exists:
+                    description = {name: {"settings": {"index": dict(indices[name]["settings"])},
+                                          "mappings": indices[name]["mappings"]}}
+            if "HEAD" == self.command or "GET" == self.command:
+                self.__send(200 if exists else 404, description if exists and "GET" == self.command else None)
+            elif "PUT" == self.command and exists:
+                self.__error(400, "resource_already_exists_exception")
+            elif "DELETE" == self.command and not exists:
+                self.__error(404, "index_not_found_exception")
+            else:
+                self.__send(200, {"acknowledged": True, "index": name})
+        elif "_mget" == parts[-1]:
+            self.__mget(parts[0] if 2 == len(parts) else None, body)
+        elif parts[0] not in indices and parts[1] not in ["_doc", "_search"]:
+            self.__error(404, "index_not_found_exception")
+        elif "_settings" == parts[1]:
+            with self.server.lock:
+                settings = indices[parts[0]]["settings"]
+                if "PUT" == self.command:
+                    # null resets a setting to its default
+                    for key, value in json.loads(body)["index"].items():
+                        if value is None:
+                            settings.pop(key, None)
+                        else:
+                            settings[key] = str(value)
+                    self.__send(200, {"acknowledged": True})
+                    return
+                self.__send(200, {parts[0]: {"settings": {"index": dict(settings)}}})
+        elif "_mapping" == parts[1]:
+            with self.server.lock:
+                mappings = indices[parts[0]]["mappings"]
+                if "PUT" == self.command:
+                    update = json.loads(body)
+                    mappings.setdefault("properties", dict()).update(update.get("properties", dict()))
+                    if "_meta" in update:
+                        mappings["_meta"] = update["_meta"]
+                    self.__send(200, {"acknowledged": True})
+                    return
+                self.__send(200, {parts[0]: {"mappings": mappings}})
+        elif "_search" == parts[1]:
+            self.__search(parts[0], query, body)
+        elif "_doc" == parts[1] and 3 == len(parts):
+            with self.server.lock:
+                self.server.requests["index"] += 1
+                if "GET" == self.command:
+                    doc = indices.get(parts[0], {"docs": dict()})["docs"].get(parts[2])
+                    response = {"_index": parts[0], "_id": parts[2], "found": doc is not None}
+                    if doc is not None:
+                        response["_source"] = doc
+                    self.__send(200 if doc is not None else 404, response)
+                    return
+                action = "delete" if "DELETE" == self.command else "index"
+                status, result = self.server.write(parts[0], action, parts[2], json.loads(body) if body else None)
+            self.__send(status, {"_index": parts[0], "_id": parts[2], "result": result, "_version": 1})
+        else:
+            self.__error(400, "unsupported_operation_exception")
+
+
+    def do_GET(self):
+        self.__handle()
+
+
+    def do_HEAD(self):
+        self.__handle()
+
+
+    def do_POST(self):
+        self.__handle()
+
+
+    def do_PUT(self):
+        self.__handle()
+
+
+    def do_DELETE(self):
+        self.__handle()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        prog="fake_opensearch.py",
+        description="Local OpenSearch stand-in accepting index management and bulk requests")
+    parser.add_argument("-p", "--port", type=int, default=9200, help="Port")
+    args = parser.parse_args()
+
+    server = FakeOpenSearch(("127.0.0.1", args.port))
+    print(f"Serving on http://127.0.0.1:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+
+
+from argparse import ArgumentParser
+import os
+import random
+import subprocess
+
+
+SOURCES = {
+    "c": "int function_{0}(int value)\n{{\n    // Scale value\n    return value * {0};\n}}\n\n",
+    "py": "def function_{0}(value):\n    # Scale value\n    return value * {0}\n\n\n",
+    "md": "## Section {0}\n\nSome text for section {0}.\n\n",
+    "yml": "key_{0}:\n  # Value\n  value: {0}\n",
+    "json": "{{\"key\": {0}}}\n",
+    "g4": "rule{0} : 'token{0}' ;\n\n"
+}
+SIZES = {
+    "small": (5, 20),
+    "medium": (50, 100),
+    "large": (300, 200)
+}
+
+
+def __git(repo_dir, *args):
+    subprocess.run(["git", "-C", repo_dir, *args], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                   env={**os.environ, "GIT_AUTHOR_NAME": "bench", "GIT_AUTHOR_EMAIL": "bench@localhost",
+                        "GIT_COMMITTER_NAME": "bench", "GIT_COMMITTER_EMAIL": "bench@localhost"})
+
+
+def create_repo(repo_dir, files, functions, random_source):
+    os.makedirs(repo_dir, exist_ok=True)
+    __git(repo_dir, "init", "-q")
+    for number in range(files):
+        extension = random_source.choice(list(SOURCES))
+        subdir = f"{repo_dir}/dir{number % 10}"
+        os.makedirs(subdir, exist_ok=True)
+        with open(f"{subdir}/file{number}.{extension}", "w") as source:
+            for function in range(functions):
+                source.write(SOURCES[extension].format(function))
+    __git(repo_dir, "add", "-A")
+    __git(repo_dir, "commit", "-q", "-m", "Initial commit")
+
+
+def create_repos(base_dir, count, seed=0):
+    random_source = random.Random(seed)
+    repos = []
+    sizes = list(SIZES)
+    for number in range(count):
+        size = sizes[number % len(sizes)]
+        repo_dir = os.path.abspath(f"{base_dir}/{size}{number:03d}")
+        if not os.path.isdir(f"{repo_dir}/.git"):
+            create_repo(repo_dir, *SIZES[size], random_source)
+        repos.append(repo_dir)
+    return repos
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        prog="git_repos.py",
+        description="Create local git repositories of varied sizes")
+    parser.add_argument("-d", "--dir", type=str, help="Directory for repositories")
+    parser.add_argument("-n", "--number", type=int, default=9, help="Number of repositories")
+    args = parser.parse_args()
+
+    for repo_dir in create_repos(args.dir, args.number):
+        print(repo_dir)
@@ -0,0 +1,190 @@
+#!/usr/bin/python3
+
+
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backup_storage import StorageType
+from github_client import GitHubClient
+from connector import Connector
+from line_counter import CountEngine
+from fake_github import FakeGitHub, start_server
+from fake_opensearch import FakeOpenSearch
+from git_repos import create_repos
+from synthetic_backup import generate, repo_info, repo_infos
+
+
+connector_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Benchmark:
+    def __init__(self, work_dir, github, opensearch, processes):
+        self.work_dir = work_dir
+        self.github = github
+        self.opensearch = opensearch
+        self.processes = processes
+        self.results = []
+
+
+    def record(self, dataset, repos, stage, seconds, ok=True, **details):
+        result = {"dataset": dataset, "repos": repos, "stage": stage, "seconds": round(seconds, 4), "ok": ok}
+        result.update(details)
+        self.results.append(result)
+        print(f"{dataset:>10} {stage:<24} {seconds:9.3f} s{'' if ok else ' FAILED'}", file=sys.stderr)
+
+
+    def timed(self, dataset, repos, stage, function, *args):
+        start = time.perf_counter()
+        details = function(*args)
+        details = details if isinstance(details, dict) else dict()
+        self.record(dataset, repos, stage, time.perf_counter() - start, **details)
+
+
+    def run(self, dataset, repos, stage, script, *args, stdout=subprocess.DEVNULL):
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, f"{connector_dir}/{script}", *args], cwd=connector_dir,
+                                 stdout=stdout, stderr=subprocess.PIPE, text=True)
+        seconds = time.perf_counter() - start
+        if 0 != process.returncode:
+            print(process.stderr[-2000:], file=sys.stderr)
+        self.record(dataset, repos, stage, seconds, 0 == process.returncode)
+
+
+    def __opensearch_args(self):
+        host, port = self.opensearch.server_address[:2]
+        return ["-i", host, "-p", str(port), "-l", "admin", "-t", "admin", "--no-ssl"]
+
+
+    def __search(self):
+        client = GitHubClient("benchmark", self.github.url())
+        calls = 0
+        for term in Connector.alphabet:
+            for page in range(1, 11):
+                calls += 1
+                if not client.search_repositories(term, page, "stars")["items"]:
+                    break
+        return {"calls": calls}
+
+
+    def dataset(self, owners, repos_per_owner, broken_time_share):
+        dataset = f"{owners}x{repos_per_owner}"
+        repos = owners * repos_per_owner
+        dataset_dir = f"{self.work_dir}/{dataset}"
+        shutil.rmtree(dataset_dir, ignore_errors=True)
+        backup_dir = f"{dataset_dir}/backup"
+        infos = list(repo_infos(owners, repos_per_owner))
+        self.github.reset(infos)
+        self.opensearch.reset()
+        reader_args = ["--processes", str(self.processes)]
+
+        self.timed(dataset, repos, "search", self.__search)
+        self.timed(dataset, repos, "persist_dir", generate, backup_dir, infos, StorageType.DIRECTORY,
+                   broken_time_share)
+        self.timed(dataset, repos, "persist_sqlite", generate, f"{dataset_dir}/sqlite", infos, StorageType.SQLITE,
+                   broken_time_share)
+        self.run(dataset, repos, "backup_viewer", "backup_viewer.py", "-t", "repos", "-d", backup_dir, *reader_args)
+        self.run(dataset, repos, "pack", "utils/backup_archive.py", "pack", "-b", backup_dir,
+                 "-a", f"{dataset_dir}/archive", *reader_args)
+        self.run(dataset, repos, "unpack", "utils/backup_archive.py", "unpack", "-a", f"{dataset_dir}/archive",
+                 "-b", f"{dataset_dir}/unpacked", *reader_args)
+        self.run(dataset, repos, "fix_time_fields", "fix_time_fields.py", "-b", backup_dir, "-g", "benchmark",
+                 "--api-url", self.github.url(), *reader_args)
+        self.run(dataset, repos, "langs_uploader", "opensearch_langs_uploader.py", "-s", "data/langs.csv", "-c",
+                 *self.__opensearch_args())
+        self.run(dataset, repos, "licenses_uploader", "opensearch_licenses_uploader.py", "-b", backup_dir, "-c",
+                 *self.__opensearch_args(), *reader_args)
+        self.run(dataset, repos, "repos_uploader", "opensearch_repos_uploader.py", "-b", backup_dir,
+                 "-c", "data/langs.csv", "--create", *self.__opensearch_args(), *reader_args)
+        self.run(dataset, repos, "repos_uploader_sync", "opensearch_repos_uploader.py", "-b", backup_dir,
+                 "-c", "data/langs.csv", "--sync", *self.__opensearch_args(), *reader_args)
+        self.run(dataset, repos, "rollup", "opensearch_rollup.py", "-b", backup_dir, "-c", "data/langs.csv",
+                 *self.__opensearch_args(), *reader_args)
+        self.run(dataset, repos, "repos_uploader_rollup", "opensearch_repos_uploader.py", "-b", backup_dir,
+                 "-c", "data/langs.csv", "--sync", "--rollup", *self.__opensearch_args(), *reader_args)
+        for stage in ["report", "report_cached"]:
+            self.run(dataset, repos, stage, "opensearch_report.py", "--cache", f"{dataset_dir}/report_cache.sqlite",
+                     *self.__opensearch_args())
+
+
+    def crawl(self, repo_dirs, cloc, pipeline, engine=CountEngine.CLOC, cloc_batch=1):
+        stage = "crawl_pipelined" if pipeline else "crawl"
+        if CountEngine.BUILTIN == engine:
+            stage += "_builtin"
+        if cloc_batch > 1:
+            stage += "_batch"
+        random_source = random.Random(0)
+        infos = [repo_info("local", os.path.basename(repo_dir), random_source, repo_dir) for repo_dir in repo_dirs]
+        for info in infos:
+            info["size"] = 1
+        self.github.reset(infos)
+        crawl_dir = f"{self.work_dir}/{stage}"
+        shutil.rmtree(crawl_dir, ignore_errors=True)
+        args = ["-t", f"{crawl_dir}/tmp", "-b", f"{crawl_dir}/backup", "-c", cloc, "-g", "benchmark",
+                "--api-url", self.github.url()]
+        if pipeline:
+            args.append("--pipeline")
+        args += ["--engine", str(engine), "--engine-processes", str(self.processes), "--cloc-batch", str(cloc_batch)]
+        self.run("git", len(infos), stage, "connector.py", *args)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        prog="run_benchmark.py",
+        description="Offline throughput benchmark with synthetic backups and local API stand-ins")
+    parser.add_argument("-w", "--work-dir", type=str, help="Directory for generated data")
+    parser.add_argument("-o", "--output", type=str, default="benchmark.json", help="Results file (JSON)")
+    parser.add_argument("-d", "--datasets", type=str, nargs="+", default=["10x10", "100x10"],
+                        help="Dataset sizes as OWNERSxREPOS")
+    parser.add_argument("-c", "--cloc", type=str, default=shutil.which("cloc"),
+                        help="Cloc executable path, crawl stages are skipped without it")
+    parser.add_argument("-r", "--git-repos", type=int, default=9, help="Local git repositories for crawl stages")
+    parser.add_argument("--cloc-batch", type=int, default=8, help="Repositories per cloc run in the batched crawl stage")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="Processes decoding the backup")
+    parser.add_argument("--broken-time-share", type=float, default=0.05,
+                        help="Share of repositories with broken time fields")
+    parser.add_argument("--search-limit", type=int, default=1000000, help="Fake GitHub search requests per window")
+    parser.add_argument("--core-limit", type=int, default=1000000, help="Fake GitHub core requests per window")
+    parser.add_argument("--window", type=int, default=60, help="Fake GitHub rate limit window in seconds")
+    args = parser.parse_args()
+
+    work_dir = os.path.abspath(args.work_dir)
+    os.makedirs(work_dir, exist_ok=True)
+    github = FakeGitHub(("127.0.0.1", 0), [], 100, args.search_limit, args.core_limit, args.window)
+    opensearch = FakeOpenSearch(("127.0.0.1", 0))
+    start_server(github)
+    start_server(opensearch)
+
+    benchmark = Benchmark(work_dir, github, opensearch, args.processes)
+    for dataset in args.datasets:
+        owners, repos_per_owner = (int(value) for value in dataset.split("x"))
+        benchmark.dataset(owners, repos_per_owner, args.broken_time_share)
+    repo_dirs = create_repos(f"{work_dir}/git", args.git_repos)
+    if args.cloc is not None:
+        benchmark.crawl(repo_dirs, args.cloc, False)
+        benchmark.crawl(repo_dirs, args.cloc, True)
+        benchmark.crawl(repo_dirs, args.cloc, True, cloc_batch=args.cloc_batch)
+    else:
+        print("Cloc is not found, cloc crawl stages are skipped", file=sys.stderr)
+    # The built-in engine needs no cloc executable
+    benchmark.crawl(repo_dirs, args.cloc or "cloc", False, CountEngine.BUILTIN)
+    benchmark.crawl(repo_dirs, args.cloc or "cloc", True, CountEngine.BUILTIN)
+
+    with open(args.output, "w") as output:
+        json.dump({
+            "created_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "results": benchmark.results
+        }, output, indent=2)
+    github.shutdown()
+    opensearch.shutdown()
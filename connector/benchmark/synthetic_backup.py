@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+
+
+from argparse import ArgumentParser
+from datetime import datetime, timedelta, timezone
+import os
+import random
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backup_storage import StorageType, open_storage
+
+
+LICENSES = [
+    ("mit", "MIT License", "MIT"),
+    ("apache-2.0", "Apache License 2.0", "Apache-2.0"),
+    ("gpl-3.0", "GNU General Public License v3.0", "GPL-3.0"),
+    ("bsd-3-clause", "BSD 3-Clause \"New\" or \"Revised\" License", "BSD-3-Clause"),
+    ("other", "Other", "NOASSERTION")
+]
+LANGUAGES = ["C", "C++", "Python", "Java", "JavaScript", "Go", "Markdown", "YAML", "JSON", "make", "CMake",
+             "Dockerfile", "HTML", "CSS", "SQL", "Bourne Shell", "XML", "ANTLR Grammar", "yacc", "lex"]
+
+
+def license_doc(key, name, spdx_id):
+    return {
+        "key": key,
+        "name": name,
+        "spdx_id": spdx_id,
+        "url": f"https://api.github.com/licenses/{key}",
+        "node_id": f"MDc6TGljZW5zZT{key}"
+    }
+
+
+def __time(random_source):
+    moment = datetime(2008, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=random_source.randrange(15 * 365 * 86400))
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def repo_info(owner, name, random_source, clone_url=None):
+    # Shape of a GitHub search/repos API item as far as the connector reads it
+    stars = int(random_source.paretovariate(1.2)) - 1
+    license = random_source.choice(LICENSES + [None])
+    return {
+        "name": name,
+        "full_name": f"{owner}/{name}",
+        "owner": {"login": owner},
+        "html_url": f"https://github.com/{owner}/{name}",
+        "clone_url": clone_url or f"https://github.com/{owner}/{name}.git",
+        "size": random_source.randrange(1, 50000),
+        "forks_count": stars // random_source.randrange(2, 10),
+        "stargazers_count": stars,
+        "watchers_count": stars,
+        "pushed_at": __time(random_source),
+        "created_at": __time(random_source),
+        "updated_at": __time(random_source),
+        "license": license_doc(*license) if license is not None else None,
+        "language": random_source.choice(LANGUAGES)
+    }
+
+
+def repo_languages(random_source):
+    languages = dict()
+    for language in random_source.sample(LANGUAGES, random_source.randrange(1, 8)):
+        files = random_source.randrange(1, 200)
+        code = files * random_source.randrange(5, 400)
+        languages[language] = {
+            "files": files,
+            "blank": code // random_source.randrange(4, 12),
+            "comment": code // random_source.randrange(3, 30),
+            "code": code
+        }
+    return languages
+
+
+def backup_doc(info, languages):
+    # Same document Connector writes for an analyzed repository
+    license = info["license"]
+    return {
+        "owner": info["owner"]["login"],
+        "repo": info["name"],
+        "full_name": info["full_name"],
+        "url": info["html_url"],
+        "clone_url": info["clone_url"],
+        "size": info["size"],
+        "forks": info["forks_count"],
+        "stargazers": info["stargazers_count"],
+        "watchers": info["watchers_count"],
+        "pushed_at": info["pushed_at"],
+        "created_at": info["created_at"],
+        "updated_at": info["updated_at"],
+        "license_key": license["key"] if license else "No license",
+        "language": info["language"],
+        "languages": languages
+    }
+
+
+def repo_infos(owners, repos_per_owner, seed=0):
+    random_source = random.Random(seed)
+    for owner in range(owners):
+        for repo in range(repos_per_owner):
+            yield repo_info(f"owner{owner:05d}", f"repo{repo:04d}", random_source)
+
+
+def generate(backup_dir, infos, storage_type=StorageType.DIRECTORY, broken_time_share=0.05, seed=0):
+    random_source = random.Random(seed)
+    storage = open_storage(backup_dir, storage_type)
+    count = 0
+    for info in infos:
+        languages = repo_languages(random_source)
+        for language in languages:
+            if not storage.has_language(language):
+                storage.add_language({"name": language, "type": "GPL"})
+        if info["license"] and not storage.has_license(info["license"]["key"]):
+            storage.add_license(info["license"])
+        doc = backup_doc(info, languages)
+        # Old connector versions stored broken time fields, fix_time_fields repairs them
+        if random_source.random() < broken_time_share:
+            for field in ["pushed_at", "created_at", "updated_at"]:
+                doc[field] = None
+        storage.add_repo(doc)
+        count += 1
+    storage.close()
+    return count
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        prog="synthetic_backup.py",
+        description="Generate synthetic backup")
+    parser.add_argument("-d", "--dir", type=str, help="Backup directory")
+    parser.add_argument("-o", "--owners", type=int, default=100, help="Number of owners")
+    parser.add_argument("-r", "--repos", type=int, default=10, help="Repositories per owner")
+    parser.add_argument("--storage", type=StorageType, choices=list(StorageType), default=StorageType.DIRECTORY,
+                        help="Backup storage backend")
+    parser.add_argument("--broken-time-share", type=float, default=0.05,
+                        help="Share of repositories with broken time fields")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    count = generate(args.dir, repo_infos(args.owners, args.repos, args.seed), args.storage,
+                     args.broken_time_share, args.seed)
+    print(f"Generated repos: {count}")
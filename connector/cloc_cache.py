@@ -0,0 +1,62 @@
+import json
+import os
+import subprocess
+import time
+import metrics
+from lru_store import LruStore
+
+
+def cloc_version(cloc_path):
+    try:
+        return subprocess.run([cloc_path, "--version"], capture_output=True, text=True, timeout=30).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def head_sha(clone_url, timeout=30):
+    # ls-remote asks the server for its refs only, it is much cheaper than any clone and costs no API quota
+    try:
+        process = subprocess.run(["git", "ls-remote", clone_url, "HEAD"], capture_output=True, text=True,
+                                 timeout=timeout, env={**os.environ, "GIT_TERMINAL_PROMPT": "0"})
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if 0 != process.returncode or not process.stdout:
+        return None
+    return process.stdout.split()[0]
+
+
+class ClocCache:
+    schema = [
+        "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, languages TEXT NOT NULL, "
+        "size INTEGER NOT NULL, last_used REAL NOT NULL) WITHOUT ROWID",
+        "CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)"
+    ]
+
+
+    def __init__(self, path, max_bytes=512 * 1024 * 1024, namespace="", batch_size=100):
+        # Results of another cloc version are not reused
+        self.namespace = namespace
+        self.store = LruStore(path, "results", "key", ClocCache.schema, max_bytes, batch_size)
+
+
+    def __key(self, sha):
+        return f"{self.namespace}:{sha}"
+
+
+    def get(self, sha):
+        row = self.store.get("languages", self.__key(sha))
+        if row is None:
+            metrics.cloc_cache_requests.inc(result="miss")
+            return None
+        metrics.cloc_cache_requests.inc(result="hit")
+        return json.loads(row[0])
+
+
+    def put(self, sha, languages):
+        key = self.__key(sha)
+        value = json.dumps(languages)
+        self.store.put(key, len(value), (key, value, len(value), time.time()))
+
+
+    def close(self):
+        self.store.close()
@@ -0,0 +1,144 @@
+import os
+from datetime import datetime
+from enum import Enum
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class ExportFormat(Enum):
+    PARQUET = "parquet"
+    ARROW = "arrow"
+
+
+    def __str__(self):
+        return self.value
+
+
+def __dictionary():
+    return pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+
+
+def __timestamp(value):
+    if type(value) != str:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def __repos_schema():
+    return pyarrow.schema([
+        ("owner", __dictionary()),
+        ("repo", pyarrow.string()),
+        ("full_name", pyarrow.string()),
+        ("url", pyarrow.string()),
+        ("clone_url", pyarrow.string()),
+        ("size", pyarrow.int64()),
+        ("forks", pyarrow.int32()),
+        ("stargazers", pyarrow.int32()),
+        ("watchers", pyarrow.int32()),
+        ("pushed_at", pyarrow.timestamp("s", tz="UTC")),
+        ("created_at", pyarrow.timestamp("s", tz="UTC")),
+        ("updated_at", pyarrow.timestamp("s", tz="UTC")),
+        ("license_key", __dictionary()),
+        ("language", __dictionary())
+    ])
+
+
+def __languages_schema():
+    return pyarrow.schema([
+        ("full_name", __dictionary()),
+        ("language", __dictionary()),
+        ("files", pyarrow.int32()),
+        ("blank", pyarrow.int64()),
+        ("comment", pyarrow.int64()),
+        ("code", pyarrow.int64())
+    ])
+
+
+class TableWriter:
+    def __init__(self, path, schema, export_format):
+        self.schema = schema
+        self.columns = {name: [] for name in schema.names}
+        self.rows = 0
+        if ExportFormat.PARQUET == export_format:
+            self.writer = pyarrow.parquet.ParquetWriter(path, schema, compression="zstd", use_dictionary=True)
+        else:
+            # The stream format allows each batch to carry its own dictionaries
+            options = pyarrow.ipc.IpcWriteOptions(compression="zstd")
+            self.writer = pyarrow.ipc.new_stream(path, schema, options=options)
+
+
+    def append(self, row):
+        for name in self.schema.names:
+            self.columns[name].append(row[name])
+        self.rows += 1
+
+
+    def flush(self):
+        if 0 == self.rows:
+            return
+        batch = pyarrow.RecordBatch.from_arrays(
+            [pyarrow.array(self.columns[field.name], type=field.type) for field in self.schema],
+            schema=self.schema)
+        # Every flushed batch becomes one parquet row group
+        self.writer.write_batch(batch)
+        self.columns = {name: [] for name in self.schema.names}
+        self.rows = 0
+
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def export_backup(reader, out_dir, export_format=ExportFormat.PARQUET, row_group_size=65536):
+    if pyarrow is None:
+        raise RuntimeError("Columnar export requires pyarrow")
+    os.makedirs(out_dir, exist_ok=True)
+    suffix = "parquet" if ExportFormat.PARQUET == export_format else "arrows"
+    repos = TableWriter(f"{out_dir}/repos.{suffix}", __repos_schema(), export_format)
+    languages = TableWriter(f"{out_dir}/repo_languages.{suffix}", __languages_schema(), export_format)
+
+    repo_count = 0
+    for doc in reader.repos():
+        repos.append({
+            "owner": doc["owner"],
+            "repo": doc["repo"],
+            "full_name": doc["full_name"],
+            "url": doc["url"],
+            "clone_url": doc["clone_url"],
+            "size": doc["size"],
+            "forks": doc["forks"],
+            "stargazers": doc["stargazers"],
+            "watchers": doc["watchers"],
+            "pushed_at": __timestamp(doc["pushed_at"]),
+            "created_at": __timestamp(doc["created_at"]),
+            "updated_at": __timestamp(doc["updated_at"]),
+            "license_key": doc["license_key"],
+            "language": doc["language"]
+        })
+        for language, info in doc["languages"].items():
+            languages.append({
+                "full_name": doc["full_name"],
+                "language": language,
+                "files": info["files"],
+                # Older backups store the cloc blank count under "blank " with a trailing space
+                "blank": info["blank"] if "blank" in info else info["blank "],
+                "comment": info["comment"],
+                "code": info["code"]
+            })
+            if languages.rows >= row_group_size:
+                languages.flush()
+        if repos.rows >= row_group_size:
+            repos.flush()
+        repo_count += 1
+
+    repos.close()
+    languages.close()
+    return repo_count
@@ -1,16 +1,30 @@
 #!/usr/bin/python3
 
 
-import requests
 import os
+import hashlib
+import itertools
 import json
-import shutil
+import random
 import string
-import time
 import sys
-import base64
+import subprocess
+import tarfile
+import time
+import metrics
 from enum import Enum
-from argparse import ArgumentParser
+from queue import Queue
+from threading import Thread, Lock
+from argparse import ArgumentParser, BooleanOptionalAction
+from github_client import GitHubClient, add_token_arguments, read_tokens
+from crawl_planner import AlphabetPlanner, CrawlPlanner, load_counts
+from crawl_journal import CrawlJournal
+from backup_storage import StorageType, SqliteStorage, normalize_languages, open_storage
+from cloc_cache import ClocCache, cloc_version, head_sha
+from line_counter import ENGINE_VERSION, CountEngine, LineCounter, compare
+from workspace import CommandTimeout, QuotaExceeded, Workspace, add_workspace_arguments, workspace_from_args
+from http_cache import add_http_cache_arguments, http_cache_from_args
+from metrics import add_metrics_arguments, metrics_from_args
 
 
 class Connector:
@@ -18,45 +32,47 @@ class Connector:
     alphabet = string.ascii_letters + string.digits
 
 
-    def __init__(self, tmp_dir, backup_dir, cloc_path, git_token, cloc_timeout=60) -> None:
+    class CloneStrategy(Enum):
+        FULL = "full"
+        SHALLOW = "shallow"
+        BLOBLESS = "blobless"
+        TARBALL = "tarball"
+
+
+        def __str__(self):
+            return self.value
+
+
+    def __init__(self, tmp_dir, backup_dir, cloc_path, git_token, cloc_timeout=60,
+                 clone_strategy=CloneStrategy.FULL, max_size=None, planner=None,
+                 journal=None, storage_type=StorageType.DIRECTORY, url_base=None,
+                 cloc_cache=None, http_cache=None, line_counter=None, cross_check=0.0, workspace=None) -> None:
         self.tmp_dir = tmp_dir
+        self.workspace = workspace if workspace is not None or tmp_dir is None else Workspace(tmp_dir)
 
         self.backup_dir = backup_dir
-        self.repos_dir = f"{backup_dir}/repos/"
-        if not os.path.exists(self.repos_dir):
-            os.makedirs(self.repos_dir)
-        self.langs_dir = f"{backup_dir}/langs/"
-        if not os.path.exists(self.langs_dir):
-            os.makedirs(self.langs_dir)
-        self.licenses_dir = f"{backup_dir}/licenses/"
-        if not os.path.exists(self.licenses_dir):
-            os.makedirs(self.licenses_dir)
+        self.storage = open_storage(backup_dir, storage_type)
+
+        self.clone_strategy = clone_strategy
+        # GitHub reports repository size in kilobytes
+        self.max_size = max_size
 
         self.cloc_path = cloc_path
         self.cloc_timeout = cloc_timeout
+        self.cloc_cache = cloc_cache
+        # Built-in engine used instead of cloc if set, a share of repositories is also counted by cloc to compare
+        self.line_counter = line_counter
+        self.cross_check = cross_check
 
-        self.headers = {
-            "accept" : "application/vnd.github+json",
-            "Authorization" : f"Bearer {git_token}",
-            "X-GitHub-Api-Version" : "2022-11-28"
-        }
-
-        self.counter = 0
+        self.client = GitHubClient(git_token, url_base or Connector.url_base, cache=http_cache)
 
+        self.journal = journal
+        self.unfinished = []
+        self.unfinished_lock = Lock()
+        self.planner = planner if planner is not None else AlphabetPlanner(Connector.alphabet, journal=journal)
 
-    def __get_repo_info(self, owner, repo):
-        # doc: https://docs.github.com/en/rest/repos/repos?apiVersion=2022-11-28#get-a-repository
-        url = f"{Connector.url_base}/repos/{owner}/{repo}"
-        response = requests.get(url, headers=self.headers)
-        while True:
-            response = requests.get(url, headers=self.headers)
-            if 200 == response.status_code:
-                break
-            elif 403 == response.status_code:
-                wait_time = int(response.headers["X-Ratelimit-Reset"]) - int(time.time())
-                print(f"WAITING {wait_time} s", file=sys.stderr)
-                time.sleep(wait_time)
-        return response.json()
+        self.counter = 0
+        self.counter_lock = Lock()
 
 
     class SortType(Enum):
@@ -72,102 +88,276 @@ class Connector:
 
 
     def __search_repos(self, query, page, sort=SortType.STARS, order=None):
-        # doc: https://docs.github.com/en/rest/search/search?apiVersion=2022-11-28#search-repositories
-        url = f"{Connector.url_base}/search/repositories"
-        params = {
-            "q": query,
-            "sort": sort.value,
-            "per_page": 100,
-            "page": page
-        }
-        if order is not None:
-            params["order"] = order.value
-        while True:
-            response = requests.get(url, headers=self.headers, params=params)
-            if 200 == response.status_code:
-                break
-            elif 403 == response.status_code:
-                wait_time = int(response.headers["X-Ratelimit-Reset"]) - int(time.time())
-                print(f"WAITING {wait_time} s", file=sys.stderr)
-                time.sleep(wait_time)
-        return response.json()
-
-
-    def __analyze_repo_content(self, clone_url):
-        if os.path.exists(self.tmp_dir):
-            shutil.rmtree(self.tmp_dir)
-        repo_dir = f"{self.tmp_dir}/repo"
-        os.makedirs(repo_dir)
-        os.system(f"git clone {clone_url} {repo_dir}")
-        cloc_json = f"{self.tmp_dir}/cloc.json"
-        os.system(f"{self.cloc_path} {self.tmp_dir} --timeout {self.cloc_timeout} --json > {cloc_json}")
-        with open(cloc_json, 'r') as jsonFile:
-            exclude = ["header", "SUM"]
-            result = dict()
+        return self.client.search_repositories(query, page, sort.value, order.value if order is not None else None)
+
+
+    def __download_tarball(self, info, work_dir):
+        # doc: https://docs.github.com/en/rest/repos/contents?apiVersion=2022-11-28#download-a-repository-archive-tar
+        url = f"/repos/{info['owner']['login']}/{info['name']}/tarball"
+        archive = f"{work_dir}/repo.tar.gz"
+        with self.client.get(url, stream=True) as response:
+            if 200 != response.status_code:
+                return False
+            with open(archive, 'wb') as archiveFile:
+                for position, chunk in enumerate(response.iter_content(chunk_size=1 << 20)):
+                    archiveFile.write(chunk)
+                    if 0 == position % 16:
+                        self.workspace.check(work_dir)
+        try:
+            with tarfile.open(archive, 'r:gz') as tar:
+                # Quotas are checked against the declared member sizes before anything is extracted
+                members = tar.getmembers()
+                self.workspace.check(work_dir, sum(member.size for member in members), len(members))
+                tar.extractall(f"{work_dir}/repo", filter="data")
+        except (tarfile.TarError, OSError):
+            return False
+        finally:
+            os.remove(archive)
+        self.workspace.check(work_dir)
+        return True
+
+
+    def __fetch_repo(self, info, work_dir):
+        if Connector.CloneStrategy.TARBALL == self.clone_strategy:
+            return self.__download_tarball(info, work_dir)
+        command = ["git", "clone", "--quiet"]
+        if Connector.CloneStrategy.SHALLOW == self.clone_strategy:
+            command += ["--depth", "1", "--single-branch"]
+        elif Connector.CloneStrategy.BLOBLESS == self.clone_strategy:
+            command += ["--filter=blob:none", "--single-branch"]
+        command += [info["clone_url"], f"{work_dir}/repo"]
+        return self.workspace.run(command, work_dir)
+
+
+    def __clone_repo(self, info, work_dir):
+        start = time.perf_counter()
+        strategy = str(self.clone_strategy)
+        try:
+            cloned = self.__fetch_repo(info, work_dir)
+        except QuotaExceeded as e:
+            metrics.clone_latency.observe(time.perf_counter() - start, strategy=strategy,
+                                          result="timeout" if isinstance(e, CommandTimeout) else "quota")
+            raise
+        metrics.clone_latency.observe(time.perf_counter() - start, strategy=strategy,
+                                      result="ok" if cloned else "failed")
+        if cloned:
+            # The workspace has just measured the checkout for its quotas
+            metrics.cloned_bytes.inc(self.workspace.measured(work_dir)[0], strategy=strategy)
+        return cloned
+
+
+    def __skip_reason(self, info):
+        if self.max_size is not None and info["size"] > self.max_size:
+            return f"size {info['size']} KB exceeds limit {self.max_size} KB"
+        return None
+
+
+    def __add_skipped(self, info, reason):
+        self.storage.add_skipped({
+            "owner": info["owner"]["login"],
+            "repo": info["name"],
+            "full_name": info["full_name"],
+            "size": info["size"],
+            "reason": reason
+        })
+        metrics.repos_processed.inc(result="skipped")
+        print(f"Skipped {info['full_name']}: {reason}", file=sys.stderr)
+
+
+    def __count_lines(self, work_dir):
+        start = time.perf_counter()
+        if self.line_counter is None:
+            result = self.__run_cloc(work_dir)
+        else:
+            result = self.line_counter.count(f"{work_dir}/repo")
+        metrics.cloc_latency.observe(time.perf_counter() - start, result="ok" if result else "empty")
+        if self.line_counter is not None and random.random() < self.cross_check:
+            self.__cross_check(work_dir, result)
+        return result
+
+
+    def __count_batch(self, work_dirs, timeout):
+        # One cloc process over several checkouts pays the interpreter startup once
+        start = time.perf_counter()
+        roots = [f"{work_dir}/repo" for work_dir in work_dirs]
+        try:
+            process = subprocess.run([self.cloc_path, "--by-file", "--json", "--skip-uniqueness",
+                                      "--timeout", str(self.cloc_timeout), *roots],
+                                     capture_output=True, text=True, timeout=timeout)
+            if 0 != process.returncode:
+                raise ValueError(f"cloc exited with {process.returncode}")
+            files = json.loads(process.stdout) if process.stdout.strip() else dict()
+        except (OSError, ValueError, subprocess.TimeoutExpired) as e:
+            metrics.cloc_latency.observe(time.perf_counter() - start, result="batch_failed")
+            print(f"Cloc batch of {len(work_dirs)} repositories failed ({e}), counting one by one", file=sys.stderr)
+            return [self.__count_lines(work_dir) for work_dir in work_dirs]
+        metrics.cloc_latency.observe(time.perf_counter() - start, result="batch")
+        return [Connector.__split_batch(files, root) for root in roots]
+
+
+    @staticmethod
+    def __split_batch(files, root):
+        # Uniqueness is checked per repository here, cloc would drop files duplicated across the batch
+        prefix = f"{root}/"
+        result = dict()
+        seen = set()
+        for path, value in files.items():
+            if not path.startswith(prefix) or "language" not in value:
+                continue
             try:
-                languages = json.load(jsonFile)
-            except Exception:
-                return result
-            for language in languages:
-                if language in exclude:
-                    continue
-                value = languages[language]
-                result[language] = {
-                    "files": value["nFiles"],
-                    "blank ": value["blank"],
-                    "comment": value["comment"],
-                    "code": value["code"],
-                }
+                with open(path, "rb") as sourceFile:
+                    digest = hashlib.md5(sourceFile.read()).digest()
+            except OSError:
+                digest = path
+            if digest in seen:
+                continue
+            seen.add(digest)
+            language = result.setdefault(value["language"], {"files": 0, "blank": 0, "comment": 0, "code": 0})
+            language["files"] += 1
+            for field in ["blank", "comment", "code"]:
+                language[field] += value[field]
         return result
 
 
-    def __repo_already_added(self, owner, repo):
-        return os.path.exists(f"{self.repos_dir}/{owner}/{repo}.json")
+    def __cross_check(self, work_dir, result):
+        differences = compare(result, self.__run_cloc(work_dir))
+        metrics.line_counter_checks.inc(result="mismatch" if differences else "match")
+        for language, field, ours, theirs in differences:
+            print(f"Line counter mismatch in {work_dir}: {language} {field}: built-in {ours}, cloc {theirs}",
+                  file=sys.stderr)
+
+
+    def __run_cloc(self, work_dir):
+        # An argument list, repository paths never pass through a shell
+        try:
+            process = subprocess.run([self.cloc_path, f"{work_dir}/repo", "--timeout", str(self.cloc_timeout),
+                                      "--json"], capture_output=True, text=True, timeout=self.cloc_timeout)
+            if 0 != process.returncode:
+                raise ValueError(f"cloc exited with {process.returncode}: {process.stderr.strip()}")
+            languages = json.loads(process.stdout) if process.stdout.strip() else dict()
+        except (OSError, ValueError, subprocess.TimeoutExpired) as e:
+            print(f"Cloc failed for {work_dir}: {e}", file=sys.stderr)
+            return dict()
+        exclude = ["header", "SUM"]
+        result = dict()
+        for language in languages:
+            if language in exclude:
+                continue
+            value = languages[language]
+            result[language] = {
+                "files": value["nFiles"],
+                "blank": value["blank"],
+                "comment": value["comment"],
+                "code": value["code"],
+            }
+        return result
 
 
-    def __license_already_added(self, key):
-        return os.path.exists(f"{self.licenses_dir}/{key}.json")
+    def __cached_languages(self, info):
+        # The tree at a given commit always has the same statistics, forks and re-crawls share them
+        if self.cloc_cache is None:
+            return None, None
+        sha = head_sha(info["clone_url"])
+        if sha is None:
+            return None, None
+        languages = self.cloc_cache.get(sha)
+        return sha, normalize_languages(languages) if languages is not None else None
 
 
-    def __language_already_added(self, name):
-        return os.path.exists(f"{self.langs_dir}/{str(base64.urlsafe_b64encode(name.encode('ascii')))[2:-1]}.json")
+    def __cache_languages(self, sha, languages):
+        # Empty results may come from a cloc timeout and are not worth keeping
+        if sha is not None and languages:
+            self.cloc_cache.put(sha, languages)
 
 
-    def __add_repo(self, info):
-        owner = info["owner"]["login"]
-        repo = info["name"]
-        owner_dir = f"{self.repos_dir}/{owner}"
-        if not os.path.exists(owner_dir):
-            os.makedirs(owner_dir)
+    def __analyze_repo_content(self, info):
+        sha, languages = self.__cached_languages(info)
+        if languages is not None:
+            return languages
+        work_dir = self.workspace.acquire(info["size"])
+        try:
+            if not self.__clone_repo(info, work_dir):
+                return None
+            languages = self.__count_lines(work_dir)
+        finally:
+            self.workspace.release(work_dir)
+        self.__cache_languages(sha, languages)
+        return languages
 
-        if self.__repo_already_added(owner, repo):
+
+    def __repo_already_added(self, owner, repo):
+        return self.storage.has_repo(owner, repo)
+
+
+    def __finish(self, full_name=None):
+        if self.journal is None:
             return
+        with self.unfinished_lock:
+            if full_name is not None:
+                self.unfinished.append(full_name)
+            # Repositories are journaled as finished only once the storage has made them durable
+            if self.storage.durable():
+                for name in self.unfinished:
+                    self.journal.finish(name)
+                self.unfinished.clear()
 
-        clone_url = info["clone_url"]
-        languages = self.__analyze_repo_content(clone_url)
+
+    def __add_repo(self, info):
+        if self.__repo_already_added(info["owner"]["login"], info["name"]):
+            return False
+        if self.journal is not None:
+            self.journal.begin(info)
+        reason = self.__skip_reason(info)
+        if reason is None:
+            try:
+                languages = self.__analyze_repo_content(info)
+            except QuotaExceeded as e:
+                self.__add_skipped(info, str(e))
+            else:
+                if languages is not None:
+                    self.__persist_repo(info, languages)
+                else:
+                    self.__add_skipped(info, f"failed to fetch with {self.clone_strategy} strategy")
+        else:
+            self.__add_skipped(info, reason)
+        self.__finish(info["full_name"])
+        return True
+
+
+    def __persist_repo(self, info, languages):
         for lang in languages.keys():
-            if self.__language_already_added(lang):
+            if self.storage.has_language(lang):
                 continue
-            langJson = json.dumps({
+            self.storage.add_language({
                 "name": lang,
                 "type": "GPL"
             })
-            with open(f"{self.langs_dir}/"
-                      f"{str(base64.urlsafe_b64encode(lang.encode('ascii')))[2:-1]}.json", 'w') as jsonFile:
-                jsonFile.write(langJson)
 
+        self.__add_license(info)
+        self.storage.add_repo(Connector.__repo_doc(info, languages))
+
+        metrics.repos_processed.inc(result="analyzed")
+        with self.counter_lock:
+            self.counter += 1
+            if 0 == self.counter % 10:
+                print(f"Analyzed {self.counter} repositories")
+
+
+    def __add_license(self, info):
+        license = info["license"]
+        if license and not self.storage.has_license(license["key"]):
+            self.storage.add_license(license)
+
+
+    @staticmethod
+    def __repo_doc(info, languages):
         license = info["license"]
-        if license and not self.__license_already_added(license["key"]):
-            licenseJson = json.dumps(license)
-            with open(f"{self.licenses_dir}/{license['key']}.json", 'w') as jsonFile:
-                jsonFile.write(licenseJson)
-
-        res = json.dumps({
-            "owner": owner,
-            "repo": repo,
+        return {
+            "owner": info["owner"]["login"],
+            "repo": info["name"],
             "full_name": info["full_name"],
             "url": info["html_url"],
-            "clone_url": clone_url,
+            "clone_url": info["clone_url"],
             "size": info["size"],
             "forks": info["forks_count"],
             "stargazers": info["stargazers_count"],
@@ -178,23 +368,244 @@ class Connector:
             "license_key": license["key"] if license else "No license",
             "language": info["language"],
             "languages": languages
-        })
+        }
 
-        with open(f"{owner_dir}/{repo}.json", 'w') as jsonFile:
-            jsonFile.write(res)
 
-        self.counter += 1
-        if 0 == self.counter % 10:
-            print(f"Analyzed {self.counter} repositories")
+    def __resume(self):
+        if self.journal is None:
+            return []
+        pending = self.journal.pending()
+        if pending:
+            print(f"Resuming {len(pending)} repositories interrupted by the previous run")
+        return pending
+
+
+    def __close(self):
+        self.storage.commit()
+        self.__finish()
+        self.planner.print_stats()
+
+
+    def refresh_metadata(self, batch_size=100):
+        # Language statistics are kept, everything else is re-read with batched GraphQL queries.
+        # Records are written back while the scan is open. SQLite does not define what an open scan returns once its
+        # connection changes the table, so the scan reads a committed snapshot through a separate connection,
+        # like validate_backup.py does for its repairs
+        self.storage.commit()
+        catalog = SqliteStorage(self.backup_dir) if isinstance(self.storage, SqliteStorage) else self.storage
+        refreshed = 0
+        unfound = []
+        try:
+            docs = catalog.repos()
+            while True:
+                batch = list(itertools.islice(docs, batch_size))
+                if not batch:
+                    break
+                results = self.client.get_repositories((doc["owner"], doc["repo"]) for doc in batch)
+                for doc in batch:
+                    status, info = results[(doc["owner"], doc["repo"])]
+                    if info is None:
+                        unfound.append((doc["owner"], doc["repo"], status))
+                        continue
+                    self.__add_license(info)
+                    updated = Connector.__repo_doc(info, doc["languages"])
+                    # Renamed repositories keep their backup record
+                    updated["owner"] = doc["owner"]
+                    updated["repo"] = doc["repo"]
+                    self.storage.add_repo(updated)
+                    refreshed += 1
+                print(f"Refreshed {refreshed} repositories")
+        finally:
+            if catalog is not self.storage:
+                catalog.close()
+        self.storage.commit()
+        print(f"Unfound repos: {unfound}")
 
 
     def analyze(self):
-        for page in range(1, 11):
-            for ch in Connector.alphabet:
-                print(f"ANALYZING PAGE {page}, LETTER {ch}")
-                repos_info = self.__search_repos(ch, page)
+        for repo_info in self.__resume():
+            self.__add_repo(repo_info)
+        for unit in self.planner.plan():
+            print(f"ANALYZING PAGE {unit.page}, QUERY {unit.query}")
+            repos_info = None
+            new_count = 0
+            try:
+                repos_info = self.__search_repos(unit.query, unit.page)
                 for repo_info in repos_info["items"]:
-                    self.__add_repo(repo_info)
+                    if self.__add_repo(repo_info):
+                        new_count += 1
+                if self.journal is not None:
+                    self.journal.complete(unit, repos_info)
+            finally:
+                self.planner.report(unit, repos_info, new_count)
+        self.__close()
+
+
+    __STOP = object()
+
+
+    @staticmethod
+    def __start_stage(name, workers, input_queue, handler):
+        def work(worker):
+            while True:
+                item = input_queue.get()
+                if item is Connector.__STOP:
+                    return
+                try:
+                    handler(worker, item)
+                except Exception as e:
+                    print(f"{name} stage failed: {e}", file=sys.stderr)
+
+        threads = [Thread(target=work, args=(worker,), name=f"{name}-{worker}", daemon=True)
+                   for worker in range(workers)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+
+    @staticmethod
+    def __stop_stage(threads, input_queue):
+        for _ in threads:
+            input_queue.put(Connector.__STOP)
+        for thread in threads:
+            thread.join()
+
+
+    def analyze_pipelined(self, search_workers=1, clone_workers=4, cloc_workers=None,
+                          persist_workers=1, queue_size=16, cloc_batch=1, cloc_batch_timeout=600):
+        if cloc_workers is None:
+            cloc_workers = os.cpu_count() or 1
+        search_queue = Queue(maxsize=queue_size)
+        clone_queue = Queue(maxsize=queue_size)
+        cloc_queue = Queue(maxsize=queue_size)
+        persist_queue = Queue(maxsize=queue_size)
+
+        in_flight = set()
+        in_flight_lock = Lock()
+        # The built-in engine has no startup cost to spread, batches only group cloc runs
+        batching = cloc_batch > 1 and self.line_counter is None
+        batch = []
+        batch_lock = Lock()
+
+        def release(info, done=False):
+            with in_flight_lock:
+                in_flight.discard(info["full_name"])
+            if done:
+                self.__finish(info["full_name"])
+
+        def enqueue(info, journaled=False):
+            with in_flight_lock:
+                if info["full_name"] in in_flight:
+                    return False
+                if self.__repo_already_added(info["owner"]["login"], info["name"]):
+                    return False
+                in_flight.add(info["full_name"])
+            if self.journal is not None and not journaled:
+                self.journal.begin(info)
+            clone_queue.put(info)
+            return True
+
+        def search(worker, unit):
+            print(f"ANALYZING PAGE {unit.page}, QUERY {unit.query}")
+            repos_info = None
+            new_count = 0
+            try:
+                repos_info = self.__search_repos(unit.query, unit.page)
+                for info in repos_info["items"]:
+                    if enqueue(info):
+                        new_count += 1
+                if self.journal is not None:
+                    self.journal.complete(unit, repos_info)
+            finally:
+                self.planner.report(unit, repos_info, new_count)
+
+        def clone(worker, info):
+            reason = self.__skip_reason(info)
+            if reason is not None:
+                self.__add_skipped(info, reason)
+                release(info, done=True)
+                return
+            sha, languages = self.__cached_languages(info)
+            if languages is not None:
+                persist_queue.put((info, languages))
+                return
+            work_dir = self.workspace.acquire(info["size"])
+            try:
+                cloned = self.__clone_repo(info, work_dir)
+            except QuotaExceeded as e:
+                self.workspace.release(work_dir)
+                self.__add_skipped(info, str(e))
+                release(info, done=True)
+                return
+            except Exception:
+                self.workspace.release(work_dir)
+                release(info)
+                raise
+            if not cloned:
+                self.workspace.release(work_dir)
+                self.__add_skipped(info, f"failed to fetch with {self.clone_strategy} strategy")
+                release(info, done=True)
+                return
+            cloc_queue.put((info, work_dir, sha))
+
+        def count_jobs(jobs):
+            try:
+                if 1 == len(jobs):
+                    results = [self.__count_lines(jobs[0][1])]
+                else:
+                    results = self.__count_batch([work_dir for _, work_dir, _ in jobs], cloc_batch_timeout)
+                for (_, _, sha), languages in zip(jobs, results):
+                    self.__cache_languages(sha, languages)
+            except Exception:
+                for info, _, _ in jobs:
+                    release(info)
+                raise
+            finally:
+                for _, work_dir, _ in jobs:
+                    self.workspace.release(work_dir)
+            for (info, _, _), languages in zip(jobs, results):
+                persist_queue.put((info, languages))
+
+        def count(worker, job):
+            if not batching:
+                count_jobs([job])
+                return
+            with batch_lock:
+                batch.append(job)
+                if len(batch) < cloc_batch:
+                    return
+                jobs = batch[:]
+                batch.clear()
+            count_jobs(jobs)
+
+        def persist(worker, job):
+            info, languages = job
+            try:
+                self.__persist_repo(info, languages)
+            except Exception:
+                release(info)
+                raise
+            release(info, done=True)
+
+        search_threads = Connector.__start_stage("search", search_workers, search_queue, search)
+        clone_threads = Connector.__start_stage("clone", clone_workers, clone_queue, clone)
+        cloc_threads = Connector.__start_stage("cloc", cloc_workers, cloc_queue, count)
+        persist_threads = Connector.__start_stage("persist", persist_workers, persist_queue, persist)
+
+        for info in self.__resume():
+            enqueue(info, journaled=True)
+        for unit in self.planner.plan():
+            search_queue.put(unit)
+        Connector.__stop_stage(search_threads, search_queue)
+        Connector.__stop_stage(clone_threads, clone_queue)
+        Connector.__stop_stage(cloc_threads, cloc_queue)
+        if batch:
+            try:
+                count_jobs(batch)
+            except Exception as e:
+                print(f"cloc stage failed: {e}", file=sys.stderr)
+        Connector.__stop_stage(persist_threads, persist_queue)
+        self.__close()
 
 
 if __name__ == "__main__":
@@ -204,9 +615,83 @@ if __name__ == "__main__":
     parser.add_argument("-t", "--tmp", type=str, help="Temporary directory")
     parser.add_argument("-b", "--backup", type=str, help="Backup directory")
     parser.add_argument("-c", "--cloc", type=str, help="Cloc executable path")
-    parser.add_argument("-g", "--token", type=str, help="GitHub token")
+    add_token_arguments(parser)
+    parser.add_argument("--api-url", type=str, default=Connector.url_base, help="GitHub API base URL")
+    add_http_cache_arguments(parser)
     parser.add_argument("-o", "--timeout", type=int, default=60, help="Cloc analyzer timeout")
+    parser.add_argument("--engine", type=CountEngine, choices=list(CountEngine), default=CountEngine.CLOC,
+                        help="Line counting engine")
+    parser.add_argument("--engine-processes", type=int, default=os.cpu_count() or 1,
+                        help="Processes of the built-in line counting engine")
+    parser.add_argument("--cross-check", type=float, default=0.0,
+                        help="Share of repositories also counted by cloc to compare with the built-in engine")
+    parser.add_argument("-s", "--clone-strategy", type=Connector.CloneStrategy, choices=list(Connector.CloneStrategy),
+                        default=Connector.CloneStrategy.FULL, help="How to fetch repository content")
+    parser.add_argument("-m", "--max-size", type=int, default=None,
+                        help="Skip repositories larger than this size in KB")
+    add_workspace_arguments(parser)
+    parser.add_argument("-p", "--pages", type=str, default=None,
+                        help="CSV with result counts per query, enables sharded search planning")
+    parser.add_argument("--min-yield", type=float, default=0.0,
+                        help="Abandon a query when it yields fewer new repositories per search call")
+    parser.add_argument("-j", "--journal", type=str, default=None,
+                        help="Crawl journal file to resume an interrupted crawl from")
+    parser.add_argument("--storage", type=StorageType, choices=list(StorageType), default=StorageType.DIRECTORY,
+                        help="Backup storage backend")
+    parser.add_argument("--cloc-cache", type=str, default=None,
+                        help="Cache file with line counts by commit SHA, repositories found there are not cloned")
+    parser.add_argument("--cloc-cache-size", type=int, default=512, help="Cloc cache size limit in MB")
+    parser.add_argument("--refresh-metadata", action=BooleanOptionalAction, default=False,
+                        help="Refresh metadata of repositories in backup with batched GraphQL queries instead of crawling")
+    parser.add_argument("--batch-size", type=int, default=100, help="Repositories per GraphQL query")
+    parser.add_argument("--pipeline", action=BooleanOptionalAction, default=False,
+                        help="Run search, clone, cloc and persist stages concurrently")
+    parser.add_argument("--search-workers", type=int, default=1, help="Search stage workers (pipeline)")
+    parser.add_argument("--clone-workers", type=int, default=4, help="Clone stage workers (pipeline)")
+    parser.add_argument("--cloc-workers", type=int, default=os.cpu_count() or 1, help="Cloc stage workers (pipeline)")
+    parser.add_argument("--cloc-batch", type=int, default=1,
+                        help="Repositories counted by one cloc run (pipeline)")
+    parser.add_argument("--cloc-batch-timeout", type=int, default=600,
+                        help="Cloc batch timeout in seconds, repositories of a failed batch are counted one by one")
+    parser.add_argument("--persist-workers", type=int, default=1, help="Persist stage workers (pipeline)")
+    parser.add_argument("--queue-size", type=int, default=16, help="Capacity of queues between stages (pipeline)")
+    add_metrics_arguments(parser)
     args = parser.parse_args()
-
-    connector = Connector(args.tmp, args.backup, args.cloc, args.token, args.timeout)
-    connector.analyze()
+    exporter = metrics_from_args(args)
+
+    journal = CrawlJournal(args.journal) if args.journal is not None else None
+    planner = None
+    if args.pages is not None:
+        planner = CrawlPlanner(load_counts(args.pages), args.min_yield, journal=journal)
+
+    line_counter = LineCounter(args.engine_processes) if CountEngine.BUILTIN == args.engine else None
+    cloc_cache = None
+    if args.cloc_cache is not None:
+        namespace = cloc_version(args.cloc) if line_counter is None else f"builtin-{ENGINE_VERSION}"
+        cloc_cache = ClocCache(args.cloc_cache, args.cloc_cache_size * 1024 * 1024, namespace)
+    http_cache = http_cache_from_args(args)
+    workspace = workspace_from_args(args.tmp, args) if args.tmp is not None else None
+
+    connector = Connector(args.tmp, args.backup, args.cloc, read_tokens(args), args.timeout,
+                          args.clone_strategy, args.max_size, planner, journal,
+                          args.storage, args.api_url, cloc_cache, http_cache, line_counter, args.cross_check,
+                          workspace)
+    if args.refresh_metadata:
+        connector.refresh_metadata(args.batch_size)
+    elif args.pipeline:
+        connector.analyze_pipelined(args.search_workers, args.clone_workers, args.cloc_workers,
+                                    args.persist_workers, args.queue_size, args.cloc_batch, args.cloc_batch_timeout)
+    else:
+        connector.analyze()
+    connector.storage.close()
+    if journal is not None:
+        journal.close()
+    if cloc_cache is not None:
+        cloc_cache.close()
+    if line_counter is not None:
+        line_counter.close()
+    if workspace is not None:
+        workspace.close()
+    if http_cache is not None:
+        http_cache.close()
+    exporter.stop()
@@ -0,0 +1,118 @@
+import json
+import os
+import sys
+from threading import Lock
+
+
+class CrawlJournal:
+    def __init__(self, path, flush_every=10):
+        self.path = path
+        self.flush_every = flush_every
+        self.lock = Lock()
+
+        # "query#page" of finished search units
+        self.done = set()
+        # query -> total_count reported by the first page
+        self.totals = dict()
+        # full_name -> search result item of a repository being analyzed
+        self.in_flight = dict()
+
+        if os.path.exists(path):
+            self.__replay()
+        self.__compact()
+        self.log = open(path, "a")
+        self.unsynced = 0
+
+
+    @staticmethod
+    def key(unit):
+        return f"{unit.query}#{unit.page}"
+
+
+    def __apply(self, event):
+        if "done" in event:
+            self.done.add(event["done"])
+            if "total" in event:
+                self.totals[event["query"]] = event["total"]
+        elif "begin" in event:
+            self.in_flight[event["begin"]["full_name"]] = event["begin"]
+        elif "finish" in event:
+            self.in_flight.pop(event["finish"], None)
+
+
+    def __replay(self):
+        with open(self.path, "r") as logFile:
+            for line in logFile:
+                try:
+                    self.__apply(json.loads(line))
+                except ValueError:
+                    # Torn write of the last event before the crash
+                    print(f"Ignoring broken journal line in '{self.path}'", file=sys.stderr)
+
+
+    def __compact(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as logFile:
+            for key in self.done:
+                query = key.rsplit("#", 1)[0]
+                event = {"done": key}
+                if key.endswith("#1") and query in self.totals:
+                    event["query"] = query
+                    event["total"] = self.totals[query]
+                logFile.write(json.dumps(event) + "\n")
+            for info in self.in_flight.values():
+                logFile.write(json.dumps({"begin": info}) + "\n")
+            logFile.flush()
+            os.fsync(logFile.fileno())
+        os.replace(tmp_path, self.path)
+
+
+    def __write(self, event, sync):
+        self.__apply(event)
+        self.log.write(json.dumps(event) + "\n")
+        self.unsynced += 1
+        if sync or self.unsynced >= self.flush_every:
+            self.log.flush()
+            os.fsync(self.log.fileno())
+            self.unsynced = 0
+
+
+    def is_done(self, unit):
+        with self.lock:
+            return CrawlJournal.key(unit) in self.done
+
+
+    def total(self, query):
+        with self.lock:
+            return self.totals.get(query)
+
+
+    def pending(self):
+        with self.lock:
+            return list(self.in_flight.values())
+
+
+    def begin(self, info):
+        with self.lock:
+            self.__write({"begin": info}, sync=False)
+
+
+    def complete(self, unit, response):
+        event = {"done": CrawlJournal.key(unit)}
+        if 1 == unit.page:
+            event["query"] = unit.query
+            event["total"] = response["total_count"]
+        with self.lock:
+            self.__write(event, sync=True)
+
+
+    def finish(self, full_name):
+        with self.lock:
+            self.__write({"finish": full_name}, sync=False)
+
+
+    def close(self):
+        with self.lock:
+            self.log.flush()
+            os.fsync(self.log.fileno())
+            self.log.close()
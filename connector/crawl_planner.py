@@ -0,0 +1,212 @@
+import math
+import sys
+from collections import deque, namedtuple
+from csv import DictReader
+from datetime import date, timedelta
+from threading import Condition
+
+
+SearchUnit = namedtuple("SearchUnit", ["term", "query", "page"])
+
+
+def load_counts(pages_csv):
+    counts = dict()
+    with open(pages_csv, "r") as csv_file:
+        for row in DictReader(csv_file):
+            counts[row["query"]] = int(row["number"])
+    return counts
+
+
+class Shard:
+    def __init__(self, term, created, stars=(0, None), size=(0, None)):
+        self.term = term
+        self.created = created
+        self.stars = stars
+        self.size = size
+
+
+    @staticmethod
+    def __range(lo, hi):
+        return f"{lo}..{hi}" if hi is not None else f">={lo}"
+
+
+    @staticmethod
+    def __split_range(lo, hi):
+        if hi is None:
+            bound = max(lo * 4, lo + 10)
+            return (lo, bound), (bound + 1, None)
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        return (lo, mid), (mid + 1, hi)
+
+
+    def query(self):
+        created = f"{self.created[0].isoformat()}..{self.created[1].isoformat()}"
+        query = f"{self.term} created:{created}"
+        if (0, None) != self.stars:
+            query += f" stars:{Shard.__range(*self.stars)}"
+        if (0, None) != self.size:
+            query += f" size:{Shard.__range(*self.size)}"
+        return query
+
+
+    def split(self):
+        lo, hi = self.created
+        if lo < hi:
+            mid = lo + (hi - lo) // 2
+            return [Shard(self.term, (lo, mid), self.stars, self.size),
+                    Shard(self.term, (mid + timedelta(days=1), hi), self.stars, self.size)]
+        halves = Shard.__split_range(*self.stars)
+        if halves is not None:
+            return [Shard(self.term, self.created, half, self.size) for half in halves]
+        halves = Shard.__split_range(*self.size)
+        if halves is not None:
+            return [Shard(self.term, self.created, self.stars, half) for half in halves]
+        return []
+
+
+class TermStats:
+    def __init__(self):
+        self.calls = 0
+        self.items = 0
+        self.new = 0
+
+
+    def unique_yield(self):
+        return self.new / self.calls if self.calls else float("inf")
+
+
+class CrawlPlanner:
+    # GitHub search returns only the first 1000 results of every query
+    result_cap = 1000
+    per_page = 100
+    first_created = date(2007, 10, 1)
+
+
+    def __init__(self, counts, min_yield=0.0, warmup_calls=20, last_created=None, journal=None):
+        self.journal = journal
+        self.min_yield = min_yield
+        self.warmup_calls = warmup_calls
+        last_created = last_created or date.today()
+        years = list(range(CrawlPlanner.first_created.year, last_created.year + 1))
+
+        self.queues = dict()
+        self.stats = dict()
+        self.shards = dict()
+        for term, count in counts.items():
+            self.queues[term] = deque()
+            self.stats[term] = TermStats()
+            # Seed with at most one slice per year sized by the known total, every probe costs a search call
+            # before min_yield can judge the term. Slices still over the result cap are split by bisection
+            slices = max(1, min(len(years), math.ceil(count / CrawlPlanner.result_cap)))
+            step = len(years) / slices
+            for i in range(slices):
+                lo = max(CrawlPlanner.first_created, date(years[int(i * step)], 1, 1))
+                hi = min(last_created, date(years[int((i + 1) * step) - 1], 12, 31))
+                self.__push_probe(Shard(term, (lo, hi)))
+
+        self.outstanding = 0
+        self.condition = Condition()
+
+
+    def __push_probe(self, shard, front=False):
+        query = shard.query()
+        self.shards[query] = shard
+        unit = SearchUnit(shard.term, query, 1)
+        if front:
+            self.queues[shard.term].appendleft(unit)
+        else:
+            self.queues[shard.term].append(unit)
+
+
+    def __next_term(self):
+        best_term = None
+        best_yield = -1
+        for term, queue in self.queues.items():
+            if not queue:
+                continue
+            stats = self.stats[term]
+            unique_yield = stats.unique_yield()
+            if stats.calls >= self.warmup_calls and unique_yield < self.min_yield:
+                print(f"Abandoning query '{term}': {unique_yield:.2f} new repositories per call", file=sys.stderr)
+                queue.clear()
+                continue
+            if unique_yield > best_yield:
+                best_term, best_yield = term, unique_yield
+        return best_term
+
+
+    def plan(self):
+        while True:
+            with self.condition:
+                term = self.__next_term()
+                while term is None and self.outstanding > 0:
+                    self.condition.wait()
+                    term = self.__next_term()
+                if term is None:
+                    return
+                unit = self.queues[term].popleft()
+                if self.journal is not None and self.journal.is_done(unit):
+                    # Replay the finished unit from the journal without spending a search call
+                    if 1 == unit.page:
+                        self.__expand(unit, self.journal.total(unit.query))
+                    continue
+                self.outstanding += 1
+            yield unit
+
+
+    def report(self, unit, response, new_count):
+        with self.condition:
+            self.outstanding -= 1
+            if response is not None:
+                stats = self.stats[unit.term]
+                stats.calls += 1
+                stats.items += len(response["items"])
+                stats.new += new_count
+                if 1 == unit.page:
+                    self.__expand(unit, response["total_count"])
+            self.condition.notify_all()
+
+
+    def __expand(self, unit, total):
+        shard = self.shards.pop(unit.query)
+        if total > CrawlPlanner.result_cap:
+            children = shard.split()
+            if children:
+                for child in reversed(children):
+                    self.__push_probe(child, front=True)
+                return
+        pages = math.ceil(min(total, CrawlPlanner.result_cap) / CrawlPlanner.per_page)
+        for page in range(pages, 1, -1):
+            self.queues[unit.term].appendleft(SearchUnit(unit.term, unit.query, page))
+
+
+    def print_stats(self):
+        for term, stats in self.stats.items():
+            print(f"{term}: {stats.calls} calls, {stats.items} items, {stats.new} new, "
+                  f"{stats.unique_yield():.2f} new per call", file=sys.stderr)
+
+
+class AlphabetPlanner:
+    def __init__(self, alphabet, pages=10, journal=None):
+        self.alphabet = alphabet
+        self.pages = pages
+        self.journal = journal
+
+
+    def plan(self):
+        for page in range(1, self.pages + 1):
+            for ch in self.alphabet:
+                unit = SearchUnit(ch, ch, page)
+                if self.journal is not None and self.journal.is_done(unit):
+                    continue
+                yield unit
+
+
+    def report(self, unit, response, new_count):
+        pass
+
+
+    def print_stats(self):
+        pass
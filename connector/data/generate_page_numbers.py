@@ -1,48 +1,32 @@
 #!/usr/bin/python3
 
 
+import os
 import sys
-import requests
-import time
 import string
 from csv import DictWriter
 from argparse import ArgumentParser
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from github_client import GitHubClient, add_token_arguments, read_tokens
 
-def __search_repos(query, token):
-    # doc: https://docs.github.com/en/rest/search/search?apiVersion=2022-11-28#search-repositories
-    url = "https://api.github.com/search/repositories"
-    params = {
-        "q": query,
-        "per_page": 100
-    }
-    headers = {
-        "accept" : "application/vnd.github+json",
-        "Authorization" : f"Bearer {token}",
-        "X-GitHub-Api-Version" : "2022-11-28"
-    }
-    while True:
-        response = requests.get(url, headers=headers, params=params)
-        if 200 == response.status_code:
-            break
-        elif 403 == response.status_code:
-            wait_time = 1 + int(response.headers["X-Ratelimit-Reset"]) - int(time.time())
-            print(f"WAITING {wait_time} s", file=sys.stderr)
-            time.sleep(wait_time)
-    return response.json()
+
+def __search_repos(client, query):
+    return client.search_repositories(query)
 
 
 if __name__ == "__main__":
     parser = ArgumentParser(
         prog="generate_page_numbers.py",
         description="Generate page numbers for alphabet")
-    parser.add_argument("-g", "--token", type=str, help="GitHub token")
+    add_token_arguments(parser)
     args = parser.parse_args()
 
+    client = GitHubClient(read_tokens(args))
     writer = DictWriter(sys.stdout, fieldnames=["query", "number"])
     writer.writeheader()
     alphabet = string.ascii_letters + string.digits
-    for ch in string.ascii_letters:
+    for ch in alphabet:
         writer.writerow({
             "query": ch,
-            "number": __search_repos(ch, args.token)["total_count"]})
+            "number": __search_repos(client, ch)["total_count"]})
@@ -1,85 +1,97 @@
 #!/usr/bin/python3
 
 
-import requests
-import json
-import os
-import time
 import sys
-from argparse import ArgumentParser
+from argparse import ArgumentParser, BooleanOptionalAction
+from backup_reader import BackupReader, add_reader_arguments, reader_from_args
+from backup_storage import open_storage
+from github_client import GitHubClient, add_token_arguments, read_tokens
+from http_cache import add_http_cache_arguments, http_cache_from_args
+from metrics import add_metrics_arguments, metrics_from_args
+from validate_backup import api_repair_targets
 
 
 class BackupFixer:
-    url_base = "https://api.github.com"
-
-
-    def __init__(self, backup_dir, git_token):
-        self.repos_dir = f"{backup_dir}/repos/"
-        self.headers = {
-            "accept" : "application/vnd.github+json",
-            "Authorization" : f"Bearer {git_token}",
-            "X-GitHub-Api-Version" : "2022-11-28"
-        }
+    def __init__(self, backup_dir, git_token, reader=None, url_base=None, http_cache=None, graphql_batch=None,
+                 targets=None):
+        self.reader = reader if reader is not None else BackupReader(backup_dir)
+        self.storage = open_storage(backup_dir, self.reader.storage_type)
+        self.client = GitHubClient(git_token, url_base, cache=http_cache)
+        # Number of repositories per GraphQL query, REST requests one by one if not set
+        self.graphql_batch = graphql_batch
+        # (owner, repo) pairs from a validator defects index, the whole backup is scanned if not set
+        self.targets = targets
         self.unfound = []
 
 
-    @staticmethod
-    def __read_jsons(dir):
-        repos = []
-        for filename in os.listdir(dir):
-            filepath = f"{dir}/{filename}"
-            if os.path.isfile(filepath):
-                with open(filepath, "r") as jsonFile:
-                    try:
-                        repos.append(json.load(jsonFile))
-                    except Exception:
-                        print(f"Bad json file '{filepath}'", file=sys.stderr)
-        return repos
+    def __report_unfound(self, owner, repo, status, response=None):
+        if 404 == status:
+            print(f"Failed to find: ({owner}, {repo})")
+        elif 451 == status:
+            print(f"Failed to access: ({owner}, {repo})")
+        else:
+            print(f"Unexpected error: {response}")
+        self.unfound.append((owner, repo))
 
 
     def __get_repo_info(self, owner, repo):
-        # doc: https://docs.github.com/en/rest/repos/repos?apiVersion=2022-11-28#get-a-repository
-        url = f"{BackupFixer.url_base}/repos/{owner}/{repo}"
-        response = requests.get(url, headers=self.headers)
-        while True:
-            response = requests.get(url, headers=self.headers)
-            if 200 == response.status_code:
-                break
-            elif 403 == response.status_code:
-                wait_time = 1 + int(response.headers["X-Ratelimit-Reset"]) - int(time.time())
-                print(f"WAITING {wait_time} s", file=sys.stderr)
-                time.sleep(wait_time)
-            elif 404 == response.status_code:
-                print(f"Failed to find: ({owner}, {repo})")
-                self.unfound.append((owner, repo))
-                return None
-            elif 451 == response.status_code:
-                print(f"Failed to access: ({owner}, {repo})")
-                self.unfound.append((owner, repo))
-                return None
-            else:
-                print(f"Unexpected error: {response}")
-        return response.json()
+        response = self.client.get_repository(owner, repo)
+        if 200 == response.status_code:
+            return response.json()
+        self.__report_unfound(owner, repo, response.status_code, response)
+        return None
+
+
+    def __fix_doc(self, json_doc, repo_info):
+        json_doc["pushed_at"] = repo_info["pushed_at"]
+        json_doc["created_at"] = repo_info["created_at"]
+        json_doc["updated_at"] = repo_info["updated_at"]
+        self.storage.add_repo(json_doc)
+        print(f"{json_doc['owner']}/{json_doc['repo']} corrected")
+
+
+    def __fix_batch(self, json_docs):
+        results = self.client.get_repositories((json_doc["owner"], json_doc["repo"]) for json_doc in json_docs)
+        for json_doc in json_docs:
+            status, repo_info = results[(json_doc["owner"], json_doc["repo"])]
+            if repo_info is None:
+                self.__report_unfound(json_doc["owner"], json_doc["repo"], status)
+                continue
+            self.__fix_doc(json_doc, repo_info)
+
+
+    def __docs(self):
+        if self.targets is None:
+            yield from self.reader.repos()
+            return
+        for owner, repo in self.targets:
+            json_doc = self.storage.get_repo(owner, repo)
+            if json_doc is None:
+                print(f"Failed to read: ({owner}, {repo})", file=sys.stderr)
+                continue
+            yield json_doc
 
 
     def fix(self):
-        for subdir in os.listdir(self.repos_dir):
-            subdir_path = f"{self.repos_dir}/{subdir}"
-            if os.path.isdir(subdir_path):
-                jsons = BackupFixer.__read_jsons(subdir_path)
-                for json_doc in jsons:
-                    if type(json_doc["updated_at"]) == str:
-                        print(f"{json_doc['owner']}/{json_doc['repo']} already correct")
-                        continue
-                    repo_info = self.__get_repo_info(json_doc["owner"], json_doc["repo"])
-                    if repo_info is None:
-                        continue
-                    json_doc["pushed_at"] = repo_info["pushed_at"]
-                    json_doc["created_at"] = repo_info["created_at"]
-                    json_doc["updated_at"] = repo_info["updated_at"]
-                    with open(f"{subdir_path}/{json_doc['repo']}.json", 'w') as jsonFile:
-                        jsonFile.write(json.dumps(json_doc))
-                    print(f"{json_doc['owner']}/{json_doc['repo']} corrected")
+        batch = []
+        for json_doc in self.__docs():
+            if self.targets is None and type(json_doc["updated_at"]) == str:
+                print(f"{json_doc['owner']}/{json_doc['repo']} already correct")
+                continue
+            if self.graphql_batch is not None:
+                batch.append(json_doc)
+                if len(batch) >= self.graphql_batch:
+                    self.__fix_batch(batch)
+                    batch = []
+                continue
+            repo_info = self.__get_repo_info(json_doc["owner"], json_doc["repo"])
+            if repo_info is None:
+                continue
+            self.__fix_doc(json_doc, repo_info)
+        if batch:
+            self.__fix_batch(batch)
+        self.storage.close()
+        self.reader.report_errors()
         print(f"Unfound repos: {self.unfound}")
 
 
@@ -88,8 +100,24 @@ if __name__ == "__main__":
         prog="fix_time_fields.py",
         description="Fix repos connector data: created_at, pushed_at, updated_at")
     parser.add_argument("-b", "--backup", type=str, help="Backup directory")
-    parser.add_argument("-g", "--token", type=str, help="GitHub token")
+    add_token_arguments(parser)
+    parser.add_argument("--api-url", type=str, default=GitHubClient.url_base, help="GitHub API base URL")
+    add_http_cache_arguments(parser)
+    parser.add_argument("--graphql", action=BooleanOptionalAction, default=False,
+                        help="Fetch repositories in batches with GraphQL queries")
+    parser.add_argument("--batch-size", type=int, default=100, help="Repositories per GraphQL query")
+    parser.add_argument("--defects", type=str, default=None,
+                        help="Defects index of validate_backup.py, only repositories it lists for API repair are fixed")
+    add_reader_arguments(parser)
+    add_metrics_arguments(parser)
     args = parser.parse_args()
+    exporter = metrics_from_args(args)
 
-    fixer = BackupFixer(args.backup, args.token)
+    http_cache = http_cache_from_args(args)
+    fixer = BackupFixer(args.backup, read_tokens(args), reader_from_args(args.backup, args), args.api_url, http_cache,
+                        args.batch_size if args.graphql else None,
+                        api_repair_targets(args.defects) if args.defects is not None else None)
     fixer.fix()
+    if http_cache is not None:
+        http_cache.close()
+    exporter.stop()
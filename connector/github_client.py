@@ -0,0 +1,332 @@
+import random
+import sys
+import time
+import requests
+import metrics
+from threading import Lock
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+
+
+class GitHubError(Exception):
+    pass
+
+
+class TokenPool:
+    def __init__(self, tokens):
+        self.tokens = list(dict.fromkeys(token for token in tokens if token)) or [None]
+        # (token, resource) -> (remaining requests, reset timestamp)
+        self.limits = dict()
+        self.lock = Lock()
+
+
+    def acquire(self, resource):
+        while True:
+            with self.lock:
+                now = time.time()
+                best_token = None
+                best_budget = 0
+                earliest_reset = None
+                for token in self.tokens:
+                    remaining, reset = self.limits.get((token, resource), (None, 0))
+                    budget = float("inf") if remaining is None or reset <= now else remaining
+                    if budget > best_budget:
+                        best_token, best_budget = token, budget
+                    if budget <= 0 and (earliest_reset is None or reset < earliest_reset):
+                        earliest_reset = reset
+                if best_budget > 0:
+                    remaining, reset = self.limits.get((best_token, resource), (None, 0))
+                    if remaining is not None and reset > now:
+                        # Reserve a request so that concurrent callers spread over the tokens
+                        self.limits[(best_token, resource)] = (remaining - 1, reset)
+                    return best_token
+                wait_time = 1 + earliest_reset - now
+            GitHubClient.wait(wait_time, "quota")
+
+
+    def update(self, token, resource, remaining, reset):
+        with self.lock:
+            self.limits[(token, resource)] = (remaining, reset)
+
+
+class GitHubClient:
+    url_base = "https://api.github.com"
+    api_version = "2022-11-28"
+    repository_fields = """
+        name
+        nameWithOwner
+        owner { login }
+        url
+        diskUsage
+        forkCount
+        stargazerCount
+        pushedAt
+        createdAt
+        updatedAt
+        licenseInfo { key name spdxId url }
+        primaryLanguage { name }
+    """
+    # Statuses which are answers about the resource itself, so the caller decides what to do
+    final_statuses = {404, 410, 422, 451}
+
+
+    def __init__(self, tokens, url_base=None, pool_size=10, max_retries=8, backoff_base=1.0, backoff_max=600.0,
+                 timeout=(10, 120), cache=None):
+        self.url_base = url_base or GitHubClient.url_base
+        self.cache = cache
+        if tokens is None or isinstance(tokens, str):
+            tokens = [tokens]
+        self.tokens = TokenPool(tokens)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "accept" : "application/vnd.github+json",
+            "X-GitHub-Api-Version" : GitHubClient.api_version
+        })
+
+
+    @staticmethod
+    def __resource(url):
+        if "/search/" in url:
+            return "search"
+        if url.endswith("/graphql"):
+            return "graphql"
+        return "core"
+
+
+    @staticmethod
+    def __endpoint(url):
+        path = urlparse(url).path
+        if "/search/" in path:
+            return "search"
+        if path.endswith("/graphql"):
+            return "graphql"
+        if path.endswith("/tarball"):
+            return "tarball"
+        if "/repos/" in path:
+            return "repos"
+        return "other"
+
+
+    @staticmethod
+    def wait(wait_time, reason="backoff"):
+        wait_time = max(0, wait_time)
+        print(f"WAITING {int(wait_time)} s", file=sys.stderr)
+        metrics.api_sleep.inc(wait_time, reason=reason)
+        time.sleep(wait_time)
+
+
+    def __backoff(self, attempt):
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(delay / 2, delay)
+
+
+    def __update_limits(self, token, resource, response):
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if remaining is None or reset is None:
+            return
+        resource = response.headers.get("X-RateLimit-Resource", resource)
+        self.tokens.update(token, resource, int(remaining), int(reset))
+
+
+    def __rate_limit_wait(self, response, attempt):
+        # doc: https://docs.github.com/en/rest/using-the-rest-api/rate-limits-for-the-rest-api
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is not None:
+            return int(retry_after)
+        if "0" == response.headers.get("X-RateLimit-Remaining"):
+            # The token pool already knows this token is exhausted and waits only if all of them are
+            return 0
+        if 429 == response.status_code or "rate limit" in response.text.lower():
+            # Secondary rate limit without hints: wait at least a minute
+            return max(60, self.__backoff(attempt))
+        return None
+
+
+    def request(self, method, url, **kwargs):
+        if url.startswith("/"):
+            url = f"{self.url_base}{url}"
+        resource = GitHubClient.__resource(url)
+        endpoint = GitHubClient.__endpoint(url)
+        headers = dict(kwargs.pop("headers", None) or dict())
+        kwargs.setdefault("timeout", self.timeout)
+        cache_key = None
+        cached = None
+        if self.cache is not None and "GET" == method and not kwargs.get("stream"):
+            cache_key = requests.Request(method, url, params=kwargs.get("params")).prepare().url
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                # doc: https://docs.github.com/en/rest/using-the-rest-api/best-practices-for-using-the-rest-api#use-conditional-requests-if-appropriate
+                headers.update(cached.conditional_headers())
+
+        # Only server and connection errors count towards max_retries, rate limits are waited out however long they are
+        failures = 0
+        rate_limits = 0
+        while failures <= self.max_retries:
+            token = self.tokens.acquire(resource)
+            if token:
+                headers["Authorization"] = f"Bearer {token}"
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, headers=headers, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.api_requests.inc(endpoint=endpoint, status="error")
+                print(f"Request to {url} failed: {e}", file=sys.stderr)
+                GitHubClient.wait(self.__backoff(failures))
+                failures += 1
+                continue
+            metrics.api_latency.observe(time.perf_counter() - start, endpoint=endpoint)
+            metrics.api_requests.inc(endpoint=endpoint, status=str(response.status_code))
+            self.__update_limits(token, resource, response)
+
+            if 304 == response.status_code and cached is not None:
+                metrics.api_cache_requests.inc(result="revalidated")
+                self.cache.touch(cache_key)
+                live_headers = {name: value for name, value in response.headers.items()
+                                if name.lower().startswith("x-ratelimit")}
+                response.close()
+                return cached.response(url, live_headers)
+            if 200 == response.status_code and cache_key is not None:
+                metrics.api_cache_requests.inc(result="miss" if cached is None else "changed")
+                self.cache.put(cache_key, response)
+            if response.status_code < 400 or response.status_code in GitHubClient.final_statuses:
+                return response
+            if response.status_code in (403, 429):
+                wait_time = self.__rate_limit_wait(response, rate_limits)
+                if wait_time is None:
+                    return response
+                rate_limits += 1
+                response.close()
+                if wait_time > 0:
+                    GitHubClient.wait(wait_time, "rate_limit")
+            elif response.status_code >= 500:
+                response.close()
+                GitHubClient.wait(self.__backoff(failures))
+                failures += 1
+            else:
+                raise GitHubError(f"Unexpected response {response.status_code} for {url}: {response.text}")
+        raise GitHubError(f"Giving up on {url} after {failures} failed attempts")
+
+
+    def get(self, url, params=None, **kwargs):
+        return self.request("GET", url, params=params, **kwargs)
+
+
+    def get_repository(self, owner, repo):
+        # doc: https://docs.github.com/en/rest/repos/repos?apiVersion=2022-11-28#get-a-repository
+        return self.get(f"/repos/{owner}/{repo}")
+
+
+    def graphql(self, query, variables=None):
+        # doc: https://docs.github.com/en/graphql/guides/forming-calls-with-graphql
+        rate_limits = 0
+        while True:
+            response = self.request("POST", "/graphql", json={"query": query, "variables": variables or dict()})
+            if 200 != response.status_code:
+                raise GitHubError(f"GraphQL query failed: {response.status_code} {response.text}")
+            answer = response.json()
+            # doc: https://docs.github.com/en/graphql/overview/rate-limits-and-node-limits-for-the-graphql-api
+            # An exhausted limit comes with status 200, it is waited out like the REST 403 and 429 responses
+            if not any("RATE_LIMITED" == error.get("type") for error in answer.get("errors") or []):
+                return answer
+            wait_time = self.__rate_limit_wait(response, rate_limits)
+            GitHubClient.wait(max(60, self.__backoff(rate_limits)) if wait_time is None else wait_time, "rate_limit")
+            rate_limits += 1
+
+
+    @staticmethod
+    def __rest_repository(node):
+        license = node["licenseInfo"]
+        return {
+            "name": node["name"],
+            "full_name": node["nameWithOwner"],
+            "owner": {"login": node["owner"]["login"]},
+            "html_url": node["url"],
+            "clone_url": f"{node['url']}.git",
+            "size": node["diskUsage"],
+            "forks_count": node["forkCount"],
+            "stargazers_count": node["stargazerCount"],
+            # REST watchers_count is the legacy name of the stargazer count
+            "watchers_count": node["stargazerCount"],
+            "pushed_at": node["pushedAt"],
+            "created_at": node["createdAt"],
+            "updated_at": node["updatedAt"],
+            "license": {
+                "key": license["key"],
+                "name": license["name"],
+                "spdx_id": license["spdxId"],
+                "url": license["url"]
+            } if license else None,
+            "language": node["primaryLanguage"]["name"] if node["primaryLanguage"] else None
+        }
+
+
+    def get_repositories(self, repos):
+        # One aliased query fetches a whole batch, results map to (status, REST shaped info) like get_repository
+        repos = list(repos)
+        declarations = []
+        selections = []
+        variables = dict()
+        for number, (owner, repo) in enumerate(repos):
+            declarations.append(f"$owner{number}: String!, $name{number}: String!")
+            selections.append(f"r{number}: repository(owner: $owner{number}, name: $name{number}) "
+                              f"{{ {GitHubClient.repository_fields} }}")
+            variables[f"owner{number}"] = owner
+            variables[f"name{number}"] = repo
+        query = f"query({', '.join(declarations)}) {{ {' '.join(selections)} }}"
+        answer = self.graphql(query, variables)
+
+        statuses = dict()
+        for error in answer.get("errors") or []:
+            path = error.get("path") or []
+            if not path:
+                raise GitHubError(f"GraphQL query failed: {error}")
+            statuses[path[0]] = 404 if "NOT_FOUND" == error.get("type") else 451
+        data = answer.get("data") or dict()
+        results = dict()
+        for number, key in enumerate(repos):
+            node = data.get(f"r{number}")
+            if node is not None:
+                results[key] = (200, GitHubClient.__rest_repository(node))
+            else:
+                results[key] = (statuses.get(f"r{number}", 404), None)
+        return results
+
+
+    def search_repositories(self, query, page=1, sort=None, order=None, per_page=100):
+        # doc: https://docs.github.com/en/rest/search/search?apiVersion=2022-11-28#search-repositories
+        params = {
+            "q": query,
+            "per_page": per_page,
+            "page": page
+        }
+        if sort is not None:
+            params["sort"] = sort
+        if order is not None:
+            params["order"] = order
+        response = self.get("/search/repositories", params=params)
+        if 200 != response.status_code:
+            raise GitHubError(f"Search '{query}' page {page} failed: {response.status_code} {response.text}")
+        return response.json()
+
+
+def add_token_arguments(parser):
+    parser.add_argument("-g", "--token", type=str, action="append", default=[],
+                        help="GitHub token, may be repeated to use a token pool")
+    parser.add_argument("--tokens-file", type=str, default=None, help="File with GitHub tokens, one per line")
+
+
+def read_tokens(args):
+    tokens = list(args.token)
+    if args.tokens_file is not None:
+        with open(args.tokens_file, "r") as tokensFile:
+            tokens += [line.strip() for line in tokensFile if line.strip()]
+    return tokens
@@ -0,0 +1,97 @@
+import json
+import time
+import requests
+from lru_store import LruStore
+from requests.structures import CaseInsensitiveDict
+
+
+class CachedResponse:
+    # Headers worth replaying, rate limit headers always come from the live 304 response
+    kept_headers = ["Content-Type", "ETag", "Last-Modified", "Link"]
+
+
+    def __init__(self, etag, last_modified, headers, body):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.headers = headers
+        self.body = body
+
+
+    def conditional_headers(self):
+        headers = dict()
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+    def response(self, url, live_headers):
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.headers.update(live_headers)
+        response.encoding = "utf-8"
+        response._content = self.body
+        return response
+
+
+class ResponseCache:
+    schema = [
+        "CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, "
+        "headers TEXT NOT NULL, body BLOB NOT NULL, size INTEGER NOT NULL, stored_at REAL NOT NULL, "
+        "last_used REAL NOT NULL) WITHOUT ROWID",
+        "CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)"
+    ]
+
+
+    def __init__(self, path, max_bytes=1024 * 1024 * 1024, ttl=7 * 24 * 3600, batch_size=100):
+        # Older entries are not revalidated, the resource is fetched again in full
+        self.ttl = ttl
+        self.store = LruStore(path, "responses", "url", ResponseCache.schema, max_bytes, batch_size)
+        self.store.delete_where("stored_at < ?", (time.time() - self.ttl,))
+
+
+    def get(self, url):
+        # Only a 304 response marks the entry used
+        row = self.store.get("etag, last_modified, headers, body, stored_at", url, touch=False)
+        if row is None:
+            return None
+        etag, last_modified, headers, body, stored_at = row
+        if stored_at < time.time() - self.ttl:
+            return None
+        return CachedResponse(etag, last_modified, json.loads(headers), body)
+
+
+    def touch(self, url):
+        self.store.touch(url)
+
+
+    def put(self, url, response):
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if etag is None and last_modified is None:
+            return
+        headers = {name: response.headers[name] for name in CachedResponse.kept_headers if name in response.headers}
+        body = response.content
+        now = time.time()
+        self.store.put(url, len(body), (url, etag, last_modified, json.dumps(headers), body, len(body), now, now))
+
+
+    def close(self):
+        self.store.close()
+
+
+def add_http_cache_arguments(parser):
+    parser.add_argument("--http-cache", type=str, default=None,
+                        help="GitHub API response cache file, enables conditional requests")
+    parser.add_argument("--http-cache-size", type=int, default=1024, help="Response cache size limit in MB")
+    parser.add_argument("--http-cache-ttl", type=int, default=7 * 24,
+                        help="Hours after which a cached response is fetched again in full")
+
+
+def http_cache_from_args(args):
+    if args.http_cache is None:
+        return None
+    return ResponseCache(args.http_cache, args.http_cache_size * 1024 * 1024, args.http_cache_ttl * 3600)
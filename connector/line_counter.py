@@ -0,0 +1,564 @@
+#!/usr/bin/python3
+
+
+import hashlib
+import json
+import mmap
+import multiprocessing
+import os
+import random
+import re
+import subprocess
+import sys
+from argparse import ArgumentParser
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from enum import Enum
+
+
+# Bumped whenever counting rules change, cached results of another version are not reused
+ENGINE_VERSION = 1
+
+
+class CountEngine(Enum):
+    CLOC = "cloc"
+    BUILTIN = "builtin"
+
+
+    def __str__(self):
+        return self.value
+
+
+CommentStyle = namedtuple("CommentStyle", ["pattern", "blocks"])
+
+
+def comment_style(line=(), blocks=(), line_start_blocks=()):
+    # One regex finds the leftmost comment start, like cloc filters comment delimiters do not know about strings
+    tokens = [(re.escape(token.encode()), None) for token in line]
+    tokens += [(re.escape(start.encode()), end.encode()) for start, end in blocks]
+    tokens += [(b"^" + re.escape(start.encode()), end.encode()) for start, end in line_start_blocks]
+    if not tokens:
+        return CommentStyle(None, dict())
+    tokens.sort(key=lambda token: -len(token[0]))
+    pattern = re.compile(b"|".join(b"(" + token + b")" for token, _ in tokens))
+    return CommentStyle(pattern, {group: end for group, (_, end) in enumerate(tokens, start=1)})
+
+
+NONE = comment_style()
+C = comment_style(["//"], [("/*", "*/")])
+C_BLOCK = comment_style([], [("/*", "*/")])
+SLASH = comment_style(["//"])
+HASH = comment_style(["#"])
+HASH_C = comment_style(["#", "//"], [("/*", "*/")])
+DASH = comment_style(["--"])
+DASH_C = comment_style(["--"], [("/*", "*/")])
+HASKELL = comment_style(["--"], [("{-", "-}")])
+SEMICOLON = comment_style([";"])
+LISP = comment_style([";"], [("#|", "|#")])
+PERCENT = comment_style(["%"])
+ML = comment_style([], [("(*", "*)")])
+XML = comment_style([], [("<!--", "-->")])
+PYTHON = comment_style(["#"], [('"""', '"""'), ("'''", "'''")])
+RUBY = comment_style(["#"], [], [("=begin", "=end")])
+PERL = comment_style(["#"], [], [(start, "=cut") for start in ["=pod", "=head", "=over", "=item", "=begin", "=for"]])
+
+# Language -> (comment style, extensions, file names) for the languages of data/langs.csv cloc is run on the most
+LANGUAGES = {
+    "ActionScript": (C, ["as"], []),
+    "Ada": (DASH, ["ada", "adb", "ads", "pad"], []),
+    "Agda": (HASKELL, ["agda"], []),
+    "Ant": (XML, [], ["build.xml"]),
+    "ANTLR Grammar": (C, ["g", "g4"], []),
+    "Apex Trigger": (C, ["trigger"], []),
+    "AsciiDoc": (comment_style(["//"], [("////", "////")]), ["adoc", "asciidoc"], []),
+    "ASP.NET": (comment_style([], [("<!--", "-->"), ("<%--", "--%>")]), ["aspx", "ascx", "asax", "ashx", "asmx"], []),
+    "Assembly": (comment_style([";", "#", "//"], [("/*", "*/")]), ["asm", "s", "nasm", "a51"], []),
+    "awk": (HASH, ["awk", "auk", "gawk", "mawk", "nawk"], []),
+    "Bazel": (HASH, [], ["BUILD", "BUILD.bazel", "WORKSPACE", "WORKSPACE.bazel"]),
+    "Bourne Again Shell": (HASH, ["bash"], []),
+    "Bourne Shell": (HASH, ["sh"], []),
+    "C": (C, ["c", "cats", "ec", "idc", "pgc"], []),
+    "C Shell": (HASH, ["csh", "tcsh"], []),
+    "C/C++ Header": (C, ["h", "hh", "hpp", "hxx", "inl", "ipp", "tcc"], []),
+    "C#": (C, ["cs"], []),
+    "C++": (C, ["cc", "cpp", "cxx", "c++", "pcc", "cppm", "ixx", "tpp"], []),
+    "Cairo": (SLASH, ["cairo"], []),
+    "Carbon": (SLASH, ["carbon"], []),
+    "Chapel": (C, ["chpl"], []),
+    "Circom": (C, ["circom"], []),
+    "Clojure": (SEMICOLON, ["clj", "cljx", "edn"], []),
+    "ClojureC": (SEMICOLON, ["cljc"], []),
+    "ClojureScript": (SEMICOLON, ["cljs"], []),
+    "CMake": (comment_style(["#"], [("#[[", "]]")]), ["cmake"], ["CMakeLists.txt"]),
+    "COBOL": (comment_style(["*>"]), ["cbl", "cob", "cpy"], []),
+    "CoffeeScript": (comment_style(["#"], [("###", "###")]), ["coffee", "_coffee", "cakefile", "cjsx", "iced"], []),
+    "ColdFusion": (comment_style([], [("<!---", "--->")]), ["cfm", "cfml"], []),
+    "ColdFusion CFScript": (C, ["cfc"], []),
+    "Containerfile": (HASH, [], ["Containerfile"]),
+    "Coq": (ML, [], []),
+    "Crystal": (HASH, ["cr"], []),
+    "CSON": (HASH, ["cson"], []),
+    "CSS": (C_BLOCK, ["css"], []),
+    "CSV": (NONE, ["csv"], []),
+    "Cucumber": (HASH, ["feature"], []),
+    "CUDA": (C, ["cu", "cuh"], []),
+    "Cython": (PYTHON, ["pyx", "pxd", "pxi"], []),
+    "D": (comment_style(["//"], [("/*", "*/"), ("/+", "+/")]), ["d"], []),
+    "Dart": (C, ["dart"], []),
+    "Delphi Form": (NONE, ["dfm"], []),
+    "dhall": (HASKELL, ["dhall"], []),
+    "diff": (NONE, ["diff", "patch"], []),
+    "DITA": (XML, ["dita"], []),
+    "Dockerfile": (HASH, ["dockerfile"], ["Dockerfile", "dockerfile"]),
+    "DOS Batch": (comment_style(["::", "rem ", "REM ", "@rem ", "@REM "]), ["bat", "cmd", "btm"], []),
+    "DTD": (XML, ["dtd"], []),
+    "EEx": (comment_style([], [("<%#", "%>")]), ["eex", "leex"], []),
+    "EJS": (comment_style([], [("<%#", "%>"), ("<!--", "-->")]), ["ejs"], []),
+    "Elixir": (HASH, ["ex", "exs"], []),
+    "Elm": (HASKELL, ["elm"], []),
+    "ERB": (comment_style([], [("<%#", "%>")]), ["erb"], []),
+    "Erlang": (PERCENT, ["erl", "hrl"], ["rebar.config", "rebar.lock"]),
+    "Expect": (HASH, ["exp"], []),
+    "F#": (comment_style(["//"], [("(*", "*)")]), ["fs", "fsi"], []),
+    "F# Script": (comment_style(["//"], [("(*", "*)")]), ["fsx"], []),
+    "Fennel": (SEMICOLON, ["fnl"], []),
+    "Fish Shell": (HASH, ["fish"], []),
+    "Flatbuffers": (C, ["fbs"], []),
+    "Fortran 77": (comment_style(["!"]), ["f", "for", "ftn", "f77", "pfo"], []),
+    "Fortran 90": (comment_style(["!"]), ["f90"], []),
+    "Fortran 95": (comment_style(["!"]), ["f95", "f03", "f08"], []),
+    "Freemarker Template": (comment_style([], [("<#--", "-->")]), ["ftl"], []),
+    "Futhark": (DASH, ["fut"], []),
+    "FXML": (XML, ["fxml"], []),
+    "GDScript": (HASH, ["gd"], []),
+    "Glade": (XML, ["glade"], []),
+    "Gleam": (SLASH, ["gleam"], []),
+    "GLSL": (C, ["glsl", "vert", "frag", "geom", "comp", "tesc", "tese"], []),
+    "Go": (C, ["go"], []),
+    "Godot Resource": (SEMICOLON, ["tres"], []),
+    "Godot Scene": (SEMICOLON, ["tscn"], []),
+    "Godot Shaders": (C, ["gdshader"], []),
+    "Gradle": (C, ["gradle"], []),
+    "GraphQL": (HASH, ["graphql", "gql"], []),
+    "Groovy": (C, ["groovy", "gvy", "gy", "gsh", "gant"], ["Jenkinsfile"]),
+    "Haml": (comment_style(["-#"]), ["haml"], []),
+    "Handlebars": (comment_style([], [("{{!--", "--}}"), ("{{!", "}}")]), ["hbs", "handlebars"], []),
+    "Hare": (SLASH, ["ha"], []),
+    "Haskell": (HASKELL, ["hs", "hsc", "lhs"], []),
+    "Haxe": (C, ["hx", "hxsl"], []),
+    "HCL": (comment_style(["#", "//"], [("/*", "*/")]), ["hcl", "tf", "tfvars", "nomad"], []),
+    "HLSL": (C, ["hlsl", "fx", "fxh", "hlsli"], []),
+    "Hoon": (comment_style(["::"]), ["hoon"], []),
+    "HTML": (XML, ["html", "htm"], []),
+    "HTML EEx": (comment_style([], [("<%#", "%>"), ("<!--", "-->")]), ["heex"], []),
+    "Idris": (HASKELL, ["idr"], []),
+    "Imba": (comment_style(["#"], [("###", "###")]), ["imba"], []),
+    "INI": (comment_style([";", "#"]), ["ini"], []),
+    "Jai": (C, ["jai"], []),
+    "Java": (C, ["java"], []),
+    "JavaScript": (C, ["js", "mjs", "cjs", "jsb", "jsm", "es6", "jake"], []),
+    "Jinja Template": (comment_style([], [("{#", "#}")]), ["j2", "jinja", "jinja2"], []),
+    "JSON": (NONE, ["json", "geojson", "topojson", "webmanifest", "har", "avsc"], []),
+    "JSON5": (C, ["json5"], []),
+    "JSP": (comment_style([], [("<%--", "--%>"), ("<!--", "-->")]), ["jsp", "jspf"], []),
+    "JSX": (C, ["jsx"], []),
+    "Julia": (comment_style(["#"], [("#=", "=#")]), ["jl"], []),
+    "Kotlin": (C, ["kt", "kts", "ktm"], []),
+    "Korn Shell": (HASH, ["ksh"], []),
+    "kvlang": (HASH, ["kv"], []),
+    "Lean": (comment_style(["--"], [("/-", "-/")]), ["lean"], []),
+    "LESS": (C, ["less"], []),
+    "lex": (C, ["l", "lex"], []),
+    "LFE": (SEMICOLON, ["lfe"], []),
+    "Linker Script": (C_BLOCK, ["ld", "lds"], []),
+    "liquid": (comment_style([], [("{% comment %}", "{% endcomment %}")]), ["liquid"], []),
+    "Lisp": (LISP, ["lisp", "lsp", "el"], []),
+    "Literate Idris": (NONE, ["lidr"], []),
+    "LLVM IR": (SEMICOLON, ["ll"], []),
+    "Logtalk": (comment_style(["%"], [("/*", "*/")]), ["lgt", "logtalk"], []),
+    "Lua": (comment_style(["--"], [("--[[", "]]")]), ["lua", "luau"], []),
+    "m4": (comment_style(["dnl ", "#"]), ["m4", "ac"], []),
+    "make": (HASH, ["mk", "mak", "make", "am"], ["Makefile", "makefile", "GNUmakefile"]),
+    "Mako": (comment_style(["##"], [("<%doc>", "</%doc>")]), ["mako", "mao"], []),
+    "Markdown": (XML, ["md", "markdown", "mdown", "mkd", "mkdn", "mdwn", "ronn"], []),
+    "Mathematica": (ML, ["mt", "wl", "wlt"], []),
+    "MATLAB": (comment_style(["%"], [("%{", "%}")]), [], []),
+    "Maven": (XML, [], ["pom.xml"]),
+    "Mercury": (PERCENT, [], []),
+    "Meson": (HASH, [], ["meson.build", "meson_options.txt", "meson.options"]),
+    "Metal": (C, ["metal"], []),
+    "Modula3": (ML, ["m3", "i3", "mg", "ig"], []),
+    "Mojo": (PYTHON, ["mojo"], []),
+    "MSBuild script": (XML, ["csproj", "vbproj", "vcxproj", "fsproj", "proj", "props", "targets", "wixproj"], []),
+    "Mustache": (comment_style([], [("{{!", "}}")]), ["mustache"], []),
+    "MXML": (XML, ["mxml"], []),
+    "Nim": (comment_style(["#"], [("#[", "]#")]), ["nim", "nims", "nimble"], []),
+    "Nix": (comment_style(["#"], [("/*", "*/")]), ["nix"], []),
+    "Nunjucks": (comment_style([], [("{#", "#}")]), ["njk"], []),
+    "Objective-C": (C, [], []),
+    "Objective-C++": (C, ["mm"], []),
+    "OCaml": (ML, ["ml", "mli", "mll", "mly"], []),
+    "Odin": (C, ["odin"], []),
+    "OpenCL": (C, ["cl"], []),
+    "OpenSCAD": (C, ["scad"], []),
+    "P4": (C, ["p4"], []),
+    "Pascal": (comment_style(["//"], [("{", "}"), ("(*", "*)")]), ["pas", "dpr", "lpr", "dpk"], []),
+    "PEG": (HASH, ["peg"], []),
+    "peg.js": (C, ["pegjs"], []),
+    "peggy": (C, ["peggy"], []),
+    "Perl": (PERL, ["pl", "pm", "perl", "plx", "ph", "t"], []),
+    "Pest": (SLASH, ["pest"], []),
+    "PHP": (HASH_C, ["php", "php3", "php4", "php5", "phtml", "phpt"], []),
+    "Pig Latin": (DASH_C, ["pig"], []),
+    "PL/I": (C_BLOCK, ["pl1"], []),
+    "PlantUML": (comment_style(["'"], [("/'", "'/")]), ["puml", "plantuml", "iuml", "pu"], []),
+    "PO File": (HASH, ["po"], []),
+    "Pony": (C, ["pony"], []),
+    "PowerShell": (comment_style(["#"], [("<#", "#>")]), ["ps1", "psm1", "psd1"], []),
+    "Prolog": (comment_style(["%"], [("/*", "*/")]), ["p", "pro"], []),
+    "Properties": (comment_style(["#", "!"]), ["properties"], []),
+    "Protocol Buffers": (C, ["proto"], []),
+    "Pug": (comment_style(["//"]), ["pug", "jade"], []),
+    "Puppet": (HASH, [], []),
+    "PureScript": (HASKELL, ["purs"], []),
+    "Python": (PYTHON, ["py", "pyw", "pyi", "wsgi", "gyp", "gypi"], ["SConstruct", "SConscript"]),
+    "QML": (C, ["qml"], []),
+    "Qt": (XML, ["ui"], []),
+    "Qt Linguist": (XML, [], []),
+    "Qt Project": (HASH, [], []),
+    "R": (HASH, ["r"], []),
+    "Racket": (LISP, ["rkt", "rktl", "scrbl"], []),
+    "Raku": (PERL, ["raku", "rakumod", "rakutest", "p6", "pl6", "pm6"], []),
+    "RAML": (HASH, ["raml"], []),
+    "Razor": (comment_style([], [("@*", "*@"), ("<!--", "-->")]), ["cshtml", "razor"], []),
+    "ReasonML": (C, ["re", "rei"], []),
+    "ReScript": (C, ["res", "resi"], []),
+    "reStructuredText": (NONE, ["rst", "rest"], []),
+    "Rexx": (C_BLOCK, ["rexx", "rex"], []),
+    "Rmd": (XML, ["rmd"], []),
+    "RobotFramework": (HASH, ["robot"], []),
+    "Ruby": (RUBY, ["rb", "rake", "gemspec", "ru", "podspec", "jbuilder", "rbw"],
+             ["Rakefile", "Gemfile", "Vagrantfile", "Podfile", "Guardfile", "Capfile", "Brewfile", "Fastfile"]),
+    "Ruby HTML": (XML, ["rhtml"], []),
+    "Rust": (C, ["rs"], []),
+    "SaltStack": (HASH, ["sls"], []),
+    "SAS": (C_BLOCK, ["sas"], []),
+    "Sass": (C, ["sass"], []),
+    "Scala": (C, ["scala", "kojo", "sbt"], []),
+    "Scheme": (LISP, ["scm", "ss", "sld", "sps"], []),
+    "SCSS": (C, ["scss"], []),
+    "sed": (HASH, ["sed"], []),
+    "Slice": (C, ["ice"], []),
+    "Slim": (comment_style(["/"]), ["slim"], []),
+    "Smalltalk": (comment_style([], [("\"", "\"")]), ["st", "cs.st"], []),
+    "Smarty": (comment_style([], [("{*", "*}")]), ["tpl", "smarty"], []),
+    "Solidity": (C, ["sol"], []),
+    "SQL": (DASH_C, ["sql", "psql"], []),
+    "Squirrel": (HASH_C, ["nut"], []),
+    "Standard ML": (ML, ["sml", "sig", "fun"], []),
+    "Starlark": (HASH, ["bzl", "star"], []),
+    "Stata": (comment_style(["*", "//"], [("/*", "*/")]), ["do", "ado"], []),
+    "Stylus": (C, ["styl"], []),
+    "SugarSS": (C_BLOCK, ["sss"], []),
+    "Svelte": (comment_style(["//"], [("<!--", "-->"), ("/*", "*/")]), ["svelte"], []),
+    "SVG": (XML, ["svg"], []),
+    "Swift": (C, ["swift"], []),
+    "SWIG": (C, ["i", "swg"], []),
+    "TableGen": (C, ["td"], []),
+    "Tcl/Tk": (HASH, ["tcl", "tk", "itk", "itcl"], []),
+    "TEAL": (DASH, ["teal"], []),
+    "TeX": (PERCENT, ["tex", "sty", "dtx", "ins", "ltx"], []),
+    "Text": (NONE, ["txt", "text"], []),
+    "Thrift": (HASH_C, ["thrift"], []),
+    "TOML": (HASH, ["toml"], []),
+    "tspeg": (HASH, ["tspeg", "jspeg"], []),
+    "Twig": (comment_style([], [("{#", "#}")]), ["twig"], []),
+    "TypeScript": (C, ["ts", "mts", "cts", "tsx"], []),
+    "Typst": (C, ["typ"], []),
+    "Umka": (C, ["um"], []),
+    "Unity-Prefab": (HASH, ["prefab"], []),
+    "Vala": (C, ["vala"], []),
+    "Vala Header": (C, ["vapi"], []),
+    "VB for Applications": (comment_style(["'"]), ["vba"], []),
+    "Velocity Template Language": (comment_style(["##"], [("#*", "*#")]), ["vm", "vtl"], []),
+    "Verilog-SystemVerilog": (C, ["vh", "sv", "svh"], []),
+    "VHDL": (DASH, ["vhd", "vhdl", "vhf", "vhi", "vho", "vhs", "vht", "vhw"], []),
+    "vim script": (comment_style(["\""]), ["vim"], [".vimrc", "_vimrc", ".gvimrc"]),
+    "Visual Basic": (comment_style(["'"]), ["bas", "ctl", "dsr", "frm"], []),
+    "Visual Basic .NET": (comment_style(["'"]), ["vb"], []),
+    "Visual Basic Script": (comment_style(["'"]), ["vbs"], []),
+    "Visual Studio Solution": (HASH, ["sln"], []),
+    "Visualforce Component": (XML, ["component"], []),
+    "Visualforce Page": (XML, ["page"], []),
+    "Vuejs Component": (comment_style(["//"], [("<!--", "-->"), ("/*", "*/")]), ["vue"], []),
+    "Web Services Description": (XML, ["wsdl"], []),
+    "WebAssembly": (comment_style([";;"], [("(;", ";)")]), ["wat", "wast"], []),
+    "WGSL": (C, ["wgsl"], []),
+    "Windows Message File": (comment_style([";"]), ["mc"], []),
+    "Windows Module Definition": (comment_style([";"]), ["def"], []),
+    "Windows Resource File": (C, ["rc", "rc2"], []),
+    "WiX include": (XML, ["wxi"], []),
+    "WiX source": (XML, ["wxs"], []),
+    "WiX string localization": (XML, ["wxl"], []),
+    "WXML": (XML, ["wxml"], []),
+    "WXSS": (C_BLOCK, ["wxss"], []),
+    "XAML": (XML, ["xaml"], []),
+    "XHTML": (XML, ["xhtml", "xht"], []),
+    "XMI": (XML, ["xmi"], []),
+    "XML": (XML, ["xml", "plist", "rss", "xlf", "xliff", "nuspec", "resx", "config", "storyboard", "xib", "qrc"], []),
+    "XQuery": (comment_style([], [("(:", ":)")]), ["xq", "xquery", "xqm", "xql", "xqy"], []),
+    "XSD": (XML, ["xsd"], []),
+    "XSLT": (XML, ["xsl", "xslt"], []),
+    "Xtend": (C, ["xtend"], []),
+    "yacc": (C, ["y", "yacc"], []),
+    "YAML": (HASH, ["yaml", "yml"], []),
+    "Zig": (SLASH, ["zig"], []),
+    "zsh": (HASH, ["zsh"], [".zshrc", ".zshenv", ".zprofile"])
+}
+
+EXTENSIONS = {extension: language for language, (_, extensions, _) in LANGUAGES.items() for extension in extensions}
+FILE_NAMES = {name: language for language, (_, _, names) in LANGUAGES.items() for name in names}
+# Compound extensions are looked up before the last one
+COMPOUND_EXTENSIONS = {"designer.cs": "C# Designer", "g.cs": "C# Generated", "html.erb": "Ruby HTML",
+                       "gradle.kts": "Gradle"}
+LANGUAGES["C# Designer"] = LANGUAGES["C#"]
+LANGUAGES["C# Generated"] = LANGUAGES["C#"]
+SHEBANGS = {"python": "Python", "python2": "Python", "python3": "Python", "perl": "Perl", "ruby": "Ruby",
+            "sh": "Bourne Shell", "bash": "Bourne Again Shell", "zsh": "zsh", "ksh": "Korn Shell", "csh": "C Shell",
+            "tcsh": "C Shell", "fish": "Fish Shell", "node": "JavaScript", "lua": "Lua", "php": "PHP",
+            "tclsh": "Tcl/Tk", "wish": "Tcl/Tk", "expect": "Expect", "awk": "awk", "gawk": "awk", "sed": "sed",
+            "Rscript": "R", "julia": "Julia", "raku": "Raku", "perl6": "Raku", "make": "make"}
+EXCLUDED_DIRS = {".bzr", ".cvs", "_darcs", "CVS", ".git", ".hg", ".snapshot", ".svn", "GIT", "RCS", "SCCS"}
+HEAD_SIZE = 4096
+
+
+def __guess_ambiguous(extension, head):
+    # Same extensions belong to several languages, cloc looks at the content as well
+    if "m" == extension:
+        if re.search(rb"^\s*(@interface|@implementation|@protocol|#import|#include)", head, re.M):
+            return "Objective-C"
+        if re.search(rb"^:- (module|interface|implementation)", head, re.M):
+            return "Mercury"
+        return "MATLAB"
+    if "v" == extension:
+        if re.search(rb"\b(module|endmodule|always|wire|reg)\b", head):
+            return "Verilog-SystemVerilog"
+        return "Coq"
+    if "pp" == extension:
+        if re.search(rb"^\s*(class|define|node)\b[^\n]*\{", head, re.M):
+            return "Puppet"
+        return "Pascal"
+    if "pro" == extension:
+        if re.search(rb"^\s*(QT|TEMPLATE|TARGET|SOURCES|HEADERS|CONFIG)\s*[+-]?=", head, re.M):
+            return "Qt Project"
+        return "Prolog"
+    if "ts" == extension and head.lstrip().startswith((b"<?xml", b"<TS")):
+        return "Qt Linguist"
+    if "cl" == extension and re.search(rb"^\s*\((defun|in-package|defpackage|defmacro)", head, re.M):
+        return "Lisp"
+    return None
+
+
+def detect_language(path, head):
+    name = os.path.basename(path)
+    if name in FILE_NAMES:
+        return FILE_NAMES[name]
+    parts = name.lower().split(".")
+    if len(parts) > 2 and ".".join(parts[-2:]) in COMPOUND_EXTENSIONS:
+        return COMPOUND_EXTENSIONS[".".join(parts[-2:])]
+    if len(parts) > 2 or len(parts) > 1 and parts[0]:
+        extension = parts[-1]
+        language = __guess_ambiguous(extension, head)
+        if language is not None:
+            return language
+        return EXTENSIONS.get(extension)
+    if name.endswith(".Dockerfile") or name.startswith("Dockerfile."):
+        return "Dockerfile"
+    if head.startswith(b"#!"):
+        command = head[2:head.find(b"\n") if b"\n" in head else len(head)].split()
+        if command and command[0].endswith(b"/env") and len(command) > 1:
+            command = command[1:]
+        if command:
+            return SHEBANGS.get(os.path.basename(command[0].decode("utf-8", "replace")))
+    return None
+
+
+def count_lines(data, style):
+    blank = comment = code = 0
+    pattern = style.pattern
+    block_end = None
+    for line in data.splitlines():
+        if not line.strip():
+            blank += 1
+            continue
+        if pattern is None:
+            code += 1
+            continue
+        position = 0
+        has_code = False
+        if block_end is not None:
+            end = line.find(block_end)
+            if end < 0:
+                comment += 1
+                continue
+            position = end + len(block_end)
+            block_end = None
+        while True:
+            match = pattern.search(line, position)
+            if match is None:
+                has_code = has_code or bool(line[position:].strip())
+                break
+            has_code = has_code or bool(line[position:match.start()].strip())
+            end_token = style.blocks[match.lastindex]
+            if end_token is None:
+                break
+            end = line.find(end_token, match.end())
+            if end < 0:
+                block_end = end_token
+                break
+            position = end + len(end_token)
+        if has_code:
+            code += 1
+        else:
+            comment += 1
+    return blank, comment, code
+
+
+def __read(path):
+    with open(path, "rb") as sourceFile:
+        size = os.fstat(sourceFile.fileno()).st_size
+        if 0 == size:
+            return b""
+        with mmap.mmap(sourceFile.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return mapped[:]
+
+
+def count_files(paths):
+    results = []
+    for path in paths:
+        try:
+            data = __read(path)
+        except (OSError, ValueError):
+            continue
+        head = data[:HEAD_SIZE]
+        # Binary files are skipped as cloc does
+        if b"\0" in head:
+            continue
+        language = detect_language(path, head)
+        if language is None:
+            continue
+        digest = hashlib.md5(data).digest()
+        results.append((language, digest, *count_lines(data, LANGUAGES[language][0])))
+    return results
+
+
+def list_files(root):
+    for dir, subdirs, files in os.walk(root):
+        subdirs[:] = [subdir for subdir in subdirs if subdir not in EXCLUDED_DIRS]
+        for file in files:
+            path = f"{dir}/{file}"
+            if os.path.isfile(path) and not os.path.islink(path):
+                yield path
+
+
+class LineCounter:
+    def __init__(self, processes=None, chunk_files=64):
+        self.processes = processes or os.cpu_count() or 1
+        self.chunk_files = chunk_files
+        self.executor = None
+        if self.processes > 1:
+            # Connector pipeline threads may hold locks at fork time, workers are started from a clean process
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self.executor = ProcessPoolExecutor(max_workers=self.processes,
+                                                mp_context=multiprocessing.get_context(method))
+
+
+    def count(self, root):
+        paths = list(list_files(root))
+        chunks = [paths[start:start + self.chunk_files] for start in range(0, len(paths), self.chunk_files)]
+        if self.executor is None or len(chunks) < 2:
+            chunk_results = [count_files(chunk) for chunk in chunks]
+        else:
+            chunk_results = self.executor.map(count_files, chunks)
+        # Same result shape as the cloc JSON output the connector stores, duplicate files are counted once
+        result = dict()
+        seen = set()
+        for results in chunk_results:
+            for language, digest, blank, comment, code in results:
+                if digest in seen:
+                    continue
+                seen.add(digest)
+                value = result.setdefault(language, {"files": 0, "blank": 0, "comment": 0, "code": 0})
+                value["files"] += 1
+                value["blank"] += blank
+                value["comment"] += comment
+                value["code"] += code
+        return result
+
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+def run_cloc(cloc_path, root, timeout=60):
+    process = subprocess.run([cloc_path, root, "--timeout", str(timeout), "--json"], capture_output=True, text=True)
+    result = dict()
+    try:
+        languages = json.loads(process.stdout)
+    except ValueError:
+        return result
+    for language, value in languages.items():
+        if language in ("header", "SUM"):
+            continue
+        result[language] = {
+            "files": value["nFiles"],
+            "blank": value["blank"],
+            "comment": value["comment"],
+            "code": value["code"]
+        }
+    return result
+
+
+def compare(builtin, cloc):
+    # (language, field, built-in value, cloc value) for every difference
+    differences = []
+    for language in sorted(set(builtin) | set(cloc)):
+        for field in ["files", "blank", "comment", "code"]:
+            ours = builtin.get(language, dict()).get(field, 0)
+            theirs = cloc.get(language, dict()).get(field, 0)
+            if ours != theirs:
+                differences.append((language, field, ours, theirs))
+    return differences
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        prog="line_counter.py",
+        description="Count lines of code per language without cloc, optionally cross-checking cloc output")
+    parser.add_argument("dirs", type=str, nargs="+", help="Directories to analyze")
+    parser.add_argument("-c", "--cloc", type=str, default=None, help="Cloc executable path, enables cross-check")
+    parser.add_argument("-s", "--sample", type=int, default=None, help="Analyze only this many random directories")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the sample")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="Counting processes")
+    args = parser.parse_args()
+
+    dirs = args.dirs
+    if args.sample is not None and args.sample < len(dirs):
+        dirs = random.Random(args.seed).sample(dirs, args.sample)
+    counter = LineCounter(args.processes)
+    mismatched = 0
+    for dir in dirs:
+        result = counter.count(dir)
+        if args.cloc is None:
+            print(json.dumps({"dir": dir, "languages": result}))
+            continue
+        differences = compare(result, run_cloc(args.cloc, dir))
+        if differences:
+            mismatched += 1
+        for language, field, ours, theirs in differences:
+            print(f"{dir}: {language} {field}: built-in {ours}, cloc {theirs}")
+    counter.close()
+    if args.cloc is not None:
+        print(f"Directories matching cloc: {len(dirs) - mismatched} of {len(dirs)}")
+        sys.exit(1 if mismatched else 0)
@@ -0,0 +1,100 @@
+import os
+import sqlite3
+import time
+from threading import Lock
+
+
+class LruStore:
+    # A SQLite table with a size limit, its rows have key, size and last_used columns
+    def __init__(self, path, table, key_column, schema, max_bytes, batch_size=100):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.table = table
+        self.key_column = key_column
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.pending = 0
+        self.lock = Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        for statement in schema:
+            self.connection.execute(statement)
+        self.connection.commit()
+        self.size = self.__stored_size()
+
+
+    def __stored_size(self):
+        return self.connection.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+
+
+    def __written(self):
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.connection.commit()
+            self.pending = 0
+
+
+    def __evict(self):
+        # Least recently used entries go first, down to 90% of the limit to avoid evicting on every insert
+        target = self.max_bytes * 0.9
+        cursor = self.connection.execute(f"SELECT {self.key_column}, size FROM {self.table} ORDER BY last_used")
+        evicted = []
+        for key, size in cursor:
+            if self.size <= target:
+                break
+            evicted.append((key,))
+            self.size -= size
+        cursor.close()
+        self.connection.executemany(f"DELETE FROM {self.table} WHERE {self.key_column} = ?", evicted)
+        self.connection.commit()
+        self.pending = 0
+
+
+    def __touch(self, key):
+        self.connection.execute(f"UPDATE {self.table} SET last_used = ? WHERE {self.key_column} = ?",
+                                (time.time(), key))
+        self.__written()
+
+
+    def get(self, columns, key, touch=True):
+        with self.lock:
+            row = self.connection.execute(f"SELECT {columns} FROM {self.table} WHERE {self.key_column} = ?",
+                                          (key,)).fetchone()
+            if row is not None and touch:
+                self.__touch(key)
+        return row
+
+
+    def touch(self, key):
+        with self.lock:
+            self.__touch(key)
+
+
+    def put(self, key, size, row):
+        # row holds every column in table order, its size and last_used among them
+        with self.lock:
+            previous = self.connection.execute(f"SELECT size FROM {self.table} WHERE {self.key_column} = ?",
+                                               (key,)).fetchone()
+            self.connection.execute(f"INSERT OR REPLACE INTO {self.table} VALUES ({', '.join('?' * len(row))})",
+                                    row)
+            self.size += size - (previous[0] if previous is not None else 0)
+            if self.size > self.max_bytes:
+                self.__evict()
+            else:
+                self.__written()
+
+
+    def delete_where(self, condition, parameters):
+        with self.lock:
+            self.connection.execute(f"DELETE FROM {self.table} WHERE {condition}", parameters)
+            self.connection.commit()
+            self.pending = 0
+            self.size = self.__stored_size()
+
+
+    def close(self):
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
@@ -0,0 +1,209 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Event, Lock, Thread
+
+
+def __escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace("\"", "\\\"")
+
+
+def format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f"{name}=\"{__escape(value)}\"" for name, value in pairs) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = dict()
+        self.lock = Lock()
+
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.labels, key)} {format_value(value)}")
+        return lines
+
+
+class Histogram:
+    default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, float("inf"))
+
+
+    def __init__(self, name, help, labels=(), buckets=default_buckets):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> (bucket counts, sum, count)
+        self.values = dict()
+        self.lock = Lock()
+
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self.lock:
+            counts, total, count = self.values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[position] += 1
+                    break
+            self.values[key] = (counts, total + value, count + 1)
+
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = format_labels(self.labels, key, [("le", format_value(bound))])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {format_value(total)}")
+                lines.append(f"{self.name}_count{format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+
+    def histogram(self, name, help, labels=(), buckets=Histogram.default_buckets):
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+api_requests = registry.counter("github_api_requests_total", "GitHub API responses", ["endpoint", "status"])
+api_latency = registry.histogram("github_api_request_seconds", "GitHub API request latency", ["endpoint"])
+api_sleep = registry.counter("github_api_sleep_seconds_total", "Time spent waiting before GitHub API requests",
+                             ["reason"])
+api_cache_requests = registry.counter("github_api_cache_requests_total", "GitHub API response cache lookups",
+                                      ["result"])
+clone_latency = registry.histogram("repo_clone_seconds", "Repository fetch duration", ["strategy", "result"])
+workspace_dirs = registry.counter("workspace_dirs_total", "Checkout directories by placement", ["placement"])
+workspace_quota_aborts = registry.counter("workspace_quota_aborts_total", "Checkouts aborted by a workspace quota",
+                                          ["scope"])
+cloned_bytes = registry.counter("repo_cloned_bytes_total", "Bytes of fetched repository content", ["strategy"])
+cloc_latency = registry.histogram("repo_cloc_seconds", "Line counting duration", ["result"])
+cloc_cache_requests = registry.counter("cloc_cache_requests_total", "Cloc cache lookups", ["result"])
+line_counter_checks = registry.counter("line_counter_checks_total", "Built-in line counter cross-checks against cloc",
+                                       ["result"])
+repos_processed = registry.counter("connector_repos_total", "Repositories processed by the connector", ["result"])
+storage_latency = registry.histogram("storage_write_seconds", "Backup storage write latency", ["storage", "kind"])
+bulk_latency = registry.histogram("opensearch_bulk_request_seconds", "OpenSearch bulk request latency")
+bulk_documents = registry.counter("opensearch_bulk_documents_total", "Documents sent in bulk requests", ["result"])
+query_cache_requests = registry.counter("opensearch_query_cache_requests_total", "Report query cache lookups",
+                                      ["result"])
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+    def do_GET(self):
+        if self.path not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        data = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class MetricsExporter:
+    def __init__(self, path=None, port=None, interval=15):
+        self.path = path
+        self.interval = interval
+        self.stopped = Event()
+        self.server = None
+        self.writer = None
+        if port is not None:
+            self.server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+            self.server.daemon_threads = True
+            Thread(target=self.server.serve_forever, daemon=True).start()
+            print(f"Serving metrics on port {port}", file=sys.stderr)
+        if path is not None:
+            self.writer = Thread(target=self.__write_periodically, daemon=True)
+            self.writer.start()
+
+
+    def write(self):
+        # Scrapers such as the node exporter textfile collector must never see a partial file
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as metricsFile:
+            metricsFile.write(registry.render())
+        os.replace(tmp_path, self.path)
+
+
+    def __write_periodically(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+
+    def stop(self):
+        self.stopped.set()
+        if self.writer is not None:
+            self.writer.join()
+            self.write()
+        if self.server is not None:
+            self.server.shutdown()
+
+
+def add_metrics_arguments(parser):
+    parser.add_argument("--metrics-file", type=str, default=None, help="Write Prometheus metrics to this file")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics on this port")
+    parser.add_argument("--metrics-interval", type=int, default=15, help="Metrics file update interval in seconds")
+
+
+def metrics_from_args(args):
+    return MetricsExporter(args.metrics_file, args.metrics_port, args.metrics_interval)
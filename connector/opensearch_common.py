@@ -0,0 +1,263 @@
+import hashlib
+import json
+import sys
+import time
+import uuid
+import metrics
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import contextmanager
+from argparse import BooleanOptionalAction
+from csv import DictReader
+from opensearchpy import OpenSearch, helpers
+from backup_storage import normalize_languages
+
+
+BulkOptions = namedtuple("BulkOptions", ["chunk_size", "max_chunk_bytes", "threads", "compress"],
+                         defaults=[True])
+
+
+def compress_requests(bulk_options):
+    # Only bulk requests are large enough to be worth compressing
+    return bulk_options is not None and bulk_options.compress
+
+
+def create_client(ip, port, login, token, compress=False, use_ssl=True):
+    return OpenSearch(
+        hosts = [{'host': ip, 'port': port}],
+        http_auth = (login, token),
+        use_ssl = use_ssl,
+        verify_certs = False,
+        ssl_show_warn = False,
+        http_compress = compress
+    )
+
+
+def add_bulk_arguments(parser):
+    parser.add_argument("--bulk", action=BooleanOptionalAction, default=True, help="Use bulk ingestion")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Documents per bulk request")
+    parser.add_argument("--max-chunk-bytes", type=int, default=10 * 1024 * 1024, help="Bytes per bulk request")
+    parser.add_argument("--threads", type=int, default=4, help="Parallel bulk requests")
+    parser.add_argument("--compress", action=BooleanOptionalAction, default=True, help="Gzip request bodies")
+
+
+def bulk_options_from_args(args):
+    if not args.bulk:
+        return None
+    return BulkOptions(args.chunk_size, args.max_chunk_bytes, args.threads, args.compress)
+
+
+@contextmanager
+def bulk_load_settings(client, index_name):
+    # Refreshes and replica copies are wasted work while the index is being filled
+    settings = client.indices.get_settings(index=index_name)[index_name]["settings"]["index"]
+    # A setting the index did not have is restored as null, so the cluster default applies again
+    previous = {
+        "refresh_interval": settings.get("refresh_interval"),
+        "number_of_replicas": settings.get("number_of_replicas")
+    }
+    client.indices.put_settings(index=index_name, body={
+        "index": {
+            "refresh_interval": "-1",
+            "number_of_replicas": 0
+        }
+    })
+    try:
+        yield
+    finally:
+        client.indices.put_settings(index=index_name, body={"index": previous})
+        client.indices.refresh(index=index_name)
+
+
+def index_operations(index_name, documents):
+    for id, doc in documents:
+        yield {"index": {"_index": index_name, "_id": id}}, doc
+
+
+def __chunks(operations, chunk_size, max_chunk_bytes):
+    chunk = []
+    chunk_bytes = 0
+    for action, source in operations:
+        lines = [json.dumps(action)]
+        if source is not None:
+            lines.append(json.dumps(source))
+        size = sum(len(line) + 1 for line in lines)
+        if chunk and (len(chunk) >= chunk_size or chunk_bytes + size > max_chunk_bytes):
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(lines)
+        chunk_bytes += size
+    if chunk:
+        yield chunk
+
+
+def __send_chunk(client, number, chunk):
+    body = "\n".join(line for lines in chunk for line in lines) + "\n"
+    start = time.perf_counter()
+    try:
+        response = client.bulk(body=body)
+    except Exception as e:
+        metrics.bulk_documents.inc(len(chunk), result="failed")
+        return number, 0, len(chunk), Counter({type(e).__name__: len(chunk)})
+    finally:
+        metrics.bulk_latency.observe(time.perf_counter() - start)
+    errors = Counter()
+    for item in response["items"]:
+        result = next(iter(item.values()))
+        if "error" in result:
+            error = result["error"]
+            errors[error["type"] if isinstance(error, dict) else str(error)] += 1
+    failed = sum(errors.values())
+    metrics.bulk_documents.inc(len(chunk) - failed, result="ok")
+    metrics.bulk_documents.inc(failed, result="failed")
+    return number, len(chunk) - failed, failed, errors
+
+
+def bulk_load(client, operations, options):
+    ok = 0
+    failed = 0
+
+    def report(future):
+        nonlocal ok, failed
+        number, chunk_ok, chunk_failed, errors = future.result()
+        ok += chunk_ok
+        failed += chunk_failed
+        if chunk_failed:
+            print(f"Chunk {number}: {chunk_ok} ok, {chunk_failed} failed: {dict(errors)}", file=sys.stderr)
+        else:
+            print(f"Chunk {number}: {chunk_ok} ok")
+
+    with ThreadPoolExecutor(max_workers=options.threads) as executor:
+        running = set()
+        for number, chunk in enumerate(__chunks(operations, options.chunk_size, options.max_chunk_bytes)):
+            if len(running) >= 2 * options.threads:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    report(future)
+            running.add(executor.submit(__send_chunk, client, number, chunk))
+        for future in running:
+            report(future)
+    print(f"Bulk load finished: {ok} ok, {failed} failed")
+    return ok, failed
+
+
+def index_generation(client, index_name):
+    mappings = client.indices.get_mapping(index=index_name)[index_name]["mappings"]
+    return mappings.get("_meta", dict()).get("generation")
+
+
+def bump_generation(client, index_name):
+    # Cached query results of other generations are not used any more, a new random value also
+    # tells a recreated index from the old one
+    generation = uuid.uuid4().hex
+    client.indices.put_mapping(index=index_name, body={"_meta": {"generation": generation}})
+    return generation
+
+
+def content_hash(doc):
+    source = {key: value for key, value in doc.items() if "content_hash" != key}
+    return hashlib.sha256(json.dumps(source, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def read_index_hashes(client, index_name):
+    hashes = dict()
+    for hit in helpers.scan(client, index=index_name, query={"_source": ["content_hash"]}, size=5000):
+        hashes[hit["_id"]] = hit.get("_source", dict()).get("content_hash")
+    return hashes
+
+
+def sync_operations(index_name, documents, index_hashes, present):
+    changed = 0
+    unchanged = 0
+    for id, doc in documents:
+        doc["content_hash"] = content_hash(doc)
+        if index_hashes.get(id) == doc["content_hash"]:
+            unchanged += 1
+            continue
+        changed += 1
+        yield {"index": {"_index": index_name, "_id": id}}, doc
+    # Documents skipped by the caller are still present in the backup and must not be deleted
+    removed = [id for id in index_hashes if id not in present]
+    for id in removed:
+        yield {"delete": {"_index": index_name, "_id": id}}, None
+    print(f"Sync: {changed} new or changed, {len(removed)} removed, {unchanged} unchanged")
+
+
+GPL = "GPL"
+LANGUAGE_CONSTRUCTION = "language construction"
+LINE_FIELDS = ["code", "comment", "blank", "files"]
+BUCKET_METRICS = ["stargazers", "forks", "watchers"]
+
+
+def popularity_bucket(value):
+    # Bucket 0 holds zero, bucket k holds [10^(k-1), 10^k), that is the values with k digits
+    value = int(value or 0)
+    return len(str(value)) if value > 0 else 0
+
+
+def popularity_bounds(bucket):
+    # Smallest and largest value of the bucket
+    return (0, 0) if 0 == bucket else (10 ** (bucket - 1), 10 ** bucket - 1)
+
+
+def derived_fields(languages):
+    # Per-repository GPL/DSL totals, dashboards aggregate them with plain sum and terms aggregations
+    totals = {"gpl": Counter(), "dsl": Counter()}
+    names = {"gpl": set(), "dsl": set()}
+    dsl_types = set()
+    for info in languages:
+        language_class = "gpl" if GPL == info["language"]["type"] else "dsl"
+        names[language_class].add(info["language"]["name"])
+        if "dsl" == language_class:
+            dsl_types.add(info["language"]["type"])
+        for field in LINE_FIELDS:
+            totals[language_class][field] += info[field]
+    fields = dict()
+    for language_class in ["gpl", "dsl"]:
+        for field in LINE_FIELDS:
+            fields[f"{language_class}_{field}"] = totals[language_class][field]
+    all_code = totals["gpl"]["code"] + totals["dsl"]["code"]
+    fields["dsl_share"] = totals["dsl"]["code"] / all_code if all_code else 0.0
+    fields["dsl_types"] = sorted(dsl_types)
+    fields["gpl_languages"] = sorted(names["gpl"])
+    fields["dsl_languages"] = sorted(names["dsl"])
+    return fields
+
+
+def repo_document(json_doc, language_types, licenses_names):
+    # Backup record to index document
+    languagesArray = []
+    for language, info in normalize_languages(json_doc["languages"]).items():
+        arrayInfo = info.copy()
+        arrayInfo["language"] = {
+            "name": language,
+            "type": language_types[language] if language in language_types else GPL
+        }
+        languagesArray.append(arrayInfo)
+    doc = {key: value for key, value in json_doc.items() if "license_key" != key}
+    doc["languages"] = languagesArray
+    doc["license"] = {
+        "key": json_doc["license_key"],
+        "name": licenses_names[json_doc["license_key"]]
+    }
+    doc.update(derived_fields(languagesArray))
+    return doc
+
+
+def read_language_types(langs_csv):
+    language_types = dict()
+    with open(langs_csv, 'r') as csv_file:
+        for row in DictReader(csv_file):
+            language_types[row["name"]] = row["type"]
+    return language_types
+
+
+def read_license_names(reader):
+    licenses_names = dict()
+    for license_json in reader.licenses():
+        licenses_names[license_json["key"]] = license_json["name"]
+    licenses_names["No license"] = "Без лицензии"
+    licenses_names["other"] = "Нестандартная"
+    return licenses_names
+
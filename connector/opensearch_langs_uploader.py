@@ -2,18 +2,14 @@
 
 
 from csv import DictReader
-from opensearchpy import OpenSearch
+from opensearch_common import create_client, add_bulk_arguments, bulk_options_from_args, bulk_load, \
+    bulk_load_settings, index_operations, compress_requests
 from argparse import ArgumentParser, BooleanOptionalAction
+from metrics import add_metrics_arguments, metrics_from_args
 
 
-def main(ip, port, login, token, csv, create_index, delete_index):
-    client = OpenSearch(
-        hosts = [{'host': ip, 'port': port}],
-        http_auth = (login, token),
-        use_ssl = True,
-        verify_certs = False,
-        ssl_show_warn = False
-    )
+def main(ip, port, login, token, csv, create_index, delete_index, bulk_options=None, use_ssl=True):
+    client = create_client(ip, port, login, token, compress_requests(bulk_options), use_ssl)
 
     index_name = "langs"
     index_body = {
@@ -45,16 +41,20 @@ def main(ip, port, login, token, csv, create_index, delete_index):
 
     with open(csv, 'r') as csv_file:
         reader = DictReader(csv_file)
+        if bulk_options is not None:
+            with bulk_load_settings(client, index_name):
+                bulk_load(client, index_operations(index_name, ((row["name"], row) for row in reader)), bulk_options)
+            return
         for row in reader:
             id = row["name"]
             response = client.index(
                 index = index_name,
                 body = row,
                 id = id,
-                refresh = True
+                refresh = False
             )
             print(f"Adding document: {response}")
-            print(response)
+    client.indices.refresh(index=index_name)
 
 
 if __name__ == "__main__":
@@ -66,8 +66,14 @@ if __name__ == "__main__":
     parser.add_argument("-p", "--port", type=str, help="OpenSearch port")
     parser.add_argument("-l", "--login", type=str, help="OpenSearch login")
     parser.add_argument("-t", "--token", type=str, help="OpenSearch token")
+    parser.add_argument( "--ssl", action=BooleanOptionalAction, default=True, help="Connect over HTTPS")
     parser.add_argument("-c", "--create", action=BooleanOptionalAction, default=False, help="Create index or not")
     parser.add_argument( "--delete", action=BooleanOptionalAction, default=False, help="Delete index or not")
+    add_bulk_arguments(parser)
+    add_metrics_arguments(parser)
     args = parser.parse_args()
+    exporter = metrics_from_args(args)
 
-    main(args.ip, args.port, args.login, args.token, args.csv, args.create, args.delete)
+    main(args.ip, args.port, args.login, args.token, args.csv, args.create, args.delete, bulk_options_from_args(args),
+         args.ssl)
+    exporter.stop()
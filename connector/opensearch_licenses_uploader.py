@@ -1,34 +1,16 @@
 #!/usr/bin/python3
 
 
-import os
-import sys
-import json
-from opensearchpy import OpenSearch
+from backup_reader import BackupReader, add_reader_arguments, reader_from_args
+from opensearch_common import create_client, add_bulk_arguments, bulk_options_from_args, bulk_load, \
+    bulk_load_settings, index_operations, compress_requests
 from argparse import ArgumentParser, BooleanOptionalAction
+from metrics import add_metrics_arguments, metrics_from_args
 
 
-def __read_jsons(dir):
-    licenses = []
-    for filename in os.listdir(dir):
-        filepath = f"{dir}/{filename}"
-        if os.path.isfile(filepath):
-            with open(filepath, "r") as jsonFile:
-                try:
-                    licenses.append(json.load(jsonFile))
-                except Exception:
-                    print(f"Bad json file '{filepath}'", file=sys.stderr)
-    return licenses
-
-
-def main(ip, port, login, token, backup, create_index, delete_index):
-    client = OpenSearch(
-        hosts = [{'host': ip, 'port': port}],
-        http_auth = (login, token),
-        use_ssl = True,
-        verify_certs = False,
-        ssl_show_warn = False
-    )
+def main(ip, port, login, token, backup, create_index, delete_index, bulk_options=None, reader=None,
+         use_ssl=True):
+    client = create_client(ip, port, login, token, compress_requests(bulk_options), use_ssl)
 
     index_name = "licenses"
     index_body = {
@@ -67,8 +49,14 @@ def main(ip, port, login, token, backup, create_index, delete_index):
         response = client.indices.create(index_name, body=index_body)
         print(f"Creating index: {response}")
 
-    parent_dir = f"{backup}/licenses/"
-    jsons = __read_jsons(parent_dir)
+    if reader is None:
+        reader = BackupReader(backup)
+    jsons = reader.licenses()
+    if bulk_options is not None:
+        with bulk_load_settings(client, index_name):
+            bulk_load(client, index_operations(index_name, ((doc["key"], doc) for doc in jsons)), bulk_options)
+        reader.report_errors()
+        return
     for jsonDoc in jsons:
         id = jsonDoc["key"]
         response = client.index(
@@ -78,7 +66,7 @@ def main(ip, port, login, token, backup, create_index, delete_index):
             refresh = False
         )
         print(f"Adding document: {response}")
-        print(response)
+    reader.report_errors()
 
 
 if __name__ == "__main__":
@@ -90,8 +78,15 @@ if __name__ == "__main__":
     parser.add_argument("-p", "--port", type=str, help="OpenSearch port")
     parser.add_argument("-l", "--login", type=str, help="OpenSearch login")
     parser.add_argument("-t", "--token", type=str, help="OpenSearch token")
+    parser.add_argument( "--ssl", action=BooleanOptionalAction, default=True, help="Connect over HTTPS")
     parser.add_argument("-c", "--create", action=BooleanOptionalAction, default=False, help="Create index or not")
     parser.add_argument( "--delete", action=BooleanOptionalAction, default=False, help="Delete index or not")
+    add_bulk_arguments(parser)
+    add_reader_arguments(parser)
+    add_metrics_arguments(parser)
     args = parser.parse_args()
+    exporter = metrics_from_args(args)
 
-    main(args.ip, args.port, args.login, args.token, args.backup, args.create, args.delete)
+    main(args.ip, args.port, args.login, args.token, args.backup, args.create, args.delete, bulk_options_from_args(args),
+         reader_from_args(args.backup, args), args.ssl)
+    exporter.stop()
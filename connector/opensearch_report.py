@@ -0,0 +1,296 @@
+#!/usr/bin/python3
+
+
+import json
+import os
+import sys
+from argparse import ArgumentParser, BooleanOptionalAction
+from enum import Enum
+from opensearch_common import create_client, index_generation, read_language_types, BUCKET_METRICS, GPL, \
+    LANGUAGE_CONSTRUCTION, LINE_FIELDS, popularity_bounds
+from opensearch_rollup import SUMMARY_INDEX
+from query_cache import add_query_cache_arguments, query_cache_from_args, query_key
+from metrics import add_metrics_arguments, metrics_from_args
+
+
+class OutputFormat(Enum):
+    TABLE = "table"
+    JSON = "json"
+
+
+    def __str__(self):
+        return self.value
+
+
+REPOS_INDEX = "repos"
+CLASSES = [(GPL, "gpl"), ("DSL", "dsl")]
+DEFAULT_LANGS_CSV = f"{os.path.dirname(os.path.abspath(__file__))}/data/langs.csv"
+
+
+def __sums(fields):
+    return {field: {"sum": {"field": field}} for field in fields}
+
+
+def __value(aggregations, name):
+    return int(aggregations[name]["value"] or 0)
+
+
+def __ratio(numerator, denominator):
+    return numerator / denominator if denominator else 0.0
+
+
+# Queries use the per-repository fields computed by opensearch_repos_uploader.py, no scripts are needed.
+# Per-type line counts and popularity buckets are not in those fields, these reports read the repos_summary rows
+# of opensearch_rollup.py, one row per type or bucket
+
+def line_ratios_query(language_types):
+    return {"size": 0, "aggs": __sums([f"{prefix}_{field}" for _, prefix in CLASSES
+                                       for field in ["code", "comment", "blank"]])}
+
+
+def line_ratios_rows(aggregations):
+    total = sum(__value(aggregations, f"{prefix}_{field}") for _, prefix in CLASSES
+                for field in ["code", "comment", "blank"])
+    rows = []
+    for name, prefix in CLASSES:
+        code, comment, blank = (__value(aggregations, f"{prefix}_{field}") for field in ["code", "comment", "blank"])
+        rows.append({
+            "class": name,
+            "code": code,
+            "comment": comment,
+            "blank": blank,
+            "comment_per_code": __ratio(comment, code),
+            "blank_per_code": __ratio(blank, code),
+            "share_of_all_lines": __ratio(code + comment + blank, total)
+        })
+    return rows
+
+
+def lines_per_file_query(language_types):
+    return {"size": 0, "aggs": __sums([f"{prefix}_{field}" for _, prefix in CLASSES
+                                       for field in ["files", "code", "comment", "blank"]])}
+
+
+def lines_per_file_rows(aggregations):
+    rows = []
+    for name, prefix in CLASSES:
+        files, code, comment, blank = (__value(aggregations, f"{prefix}_{field}")
+                                       for field in ["files", "code", "comment", "blank"])
+        rows.append({
+            "class": name,
+            "files": files,
+            "code_per_file": __ratio(code, files),
+            "lines_per_file": __ratio(code + comment + blank, files)
+        })
+    return rows
+
+
+def dsl_share_by_popularity_query(language_types):
+    return {"size": 0, "query": {"term": {"kind": "popularity"}}, "aggs": {"metrics": {
+        "terms": {"field": "metric", "size": len(BUCKET_METRICS)},
+        "aggs": {"buckets": {
+            "terms": {"field": "bucket", "size": 100},
+            "aggs": __sums(["repos", "dsl_share_sum", "dsl_code", "code"])
+        }}
+    }}}
+
+
+def dsl_share_by_popularity_rows(aggregations):
+    by_metric = {bucket["key"]: bucket["buckets"]["buckets"] for bucket in aggregations["metrics"]["buckets"]}
+    rows = []
+    for metric in BUCKET_METRICS:
+        for bucket in sorted(by_metric.get(metric, []), key=lambda bucket: int(bucket["key"])):
+            repos = __value(bucket, "repos")
+            bucket_from, bucket_to = popularity_bounds(int(bucket["key"]))
+            rows.append({
+                "metric": metric,
+                "from": bucket_from,
+                "to": bucket_to,
+                "repos": repos,
+                "mean_dsl_share": __ratio(bucket["dsl_share_sum"]["value"] or 0.0, repos),
+                "dsl_code_share": __ratio(__value(bucket, "dsl_code"), __value(bucket, "code"))
+            })
+    return rows
+
+
+def dsl_by_domain_query(language_types):
+    return {"size": 0, "query": {"term": {"kind": "type"}}, "aggs": {"types": {
+        "terms": {"field": "name", "size": 1000},
+        "aggs": __sums(["repos"] + LINE_FIELDS)
+    }}}
+
+
+def dsl_by_domain_rows(aggregations):
+    rows = [{
+        "type": bucket["key"],
+        "repos": __value(bucket, "repos"),
+        "files": __value(bucket, "files"),
+        "code": __value(bucket, "code"),
+        "comment": __value(bucket, "comment"),
+        "blank": __value(bucket, "blank")
+    } for bucket in aggregations["types"]["buckets"] if GPL != bucket["key"]]
+    return sorted(rows, key=lambda row: -row["code"])
+
+
+def dsl_with_gpl_query(language_types, top_gpl=20):
+    return {"size": 0, "aggs": {"gpl": {
+        "terms": {"field": "gpl_languages", "size": top_gpl},
+        "aggs": {"types": {"terms": {"field": "dsl_types", "size": 1000}}}
+    }}}
+
+
+def dsl_with_gpl_rows(aggregations):
+    rows = []
+    for gpl in aggregations["gpl"]["buckets"]:
+        for bucket in gpl["types"]["buckets"]:
+            rows.append({
+                "gpl": gpl["key"],
+                "dsl_type": bucket["key"],
+                "repos": bucket["doc_count"],
+                "share_of_gpl_repos": __ratio(bucket["doc_count"], gpl["doc_count"])
+            })
+    return rows
+
+
+def language_construction_query(language_types):
+    names = sorted(name for name, type in language_types.items() if LANGUAGE_CONSTRUCTION == type)
+    return {"size": 0, "aggs": {"languages": {"terms": {"field": "dsl_languages", "size": 1000, "include": names}}}}
+
+
+def language_construction_rows(aggregations):
+    return [{"language": bucket["key"], "repos": bucket["doc_count"]}
+            for bucket in aggregations["languages"]["buckets"]]
+
+
+def code_share_by_license_query(language_types):
+    return {"size": 0, "aggs": {"licenses": {
+        "terms": {"field": "license.key", "size": 1000},
+        "aggs": dict(__sums(["gpl_code", "dsl_code"]), name={"terms": {"field": "license.name", "size": 1}})
+    }}}
+
+
+def code_share_by_license_rows(aggregations):
+    rows = []
+    for bucket in aggregations["licenses"]["buckets"]:
+        gpl_code, dsl_code = __value(bucket, "gpl_code"), __value(bucket, "dsl_code")
+        names = bucket["name"]["buckets"]
+        rows.append({
+            "license_key": bucket["key"],
+            "license_name": names[0]["key"] if names else bucket["key"],
+            "repos": bucket["doc_count"],
+            "gpl_code": gpl_code,
+            "dsl_code": dsl_code,
+            "dsl_code_share": __ratio(dsl_code, gpl_code + dsl_code)
+        })
+    return rows
+
+
+# Analytical tasks from docs/tasks.md: name -> (index, query body, result rows)
+REPORTS = {
+    "line_ratios": (REPOS_INDEX, line_ratios_query, line_ratios_rows),
+    "lines_per_file": (REPOS_INDEX, lines_per_file_query, lines_per_file_rows),
+    "dsl_share_by_popularity": (SUMMARY_INDEX, dsl_share_by_popularity_query, dsl_share_by_popularity_rows),
+    "dsl_by_domain": (SUMMARY_INDEX, dsl_by_domain_query, dsl_by_domain_rows),
+    "dsl_with_gpl": (REPOS_INDEX, dsl_with_gpl_query, dsl_with_gpl_rows),
+    "language_construction": (REPOS_INDEX, language_construction_query, language_construction_rows),
+    "code_share_by_license": (REPOS_INDEX, code_share_by_license_query, code_share_by_license_rows)
+}
+
+
+class ReportRunner:
+    def __init__(self, client, cache=None, refresh=False):
+        self.client = client
+        self.cache = cache
+        # Cached results are replaced without being read
+        self.refresh = refresh
+        self.generations = dict()
+        self.queries = 0
+
+
+    def __generation(self, index_name):
+        # One mapping request per index and run, uploaders change the generation when they change the index
+        if index_name not in self.generations:
+            self.generations[index_name] = index_generation(self.client, index_name)
+        return self.generations[index_name]
+
+
+    def aggregations(self, index_name, body):
+        if self.cache is None:
+            self.queries += 1
+            return self.client.search(index=index_name, body=body)["aggregations"]
+        generation = self.__generation(index_name)
+        key = query_key(index_name, body)
+        result = None if self.refresh else self.cache.get(key, generation)
+        if result is None:
+            self.queries += 1
+            result = self.client.search(index=index_name, body=body)["aggregations"]
+            self.cache.put(key, generation, result)
+        return result
+
+
+    def run(self, name, language_types):
+        index_name, query, rows = REPORTS[name]
+        return rows(self.aggregations(index_name, query(language_types)))
+
+
+def __format(value):
+    if isinstance(value, float):
+        return f"{value:.4f}"
+    return str(value)
+
+
+def print_table(name, rows):
+    print(f"== {name}")
+    if not rows:
+        print("(no rows)")
+        print()
+        return
+    fieldnames = list(rows[0].keys())
+    cells = [[__format(row[field]) for field in fieldnames] for row in rows]
+    widths = [max(len(field), *(len(line[column]) for line in cells)) for column, field in enumerate(fieldnames)]
+    print("  ".join(field.ljust(width) for field, width in zip(fieldnames, widths)))
+    print("  ".join("-" * width for width in widths))
+    for line in cells:
+        # Numbers are right aligned
+        print("  ".join(cell.rjust(width) if not isinstance(rows[0][field], str) else cell.ljust(width)
+                        for cell, width, field in zip(line, widths, fieldnames)))
+    print()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        prog="opensearch_report.py",
+        description="Run analytical task queries against OpenSearch")
+    parser.add_argument("-i", "--ip", type=str, help="OpenSearch IP")
+    parser.add_argument("-p", "--port", type=str, help="OpenSearch port")
+    parser.add_argument("-l", "--login", type=str, help="OpenSearch login")
+    parser.add_argument("-t", "--token", type=str, help="OpenSearch token")
+    parser.add_argument( "--ssl", action=BooleanOptionalAction, default=True, help="Connect over HTTPS")
+    parser.add_argument("-c", "--csv", type=str, default=DEFAULT_LANGS_CSV, help="CSV with languages info")
+    parser.add_argument("-r", "--report", type=str, action="append", choices=list(REPORTS), default=None,
+                        help="Report to run, all if not set")
+    parser.add_argument("-f", "--format", type=OutputFormat, choices=list(OutputFormat), default=OutputFormat.TABLE,
+                        help="Output format")
+    parser.add_argument( "--refresh", action=BooleanOptionalAction, default=False,
+                        help="Query OpenSearch and replace cached results")
+    add_query_cache_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    exporter = metrics_from_args(args)
+
+    client = create_client(args.ip, args.port, args.login, args.token, use_ssl=args.ssl)
+    cache = query_cache_from_args(args)
+    runner = ReportRunner(client, cache, args.refresh)
+    language_types = read_language_types(args.csv)
+    reports = {name: runner.run(name, language_types) for name in (args.report or REPORTS)}
+    if cache is not None:
+        cache.close()
+
+    if OutputFormat.JSON == args.format:
+        json.dump(reports, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        for name, rows in reports.items():
+            print_table(name, rows)
+    print(f"OpenSearch queries: {runner.queries}", file=sys.stderr)
+    exporter.stop()
@@ -1,192 +1,235 @@
 #!/usr/bin/python3
 
 
-import os
-import sys
-import json
-from csv import DictReader
-from opensearchpy import OpenSearch
+from backup_reader import BackupReader, add_reader_arguments, reader_from_args
+from opensearch_common import create_client, compress_requests, add_bulk_arguments, bulk_options_from_args, bulk_load, \
+    bulk_load_settings, bump_generation, index_operations, read_index_hashes, sync_operations, BulkOptions, \
+    LINE_FIELDS, read_language_types, read_license_names, repo_document
+from opensearch_rollup import Rollup, update_rollup, write_rollup
 from argparse import ArgumentParser, BooleanOptionalAction
+from metrics import add_metrics_arguments, metrics_from_args
 
 
-def __read_jsons(dir):
-    repos = []
-    for filename in os.listdir(dir):
-        filepath = f"{dir}/{filename}"
-        if os.path.isfile(filepath):
-            with open(filepath, "r") as jsonFile:
-                try:
-                    repos.append(json.load(jsonFile))
-                except Exception:
-                    print(f"Bad json file '{filepath}'", file=sys.stderr)
-    return repos
-
-
-def main(ip, port, login, token, backup, langs_csv, create_index, delete_index):
-    client = OpenSearch(
-        hosts = [{'host': ip, 'port': port}],
-        http_auth = (login, token),
-        use_ssl = True,
-        verify_certs = False,
-        ssl_show_warn = False
-    )
+def __documents(reader, language_types, licenses_names, present=None):
+    for json_doc in reader.repos():
+        if present is not None:
+            present.add(json_doc["full_name"])
 
-    index_name = "repos"
-    index_body = {
-        "settings": {
-            "index": {
-                "number_of_shards": 1,
-                "number_of_replicas": 0
+        # Check correctness of time fields
+        if type(json_doc["updated_at"]) != str:
+            print(f"Ignore document due to time fields: {json_doc['owner']}/{json_doc['repo']}")
+            continue
+
+        yield json_doc["full_name"], repo_document(json_doc, language_types, licenses_names)
+
+
+def __summarized(documents, summary):
+    for id, doc in documents:
+        summary.add(doc)
+        yield id, doc
+
+
+def __summarized_changes(client, index_name, operations, index_hashes, summary, batch_size=500):
+    # Replaced and deleted documents are read before the bulk requests that overwrite them are sent
+    batch = []
+    for operation in operations:
+        batch.append(operation)
+        if len(batch) < batch_size:
+            continue
+        yield from __summarize_batch(client, index_name, batch, index_hashes, summary)
+        batch = []
+    yield from __summarize_batch(client, index_name, batch, index_hashes, summary)
+
+
+def __summarize_batch(client, index_name, batch, index_hashes, summary):
+    ids = [next(iter(action.values()))["_id"] for action, _ in batch]
+    old_ids = [id for id in ids if id in index_hashes]
+    if old_ids:
+        for old_doc in client.mget(index=index_name, body={"ids": old_ids})["docs"]:
+            if old_doc.get("found"):
+                summary.add(old_doc["_source"], -1)
+    for _, doc in batch:
+        if doc is not None:
+            summary.add(doc)
+    yield from batch
+
+
+def index_body(nested=False):
+    languages = {
+        "properties": {
+            "language": {
+                "properties": {
+                    "name": {
+                        "type": "keyword"
+                    },
+                    "type": {
+                        "type": "keyword"
+                    }
+                }
+            },
+            "files": {
+                "type": "integer"
+            },
+            "blank": {
+                "type": "long"
+            },
+            "comment": {
+                "type": "long"
             },
+            "code": {
+                "type": "long"
+            }
+        }
+    }
+    if nested:
+        # Nested objects keep the language name and type of one entry together in queries
+        languages["type"] = "nested"
+    properties = {
+        "owner": {
+            "type": "keyword"
         },
-        "mappings": {
+        "repo": {
+            "type": "keyword"
+        },
+        "full_name": {
+            "type": "keyword"
+        },
+        "url": {
+            "type": "keyword"
+        },
+        "clone_url": {
+            "type": "keyword"
+        },
+        "size": {
+            "type": "long"
+        },
+        "forks": {
+            "type": "integer"
+        },
+        "stargazers": {
+            "type": "integer"
+        },
+        "watchers": {
+            "type": "integer"
+        },
+        "pushed_at": {
+            "type": "date",
+            "format": "date_optional_time"
+        },
+        "created_at": {
+            "type": "date",
+            "format": "date_optional_time"
+        },
+        "updated_at": {
+            "type": "date",
+            "format": "date_optional_time"
+        },
+        "license": {
             "properties": {
-                "owner": {
-                    "type": "keyword"
-                },
-                "repo": {
-                    "type": "keyword"
-                },
-                "full_name": {
+                "key": {
                     "type": "keyword"
                 },
-                "url": {
+                "name": {
                     "type": "keyword"
-                },
-                "clone_url": {
-                    "type": "keyword"
-                },
-                "size": {
-                    "type": "long"
-                },
-                "forks": {
-                    "type": "integer"
-                },
-                "stargazers": {
-                    "type": "integer"
-                },
-                "watchers": {
-                    "type": "integer"
-                },
-                "pushed_at": {
-                    "type": "date",
-                    "format": "date_optional_time"
-                },
-                "created_at": {
-                    "type": "date",
-                    "format": "date_optional_time"
-                },
-                "updated_at": {
-                    "type": "date",
-                    "format": "date_optional_time"
-                },
-                "license": {
-                    "properties": {
-                        "key": {
-                            "type": "keyword"
-                        },
-                        "name": {
-                            "type": "keyword"
-                        }
-                    }
-                },
-                "language": {
-                    "type": "keyword"
-                },
-                "languages": {
-                    "properties": {
-                        "language": {
-                            "properties": {
-                                "name": {
-                                    "type": "keyword"
-                                },
-                                "type": {
-                                    "type": "keyword"
-                                }
-                            }
-                        },
-                        "files": {
-                            "type": "integer"
-                        },
-                        "blank": {
-                            "type": "long"
-                        },
-                        "comment": {
-                            "type": "long"
-                        },
-                        "code": {
-                            "type": "long"
-                        }
-                    }
                 }
             }
+        },
+        "language": {
+            "type": "keyword"
+        },
+        "content_hash": {
+            "type": "keyword"
+        },
+        "languages": languages,
+        "dsl_share": {
+            "type": "float"
+        },
+        "dsl_types": {
+            "type": "keyword"
+        },
+        "gpl_languages": {
+            "type": "keyword"
+        },
+        "dsl_languages": {
+            "type": "keyword"
         }
     }
+    for language_class in ["gpl", "dsl"]:
+        for field in LINE_FIELDS:
+            properties[f"{language_class}_{field}"] = {"type": "integer" if "files" == field else "long"}
+    return {
+        "settings": {
+            "index": {
+                "number_of_shards": 1,
+                "number_of_replicas": 0
+            },
+        },
+        "mappings": {
+            "properties": properties
+        }
+    }
+
+
+def main(ip, port, login, token, backup, langs_csv, create_index, delete_index, bulk_options=None, reader=None,
+         sync=False, use_ssl=True, nested=False, rollup=False):
+    client = create_client(ip, port, login, token, compress_requests(bulk_options), use_ssl)
 
+    index_name = "repos"
     if delete_index:
         response = client.indices.delete(index_name)
         print(f"Deleting index: {response}")
 
     if create_index:
-        response = client.indices.create(index_name, body=index_body)
+        response = client.indices.create(index_name, body=index_body(nested))
         print(f"Creating index: {response}")
 
-    language_types = dict()
-    with open(langs_csv, 'r') as csv_file:
-        reader = DictReader(csv_file)
-        for row in reader:
-            language_types[row["name"]] = row["type"]
-
-    licenses_names = dict()
-    licenses_dir = f"{backup}/licenses/"
-    licenses_json = __read_jsons(licenses_dir)
-    for license_json in licenses_json:
-        licenses_names[license_json["key"]] = license_json["name"]
-    licenses_names["No license"] = "Без лицензии"
-    licenses_names["other"] = "Нестандартная"
-
-    parent_dir = f"{backup}/repos/"
-    repo_count = 0
-    for subdir in os.listdir(parent_dir):
-        subdirPath = f"{parent_dir}/{subdir}"
-        if os.path.isdir(subdirPath):
-            jsons = __read_jsons(subdirPath)
-            for json_doc in jsons:
-                # Check correctness of time fields
-                if type(json_doc["updated_at"]) != str:
-                    print(f"Ignore document due to time fields: {json_doc['owner']}/{json_doc['repo']}")
-                    continue
-
-                # Correct languages data type
-                languagesDict = json_doc["languages"]
-                languagesArray = []
-                for language, info in languagesDict.items():
-                    arrayInfo = info.copy()
-                    arrayInfo["language"] = {
-                        "name": language,
-                        "type": language_types[language] if language in language_types else "GPL"
-                    }
-                    languagesArray.append(arrayInfo)
-                json_doc["languages"] = languagesArray
-
-                # Correct license
-                license_key = json_doc["license_key"]
-                del json_doc["license_key"]
-                json_doc["license"] = {
-                    "key": license_key,
-                    "name": licenses_names[license_key]
-                }
+    language_types = read_language_types(langs_csv)
+
+    if reader is None:
+        reader = BackupReader(backup)
+
+    licenses_names = read_license_names(reader)
+
+    if sync:
+        index_hashes = read_index_hashes(client, index_name)
+        present = set()
+        documents = __documents(reader, language_types, licenses_names, present)
+        operations = sync_operations(index_name, documents, index_hashes, present)
+        summary = Rollup()
+        if rollup:
+            operations = __summarized_changes(client, index_name, operations, index_hashes, summary)
+        bulk_load(client, operations, bulk_options or BulkOptions(500, 10 * 1024 * 1024, 4))
+        client.indices.refresh(index=index_name)
+        bump_generation(client, index_name)
+        if rollup:
+            update_rollup(client, summary, bulk_options)
+        reader.report_errors()
+        return
 
-                id = json_doc["full_name"]
-                response = client.index(
-                    index = index_name,
-                    body = json_doc,
-                    id = id,
-                    refresh = False
-                )
-                print(f"Adding document: {response}")
-                repo_count += 1
+    documents = __documents(reader, language_types, licenses_names)
+    summary = Rollup()
+    if rollup:
+        documents = __summarized(documents, summary)
+    if bulk_options is not None:
+        with bulk_load_settings(client, index_name):
+            repo_count, _ = bulk_load(client, index_operations(index_name, documents), bulk_options)
+    else:
+        repo_count = 0
+        for id, json_doc in documents:
+            response = client.index(
+                index = index_name,
+                body = json_doc,
+                id = id,
+                refresh = False
+            )
+            print(f"Adding document: {response}")
+            repo_count += 1
     print(f"Added repos: {repo_count}")
+    bump_generation(client, index_name)
+    if rollup:
+        # The index was created empty, so the summary of the uploaded documents replaces the previous one
+        print(f"Summary rows: {write_rollup(client, summary, bulk_options)}")
+    reader.report_errors()
 
 
 if __name__ == "__main__":
@@ -199,8 +242,24 @@ if __name__ == "__main__":
     parser.add_argument("-p", "--port", type=str, help="OpenSearch port")
     parser.add_argument("-l", "--login", type=str, help="OpenSearch login")
     parser.add_argument("-t", "--token", type=str, help="OpenSearch token")
+    parser.add_argument( "--ssl", action=BooleanOptionalAction, default=True, help="Connect over HTTPS")
     parser.add_argument( "--create", action=BooleanOptionalAction, default=False, help="Create index or not")
     parser.add_argument( "--delete", action=BooleanOptionalAction, default=False, help="Delete index or not")
+    parser.add_argument( "--nested", action=BooleanOptionalAction, default=False,
+                        help="Map languages as nested objects when creating index")
+    parser.add_argument( "--sync", action=BooleanOptionalAction, default=False,
+                        help="Send only new and changed documents and delete removed ones")
+    parser.add_argument( "--rollup", action=BooleanOptionalAction, default=False,
+                        help="Update repos_summary index with uploaded documents (with --create or --sync)")
+    add_bulk_arguments(parser)
+    add_reader_arguments(parser)
+    add_metrics_arguments(parser)
     args = parser.parse_args()
+    if args.rollup and not (args.create or args.sync):
+        parser.error("--rollup needs --create or --sync, otherwise replaced documents would be counted twice")
+    exporter = metrics_from_args(args)
 
-    main(args.ip, args.port, args.login, args.token, args.backup, args.csv, args.create, args.delete)
+    main(args.ip, args.port, args.login, args.token, args.backup, args.csv, args.create, args.delete,
+         bulk_options_from_args(args), reader_from_args(args.backup, args), args.sync, args.ssl, args.nested,
+         args.rollup)
+    exporter.stop()
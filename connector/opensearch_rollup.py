@@ -0,0 +1,269 @@
+#!/usr/bin/python3
+
+
+import sys
+from argparse import ArgumentParser, BooleanOptionalAction
+from collections import Counter
+from enum import Enum
+from opensearchpy import helpers
+from backup_reader import add_reader_arguments, reader_from_args
+from opensearch_common import create_client, compress_requests, add_bulk_arguments, bulk_options_from_args, bulk_load, \
+    bump_generation, index_operations, read_index_hashes, BulkOptions, BUCKET_METRICS, LINE_FIELDS, derived_fields, \
+    popularity_bounds, popularity_bucket, read_language_types, read_license_names, repo_document
+from metrics import add_metrics_arguments, metrics_from_args
+
+
+class RollupSource(Enum):
+    BACKUP = "backup"
+    INDEX = "index"
+
+
+    def __str__(self):
+        return self.value
+
+
+SUMMARY_INDEX = "repos_summary"
+REPOS_INDEX = "repos"
+
+# kind -> counters of the row
+COUNTERS = {
+    "class": ["repos"] + LINE_FIELDS,
+    "type": ["repos"] + LINE_FIELDS,
+    "popularity": ["repos", "dsl_share_sum", "dsl_code", "code"],
+    "gpl": ["repos"],
+    "cooccurrence": ["repos"],
+    "license": ["repos", "gpl_code", "dsl_code", "code"]
+}
+
+# kind -> (ratio field, numerator, denominator) kept up to date after every change of the counters
+RATIOS = {
+    "class": [("comment_per_code", "comment", "code"), ("blank_per_code", "blank", "code"),
+              ("code_per_file", "code", "files")],
+    "type": [("comment_per_code", "comment", "code"), ("blank_per_code", "blank", "code"),
+             ("code_per_file", "code", "files")],
+    "popularity": [("mean_dsl_share", "dsl_share_sum", "repos"), ("dsl_code_share", "dsl_code", "code")],
+    "gpl": [],
+    "cooccurrence": [],
+    "license": [("dsl_code_share", "dsl_code", "code")]
+}
+
+# Counters are added in place, so uploaders change the summary without reading the repos index.
+# A row no repository contributes to any more is removed.
+UPDATE_SCRIPT = """
+for (entry in params.add.entrySet()) {
+    def value = ctx._source[entry.getKey()];
+    ctx._source[entry.getKey()] = (value == null ? 0 : value) + entry.getValue();
+}
+for (ratio in params.ratios) {
+    def numerator = ctx._source[ratio[1]];
+    def denominator = ctx._source[ratio[2]];
+    ctx._source[ratio[0]] = denominator == null || denominator == 0 ? 0.0
+        : (double) (numerator == null ? 0 : numerator) / denominator;
+}
+if (ctx._source.repos <= 0) {
+    ctx.op = 'delete';
+}
+"""
+
+
+def summary_index_body():
+    properties = {field: {"type": "keyword"}
+                  for field in ["kind", "name", "metric", "gpl", "dsl_type", "license_key", "license_name"]}
+    properties.update({field: {"type": "long"}
+                       for field in ["bucket", "from", "to", "repos", "gpl_code", "dsl_code"] + LINE_FIELDS})
+    properties.update({field: {"type": "double"} for field in ["dsl_share_sum"]})
+    for ratios in RATIOS.values():
+        properties.update({ratio: {"type": "double"} for ratio, _, _ in ratios})
+    return {
+        "settings": {
+            "index": {
+                "number_of_shards": 1,
+                "number_of_replicas": 0
+            },
+        },
+        "mappings": {
+            "properties": properties
+        }
+    }
+
+
+class Rollup:
+    def __init__(self):
+        # row id -> (key fields, counters)
+        self.rows = dict()
+
+
+    def __row(self, id, kind, **keys):
+        row = self.rows.get(id)
+        if row is None:
+            row = self.rows[id] = (dict(kind=kind, **keys), Counter({counter: 0 for counter in COUNTERS[kind]}))
+        return row[1]
+
+
+    def add(self, doc, sign=1):
+        # doc is an index document, documents uploaded before the derived fields existed get them here
+        if "dsl_share" not in doc:
+            doc = dict(doc, **derived_fields(doc["languages"]))
+        for language_class in ["gpl", "dsl"]:
+            counters = self.__row(f"class:{language_class.upper()}", "class", name=language_class.upper())
+            counters["repos"] += sign if doc[f"{language_class}_languages"] else 0
+            for field in LINE_FIELDS:
+                counters[field] += sign * doc[f"{language_class}_{field}"]
+
+        types = dict()
+        for info in doc["languages"]:
+            totals = types.setdefault(info["language"]["type"], Counter())
+            for field in LINE_FIELDS:
+                totals[field] += info[field]
+        for type, totals in types.items():
+            counters = self.__row(f"type:{type}", "type", name=type)
+            counters["repos"] += sign
+            for field in LINE_FIELDS:
+                counters[field] += sign * totals[field]
+
+        code = doc["gpl_code"] + doc["dsl_code"]
+        for metric in BUCKET_METRICS:
+            bucket = popularity_bucket(doc[metric])
+            bucket_from, bucket_to = popularity_bounds(bucket)
+            counters = self.__row(f"popularity:{metric}:{bucket}", "popularity", metric=metric, bucket=bucket,
+                                  **{"from": bucket_from, "to": bucket_to})
+            counters["repos"] += sign
+            counters["dsl_share_sum"] += sign * doc["dsl_share"]
+            counters["dsl_code"] += sign * doc["dsl_code"]
+            counters["code"] += sign * code
+
+        for gpl in doc["gpl_languages"]:
+            self.__row(f"gpl:{gpl}", "gpl", gpl=gpl)["repos"] += sign
+            for dsl_type in doc["dsl_types"]:
+                counters = self.__row(f"cooccurrence:{gpl}:{dsl_type}", "cooccurrence", gpl=gpl, dsl_type=dsl_type)
+                counters["repos"] += sign
+
+        license = doc["license"]
+        counters = self.__row(f"license:{license['key']}", "license", license_key=license["key"],
+                              license_name=license["name"])
+        counters["repos"] += sign
+        counters["gpl_code"] += sign * doc["gpl_code"]
+        counters["dsl_code"] += sign * doc["dsl_code"]
+        counters["code"] += sign * code
+
+
+    def documents(self):
+        for id, (keys, counters) in self.rows.items():
+            if counters["repos"] <= 0:
+                continue
+            doc = dict(keys)
+            doc.update(counters)
+            for ratio, numerator, denominator in RATIOS[keys["kind"]]:
+                doc[ratio] = doc[numerator] / doc[denominator] if doc[denominator] else 0.0
+            yield id, doc
+
+
+    def update_operations(self, index_name=SUMMARY_INDEX):
+        for id, (keys, counters) in self.rows.items():
+            add = {field: value for field, value in counters.items() if value}
+            if not add:
+                continue
+            source = {
+                "script": {
+                    "source": UPDATE_SCRIPT,
+                    "lang": "painless",
+                    "params": {"add": add, "ratios": RATIOS[keys["kind"]]}
+                },
+                "scripted_upsert": True,
+                # A new row has every counter and ratio, also the ones this change leaves at zero
+                "upsert": dict(keys, **{counter: 0 for counter in COUNTERS[keys["kind"]]},
+                               **{ratio: 0.0 for ratio, _, _ in RATIOS[keys["kind"]]})
+            }
+            yield {"update": {"_index": index_name, "_id": id, "retry_on_conflict": 3}}, source
+
+
+def ensure_summary_index(client):
+    if not client.indices.exists(index=SUMMARY_INDEX):
+        response = client.indices.create(SUMMARY_INDEX, body=summary_index_body())
+        print(f"Creating index: {response}")
+
+
+def write_rollup(client, rollup, bulk_options=None):
+    # Replaces the whole summary, rows no repository contributes to are deleted
+    ensure_summary_index(client)
+    existing = read_index_hashes(client, SUMMARY_INDEX)
+    documents = dict(rollup.documents())
+
+    def operations():
+        yield from index_operations(SUMMARY_INDEX, documents.items())
+        for id in existing:
+            if id not in documents:
+                yield {"delete": {"_index": SUMMARY_INDEX, "_id": id}}, None
+
+    bulk_load(client, operations(), bulk_options or BulkOptions(500, 10 * 1024 * 1024, 4))
+    client.indices.refresh(index=SUMMARY_INDEX)
+    bump_generation(client, SUMMARY_INDEX)
+    return len(documents)
+
+
+def update_rollup(client, rollup, bulk_options=None):
+    # Every row gets a single update, so parallel chunks never update the same row
+    ensure_summary_index(client)
+    bulk_load(client, rollup.update_operations(), bulk_options or BulkOptions(500, 10 * 1024 * 1024, 4))
+    client.indices.refresh(index=SUMMARY_INDEX)
+    bump_generation(client, SUMMARY_INDEX)
+
+
+def index_documents(client):
+    for hit in helpers.scan(client, index=REPOS_INDEX, size=1000):
+        yield hit["_source"]
+
+
+def backup_documents(reader, language_types):
+    licenses_names = read_license_names(reader)
+    for json_doc in reader.repos():
+        # The same documents the repos uploader sends
+        if type(json_doc["updated_at"]) != str:
+            continue
+        yield repo_document(json_doc, language_types, licenses_names)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        prog="opensearch_rollup.py",
+        description="Compute analytical summaries of repos and write them to repos_summary index")
+    parser.add_argument("-s", "--source", type=RollupSource, choices=list(RollupSource), default=RollupSource.BACKUP,
+                        help="Compute summaries from backup or from repos index")
+    parser.add_argument("-b", "--backup", type=str, help="Backup directory")
+    parser.add_argument("-c", "--csv", type=str, help="CSV with languages info")
+    parser.add_argument("-i", "--ip", type=str, help="OpenSearch IP")
+    parser.add_argument("-p", "--port", type=str, help="OpenSearch port")
+    parser.add_argument("-l", "--login", type=str, help="OpenSearch login")
+    parser.add_argument("-t", "--token", type=str, help="OpenSearch token")
+    parser.add_argument( "--ssl", action=BooleanOptionalAction, default=True, help="Connect over HTTPS")
+    parser.add_argument( "--delete", action=BooleanOptionalAction, default=False, help="Delete summary index first")
+    add_bulk_arguments(parser)
+    add_reader_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    exporter = metrics_from_args(args)
+
+    bulk_options = bulk_options_from_args(args)
+    client = create_client(args.ip, args.port, args.login, args.token, compress_requests(bulk_options), args.ssl)
+    if args.delete:
+        response = client.indices.delete(SUMMARY_INDEX)
+        print(f"Deleting index: {response}")
+
+    rollup = Rollup()
+    repo_count = 0
+    if RollupSource.BACKUP == args.source:
+        if args.backup is None or args.csv is None:
+            print("Backup directory and languages CSV are required with backup source", file=sys.stderr)
+            sys.exit(1)
+        reader = reader_from_args(args.backup, args)
+        documents = backup_documents(reader, read_language_types(args.csv))
+    else:
+        reader = None
+        documents = index_documents(client)
+    for doc in documents:
+        rollup.add(doc)
+        repo_count += 1
+    if reader is not None:
+        reader.report_errors()
+    print(f"Summarized repos: {repo_count}, summary rows: {write_rollup(client, rollup, bulk_options)}")
+    exporter.stop()
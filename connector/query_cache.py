@@ -0,0 +1,70 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import metrics
+
+
+def query_key(index_name, body):
+    return hashlib.sha256(json.dumps([index_name, body], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class QueryCache:
+    schema = [
+        "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, generation TEXT, result TEXT NOT NULL, "
+        "stored_at REAL NOT NULL) WITHOUT ROWID"
+    ]
+
+
+    def __init__(self, path, ttl=24 * 3600):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Indices without a generation are only invalidated by the TTL
+        self.ttl = ttl
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        for statement in QueryCache.schema:
+            self.connection.execute(statement)
+        self.connection.execute("DELETE FROM results WHERE stored_at < ?", (time.time() - self.ttl,))
+        self.connection.commit()
+
+
+    def get(self, key, generation):
+        row = self.connection.execute("SELECT generation, result, stored_at FROM results WHERE key = ?",
+                                      (key,)).fetchone()
+        if row is None:
+            metrics.query_cache_requests.inc(result="miss")
+            return None
+        stored_generation, result, stored_at = row
+        if stored_generation != generation:
+            metrics.query_cache_requests.inc(result="invalidated")
+            return None
+        if stored_at < time.time() - self.ttl:
+            metrics.query_cache_requests.inc(result="expired")
+            return None
+        metrics.query_cache_requests.inc(result="hit")
+        return json.loads(result)
+
+
+    def put(self, key, generation, result):
+        self.connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                                (key, generation, json.dumps(result), time.time()))
+        self.connection.commit()
+
+
+    def close(self):
+        self.connection.close()
+
+
+def add_query_cache_arguments(parser):
+    parser.add_argument("--cache", type=str, default=None, help="Query result cache file")
+    parser.add_argument("--cache-ttl", type=int, default=24,
+                        help="Hours after which a cached result is queried again even if the index is unchanged")
+
+
+def query_cache_from_args(args):
+    if args.cache is None:
+        return None
+    return QueryCache(args.cache, args.cache_ttl * 3600)
@@ -0,0 +1,301 @@
+#!/usr/bin/python3
+
+
+from argparse import ArgumentParser
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+import gzip
+import hashlib
+import json
+import os
+import sys
+import zlib
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backup_reader import add_reader_arguments, reader_from_args
+from backup_storage import StorageType, DirectoryStorage, open_storage
+
+
+ARCHIVE_VERSION = 1
+MANIFEST = "manifest.json"
+
+IndexEntry = namedtuple("IndexEntry", ["kind", "key", "segment", "offset", "length", "line", "hash"])
+
+# kind -> (reader method, storage method writing the record, record key)
+KINDS = {
+    "langs": ("languages", "add_language", lambda doc: doc["name"]),
+    "licenses": ("licenses", "add_license", lambda doc: doc["key"]),
+    "skipped": ("skipped", "add_skipped", lambda doc: f"{doc['owner']}/{doc['repo']}"),
+    "repos": ("repos", "add_repo", lambda doc: f"{doc['owner']}/{doc['repo']}")
+}
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def read_manifest(archive_dir):
+    path = f"{archive_dir}/{MANIFEST}"
+    if not os.path.exists(path):
+        return {"version": ARCHIVE_VERSION, "segments": []}
+    with open(path, "r") as manifestFile:
+        manifest = json.load(manifestFile)
+    if ARCHIVE_VERSION != manifest.get("version"):
+        raise ArchiveError(f"Unsupported archive version {manifest.get('version')}")
+    return manifest
+
+
+def write_manifest(archive_dir, manifest):
+    # The manifest is the commit point: segments it does not list are leftovers of an interrupted run
+    tmp_path = f"{archive_dir}/{MANIFEST}.tmp"
+    with open(tmp_path, "w") as manifestFile:
+        json.dump(manifest, manifestFile)
+    os.replace(tmp_path, f"{archive_dir}/{MANIFEST}")
+
+
+def read_block(archive_dir, segment, offset, length):
+    with open(f"{archive_dir}/{segment}.jsonl.gz", "rb") as segmentFile:
+        segmentFile.seek(offset)
+        data = segmentFile.read(length)
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS).splitlines()
+
+
+class Archive:
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+        self.segments = read_manifest(archive_dir)["segments"]
+        self.__entries = None
+
+
+    def __read_index(self, segment):
+        with open(f"{self.archive_dir}/{segment}.idx", "r") as indexFile:
+            for line in indexFile:
+                kind, key, offset, length, position, hash = line.rstrip("\n").split("\t")
+                yield IndexEntry(kind, key, segment, int(offset), int(length), int(position), hash)
+
+
+    def entries(self):
+        # Records of later segments replace the ones of earlier segments
+        if self.__entries is None:
+            self.__entries = dict()
+            for segment in self.segments:
+                for entry in self.__read_index(segment):
+                    self.__entries[(entry.kind, entry.key)] = entry
+        return self.__entries
+
+
+    def get(self, kind, key):
+        entry = self.entries().get((kind, key))
+        if entry is None:
+            return None
+        lines = read_block(self.archive_dir, entry.segment, entry.offset, entry.length)
+        return json.loads(lines[entry.line])
+
+
+    def blocks(self):
+        # (segment, offset) -> (length, [(line, kind)]) of the records still live in the block
+        blocks = dict()
+        for entry in self.entries().values():
+            length, lines = blocks.setdefault((entry.segment, entry.offset), (entry.length, []))
+            lines.append((entry.line, entry.kind))
+        return blocks
+
+
+class ArchiveWriter:
+    def __init__(self, archive_dir, block_bytes=1024 * 1024, segment_bytes=256 * 1024 * 1024, level=6, threads=None):
+        os.makedirs(archive_dir, exist_ok=True)
+        self.archive_dir = archive_dir
+        self.block_bytes = block_bytes
+        self.segment_bytes = segment_bytes
+        self.level = level
+        self.threads = threads or os.cpu_count() or 1
+        self.manifest = read_manifest(archive_dir)
+        # Unchanged records are not written again when appending
+        self.hashes = {key: entry.hash for key, entry in Archive(archive_dir).entries().items()}
+        self.block = []
+        self.block_records = []
+        self.block_size = 0
+        # zlib releases the GIL, blocks are compressed in threads while the reader keeps decoding the backup
+        self.executor = ThreadPoolExecutor(max_workers=self.threads)
+        self.pending = deque()
+        self.segment = None
+        self.segment_file = None
+        self.segment_index = []
+        self.counts = Counter()
+
+
+    def add(self, kind, doc):
+        key = KINDS[kind][2](doc)
+        line = json.dumps(doc).encode("utf-8") + b"\n"
+        hash = hashlib.blake2b(line, digest_size=8).hexdigest()
+        if self.hashes.get((kind, key)) == hash:
+            self.counts["unchanged"] += 1
+            return False
+        self.hashes[(kind, key)] = hash
+        self.block.append(line)
+        self.block_records.append((kind, key, hash))
+        self.block_size += len(line)
+        self.counts[kind] += 1
+        if self.block_size >= self.block_bytes:
+            self.__flush_block()
+        return True
+
+
+    def __flush_block(self):
+        if not self.block:
+            return
+        # Every block is a complete gzip member, so a whole segment is still a valid gzip file
+        future = self.executor.submit(gzip.compress, b"".join(self.block), self.level, mtime=0)
+        self.pending.append((future, self.block_records))
+        self.block = []
+        self.block_records = []
+        self.block_size = 0
+        while len(self.pending) > 2 * self.threads:
+            self.__write_block(*self.pending.popleft())
+
+
+    def __start_segment(self):
+        self.segment = f"segment-{len(self.manifest['segments']):05d}"
+        self.segment_file = open(f"{self.archive_dir}/{self.segment}.jsonl.gz", "wb")
+        self.segment_index = []
+
+
+    def __finish_segment(self):
+        if self.segment is None:
+            return
+        self.segment_file.close()
+        with open(f"{self.archive_dir}/{self.segment}.idx", "w") as indexFile:
+            for entry in self.segment_index:
+                indexFile.write("\t".join(str(value) for value in entry) + "\n")
+        self.manifest["segments"].append(self.segment)
+        write_manifest(self.archive_dir, self.manifest)
+        self.segment = None
+
+
+    def __write_block(self, future, records):
+        data = future.result()
+        if self.segment is not None and self.segment_file.tell() >= self.segment_bytes:
+            self.__finish_segment()
+        if self.segment is None:
+            self.__start_segment()
+        offset = self.segment_file.tell()
+        self.segment_file.write(data)
+        for line, (kind, key, hash) in enumerate(records):
+            self.segment_index.append((kind, key, offset, len(data), line, hash))
+
+
+    def close(self):
+        self.__flush_block()
+        while self.pending:
+            self.__write_block(*self.pending.popleft())
+        self.__finish_segment()
+        self.executor.shutdown()
+        write_manifest(self.archive_dir, self.manifest)
+        return self.counts
+
+
+def pack(reader, writer):
+    for kind, (method, _, _) in KINDS.items():
+        for doc in getattr(reader, method)():
+            writer.add(kind, doc)
+    return writer.close()
+
+
+def unpack_blocks(archive_dir, blocks, backup_dir, write):
+    # Directory backups are written by the workers, catalog records go back to the single writing process
+    storage = DirectoryStorage(backup_dir) if write else None
+    docs = []
+    count = 0
+    for segment, offset, length, lines in blocks:
+        block = read_block(archive_dir, segment, offset, length)
+        for line, kind in lines:
+            doc = json.loads(block[line])
+            if storage is not None:
+                getattr(storage, KINDS[kind][1])(doc)
+            else:
+                docs.append((kind, doc))
+            count += 1
+    return count, docs
+
+
+def unpack(archive_dir, backup_dir, storage_type=StorageType.DIRECTORY, processes=None, blocks_per_task=16):
+    processes = processes or os.cpu_count() or 1
+    archive = Archive(archive_dir)
+    blocks = [(segment, offset, length, lines) for (segment, offset), (length, lines) in archive.blocks().items()]
+    blocks.sort()
+    tasks = [blocks[start:start + blocks_per_task] for start in range(0, len(blocks), blocks_per_task)]
+    directory = StorageType.SQLITE != storage_type
+    storage = open_storage(backup_dir, storage_type)
+    count = 0
+
+    def collect(future):
+        task_count, docs = future.result()
+        for kind, doc in docs:
+            getattr(storage, KINDS[kind][1])(doc)
+        return task_count
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        running = set()
+        for task in tasks:
+            if len(running) >= 2 * processes:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                count += sum(collect(future) for future in done)
+            running.add(executor.submit(unpack_blocks, archive_dir, task, backup_dir, directory))
+        while running:
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            count += sum(collect(future) for future in done)
+    storage.close()
+    return count
+
+
+def __add_writer_arguments(parser):
+    parser.add_argument("-b", "--backup", type=str, help="Backup directory")
+    parser.add_argument("-a", "--archive", type=str, help="Archive directory")
+    parser.add_argument("--block-size", type=int, default=1024, help="Uncompressed block size in KB")
+    parser.add_argument("--segment-size", type=int, default=256, help="Segment size limit in MB")
+    parser.add_argument("--level", type=int, default=6, help="gzip compression level")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="Compressing threads")
+    add_reader_arguments(parser)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        prog="backup_archive.py",
+        description="Pack backup to compressed indexed archive and unpack it back")
+    commands = parser.add_subparsers(dest="command", required=True)
+    __add_writer_arguments(commands.add_parser("pack", help="Pack backup to a new archive"))
+    __add_writer_arguments(commands.add_parser("append", help="Append new and changed records as new segments"))
+    unpack_parser = commands.add_parser("unpack", help="Unpack archive to backup")
+    unpack_parser.add_argument("-a", "--archive", type=str, help="Archive directory")
+    unpack_parser.add_argument("-b", "--backup", type=str, help="Backup directory")
+    unpack_parser.add_argument("--storage", type=StorageType, choices=list(StorageType),
+                               default=StorageType.DIRECTORY, help="Backup storage backend")
+    unpack_parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="Unpacking processes")
+    get_parser = commands.add_parser("get", help="Print single record without unpacking")
+    get_parser.add_argument("-a", "--archive", type=str, help="Archive directory")
+    get_parser.add_argument("-k", "--kind", type=str, choices=list(KINDS), default="repos", help="Record kind")
+    get_parser.add_argument("key", type=str, help="owner/repo, language name or license key")
+    args = parser.parse_args()
+
+    try:
+        if args.command in ("pack", "append"):
+            if "pack" == args.command and read_manifest(args.archive)["segments"]:
+                raise ArchiveError(f"Archive {args.archive} is not empty, use append")
+            reader = reader_from_args(args.backup, args)
+            writer = ArchiveWriter(args.archive, args.block_size * 1024, args.segment_size * 1024 * 1024,
+                                   args.level, args.threads)
+            counts = pack(reader, writer)
+            reader.report_errors()
+            for name, count in counts.items():
+                print(f"Packed {name}: {count}")
+        elif "unpack" == args.command:
+            print(f"Unpacked records: {unpack(args.archive, args.backup, args.storage, args.processes)}")
+        else:
+            doc = Archive(args.archive).get(args.kind, args.key)
+            if doc is None:
+                print(f"No {args.kind} record {args.key}", file=sys.stderr)
+                sys.exit(1)
+            print(json.dumps(doc, indent=2))
+    except ArchiveError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
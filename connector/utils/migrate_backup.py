@@ -0,0 +1,46 @@
+#!/usr/bin/python3
+
+
+from argparse import ArgumentParser
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backup_storage import StorageType, open_storage
+
+
+def migrate(source, destination):
+    counts = dict()
+    for name, read, write in [
+        ("langs", source.languages, destination.add_language),
+        ("licenses", source.licenses, destination.add_license),
+        ("skipped", source.skipped, destination.add_skipped),
+        ("repos", source.repos, destination.add_repo)
+    ]:
+        counts[name] = 0
+        for doc in read():
+            write(doc)
+            counts[name] += 1
+        destination.commit()
+    return counts
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        prog="migrate_backup.py",
+        description="Copy backup between storage backends")
+    parser.add_argument("-s", "--source", type=str, help="Source backup directory")
+    parser.add_argument("-f", "--from", dest="source_type", type=StorageType, choices=list(StorageType),
+                        default=StorageType.DIRECTORY, help="Source storage backend")
+    parser.add_argument("-d", "--destination", type=str, help="Destination backup directory")
+    parser.add_argument("-t", "--to", dest="destination_type", type=StorageType, choices=list(StorageType),
+                        default=StorageType.SQLITE, help="Destination storage backend")
+    args = parser.parse_args()
+
+    source = open_storage(args.source, args.source_type)
+    destination = open_storage(args.destination, args.destination_type)
+    counts = migrate(source, destination)
+    source.close()
+    destination.close()
+    for name, count in counts.items():
+        print(f"Migrated {name}: {count}")
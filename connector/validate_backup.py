@@ -0,0 +1,301 @@
+#!/usr/bin/python3
+
+
+import json
+import os
+import sys
+from argparse import ArgumentParser, BooleanOptionalAction
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from backup_storage import StorageType, DirectoryStorage, SqliteStorage, open_storage
+
+
+Defect = namedtuple("Defect", ["kind", "path", "owner", "repo", "field", "defect", "detail", "repair", "fixed"])
+
+# How a defect can be repaired: in place, with a GitHub API request or only by crawling the repository again
+LOCAL = "local"
+API = "api"
+NONE = "none"
+
+TIME = "time"
+LANGUAGE_FIELDS = ["files", "blank", "comment", "code"]
+SCHEMAS = {
+    "repos": {
+        "owner": str,
+        "repo": str,
+        "full_name": str,
+        "url": str,
+        "clone_url": str,
+        "size": int,
+        "forks": int,
+        "stargazers": int,
+        "watchers": int,
+        "pushed_at": TIME,
+        "created_at": TIME,
+        "updated_at": TIME,
+        "license_key": str,
+        "language": (str, type(None)),
+        "languages": dict
+    },
+    "skipped": {
+        "owner": str,
+        "repo": str,
+        "full_name": str,
+        "size": int,
+        "reason": str
+    },
+    "langs": {
+        "name": str,
+        "type": str
+    },
+    "licenses": {
+        "key": str,
+        "name": str
+    }
+}
+
+
+def __valid_time(value):
+    if type(value) != str:
+        return False
+    try:
+        datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return False
+    return True
+
+
+def __check_languages(languages, report):
+    changed = False
+    for language, info in languages.items():
+        if type(info) != dict:
+            report(f"languages.{language}", "type", f"expected object, got {type(info).__name__}", NONE)
+            continue
+        if "blank " in info:
+            report(f"languages.{language}", "blank_key", "cloc blank count stored under \"blank \"", LOCAL)
+            # A record with both keys keeps "blank", the count written by the current connector
+            blank = info.pop("blank ")
+            info.setdefault("blank", blank)
+            changed = True
+        for field in LANGUAGE_FIELDS:
+            value = info.get(field)
+            if type(value) != int or value < 0:
+                report(f"languages.{language}.{field}", "value", f"expected non-negative integer, got {value!r}", NONE)
+    return changed
+
+
+def check_doc(kind, doc):
+    # Returns the defects found and whether the document was repaired in place
+    defects = []
+
+    def report(field, defect, detail, repair):
+        defects.append((field, defect, detail, repair))
+
+    if type(doc) != dict:
+        report(None, "type", f"expected object, got {type(doc).__name__}", NONE)
+        return defects, False
+    for field, expected in SCHEMAS[kind].items():
+        if field not in doc:
+            report(field, "missing", None, API if TIME == expected else NONE)
+        elif TIME == expected:
+            if not __valid_time(doc[field]):
+                report(field, "time", f"expected ISO 8601 time, got {doc[field]!r}", API)
+        elif not isinstance(expected, tuple) and type(doc[field]) != expected \
+                or isinstance(expected, tuple) and type(doc[field]) not in expected:
+            report(field, "type", f"unexpected {type(doc[field]).__name__}", NONE)
+    changed = False
+    if "repos" == kind and type(doc.get("languages")) == dict:
+        changed = __check_languages(doc["languages"], report)
+    return defects, changed
+
+
+def __defects(kind, path, doc, found, fixed):
+    owner = doc.get("owner") if type(doc) == dict else None
+    repo = doc.get("repo") if type(doc) == dict else None
+    return [Defect(kind, path, owner, repo, field, defect, detail, repair, fixed and LOCAL == repair)
+            for field, defect, detail, repair in found]
+
+
+def validate_dir(kind, dir, backup_dir, repair):
+    defects = []
+    count = 0
+    storage = None
+    for filename in sorted(os.listdir(dir)):
+        path = f"{dir}/{filename}"
+        if not filename.endswith(".json") or not os.path.isfile(path):
+            continue
+        count += 1
+        try:
+            with open(path, "rb") as jsonFile:
+                doc = json.loads(jsonFile.read())
+        except Exception as e:
+            defects.append(Defect(kind, path, None, None, None, "bad_json", f"{type(e).__name__}: {e}", NONE, False))
+            continue
+        found, changed = check_doc(kind, doc)
+        misplaced = False
+        if kind in ("repos", "skipped") and type(doc) == dict:
+            expected_path = f"{doc.get('owner')}/{doc.get('repo')}.json"
+            misplaced = not path.endswith(f"/{expected_path}")
+            if misplaced:
+                found.append((None, "path", f"record of {expected_path} stored in {path}", NONE))
+        # The storage writes a record to its own path, a misplaced one would be copied instead of repaired
+        fixed = repair and changed and not misplaced
+        if fixed:
+            if storage is None:
+                storage = DirectoryStorage(backup_dir)
+            getattr(storage, BackupValidator.write_methods[kind])(doc)
+        defects += __defects(kind, path, doc, found, fixed)
+    return defects, count
+
+
+def validate_docs(kind, docs, repair):
+    defects = []
+    repaired = []
+    for doc in docs:
+        found, changed = check_doc(kind, doc)
+        if repair and changed:
+            repaired.append(doc)
+        defects += __defects(kind, None, doc, found, repair and changed)
+    return defects, len(docs), repaired
+
+
+class BackupValidator:
+    write_methods = {
+        "repos": "add_repo",
+        "skipped": "add_skipped",
+        "langs": "add_language",
+        "licenses": "add_license"
+    }
+    read_methods = {
+        "repos": "repos",
+        "skipped": "skipped",
+        "langs": "languages",
+        "licenses": "licenses"
+    }
+
+
+    def __init__(self, backup_dir, processes=None, storage_type=StorageType.DIRECTORY, repair=False, chunk_size=1000):
+        self.backup_dir = backup_dir
+        self.processes = processes or os.cpu_count() or 1
+        self.storage_type = storage_type
+        self.repair = repair
+        self.chunk_size = chunk_size
+        self.defects = []
+        self.counts = Counter()
+
+
+    def __collect(self, kind, result):
+        defects, count = result[:2]
+        self.defects += defects
+        self.counts[kind] += count
+        return kind, result
+
+
+    def __run(self, executor, tasks):
+        # At most two tasks per process are in flight, the backup is never loaded at once
+        running = dict()
+        for kind, function, args in tasks:
+            if len(running) >= 2 * self.processes:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield self.__collect(running.pop(future), future.result())
+            running[executor.submit(function, *args)] = kind
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield self.__collect(running.pop(future), future.result())
+
+
+    def __directory_tasks(self):
+        for kind in ["langs", "licenses"]:
+            dir = f"{self.backup_dir}/{kind}"
+            if os.path.isdir(dir):
+                yield kind, validate_dir, (kind, dir, self.backup_dir, self.repair)
+        for kind in ["repos", "skipped"]:
+            parent_dir = f"{self.backup_dir}/{kind}"
+            if not os.path.isdir(parent_dir):
+                continue
+            for subdir in sorted(os.listdir(parent_dir)):
+                if os.path.isdir(f"{parent_dir}/{subdir}"):
+                    yield kind, validate_dir, (kind, f"{parent_dir}/{subdir}", self.backup_dir, self.repair)
+
+
+    def __catalog_tasks(self, catalog):
+        for kind, method in BackupValidator.read_methods.items():
+            chunk = []
+            for doc in getattr(catalog, method)():
+                chunk.append(doc)
+                if len(chunk) >= self.chunk_size:
+                    yield kind, validate_docs, (kind, chunk, self.repair)
+                    chunk = []
+            if chunk:
+                yield kind, validate_docs, (kind, chunk, self.repair)
+
+
+    def validate(self):
+        with ProcessPoolExecutor(max_workers=self.processes) as executor:
+            if StorageType.SQLITE != self.storage_type:
+                for _ in self.__run(executor, self.__directory_tasks()):
+                    pass
+                return self.defects
+            # Repairs go through a separate connection, the scan keeps reading its own snapshot
+            catalog = SqliteStorage(self.backup_dir)
+            storage = open_storage(self.backup_dir, self.storage_type)
+            try:
+                for kind, (_, _, repaired) in self.__run(executor, self.__catalog_tasks(catalog)):
+                    for doc in repaired:
+                        getattr(storage, BackupValidator.write_methods[kind])(doc)
+            finally:
+                storage.close()
+                catalog.close()
+        return self.defects
+
+
+def write_defects(path, defects):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as defectsFile:
+        for defect in defects:
+            defectsFile.write(json.dumps(defect._asdict()) + "\n")
+    os.replace(tmp_path, path)
+
+
+def read_defects(path):
+    with open(path, "r") as defectsFile:
+        return [Defect(**json.loads(line)) for line in defectsFile if line.strip()]
+
+
+def api_repair_targets(path):
+    # Repositories whose defects only the GitHub API can repair, in the order they were found
+    targets = dict()
+    for defect in read_defects(path):
+        if "repos" == defect.kind and API == defect.repair and defect.owner is not None and defect.repo is not None:
+            targets[(defect.owner, defect.repo)] = True
+    return list(targets)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        prog="validate_backup.py",
+        description="Validate backup records against the schema and repair local defects")
+    parser.add_argument("-b", "--backup", type=str, help="Backup directory")
+    parser.add_argument("-o", "--output", type=str, default=None,
+                        help="Defects index (JSON lines), <backup>/defects.jsonl if not set")
+    parser.add_argument("-r", "--repair", action=BooleanOptionalAction, default=False,
+                        help="Repair defects that need no GitHub API requests")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="Validating processes")
+    parser.add_argument("--storage", type=StorageType, choices=list(StorageType), default=StorageType.DIRECTORY,
+                        help="Backup storage backend")
+    args = parser.parse_args()
+
+    validator = BackupValidator(args.backup, args.processes, args.storage, args.repair)
+    defects = validator.validate()
+    output = args.output or f"{args.backup}/defects.jsonl"
+    write_defects(output, defects)
+
+    for kind, count in sorted(validator.counts.items()):
+        print(f"Checked {kind}: {count}")
+    summary = Counter((defect.kind, defect.defect, defect.repair, defect.fixed) for defect in defects)
+    for (kind, defect, repair, fixed), count in sorted(summary.items()):
+        print(f"{kind}: {defect} ({repair} repair{', fixed' if fixed else ''}): {count}", file=sys.stderr)
+    print(f"Defects: {len(defects)}, written to {output}")
@@ -0,0 +1,239 @@
+import itertools
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+import metrics
+from queue import Queue
+from threading import Lock, Thread
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class CommandTimeout(QuotaExceeded):
+    # Time is a quota as well, the repository is skipped and its directory released the same way
+    pass
+
+
+def directory_usage(path):
+    size = 0
+    inodes = 0
+    for root, dirs, files in os.walk(path):
+        inodes += len(dirs) + len(files)
+        for file in files:
+            try:
+                size += os.lstat(f"{root}/{file}").st_size
+            except OSError:
+                pass
+    return size, inodes
+
+
+class Workspace:
+    # Checkouts take more space than the packed repository size GitHub reports
+    expansion = 3
+    prefix = "dsl_analyzer-"
+
+
+    def __init__(self, base_dir, ram_dir=None, ram_max_bytes=None, repo_max_bytes=None, repo_max_inodes=None,
+                 total_max_bytes=None, total_max_inodes=None, run_timeout=None, poll_interval=0.2):
+        # Only the directories of this process are used and cleaned, --ram-dir may be shared like /dev/shm
+        self.base_dir = Workspace.__own_dir(base_dir)
+        self.ram_dir = Workspace.__own_dir(ram_dir) if ram_dir is not None else None
+        self.roots = [self.base_dir] + ([self.ram_dir] if self.ram_dir is not None else [])
+        # Largest expected checkout placed on the RAM-backed filesystem
+        self.ram_max_bytes = ram_max_bytes
+        self.repo_max_bytes = repo_max_bytes
+        self.repo_max_inodes = repo_max_inodes
+        self.total_max_bytes = total_max_bytes
+        self.total_max_inodes = total_max_inodes
+        # A stalled clone never outgrows a quota, it would hold its worker and directory forever
+        self.run_timeout = run_timeout
+        self.poll_interval = poll_interval
+        self.ids = itertools.count()
+        self.lock = Lock()
+        # work dir -> (bytes, inodes) measured last, and expected bytes reserved on the RAM filesystem
+        self.usage = dict()
+        self.ram_reserved = dict()
+        self.trash_usage = dict()
+        self.trash = Queue()
+        self.cleaner = Thread(target=self.__clean, name="workspace-cleaner", daemon=True)
+        self.cleaner.start()
+        for root in self.roots:
+            os.makedirs(f"{root}/.trash", exist_ok=True)
+            self.__discard_stale(os.path.dirname(root), root)
+
+
+    @staticmethod
+    def __own_dir(dir):
+        return f"{dir}/{Workspace.prefix}{os.getpid()}"
+
+
+    @staticmethod
+    def __alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+
+    def __discard_stale(self, parent, root):
+        # Directories left by interrupted runs are removed in the background as well
+        for entry in os.listdir(parent):
+            pid = entry[len(Workspace.prefix):]
+            if not entry.startswith(Workspace.prefix) or not pid.isdigit() or self.__alive(int(pid)):
+                continue
+            self.__discard(f"{parent}/{entry}", root)
+
+
+    def __discard(self, path, root, usage=(0, 0)):
+        # The trash is inside the root, so the rename never crosses filesystems and is instant
+        target = f"{root}/.trash/{time.time_ns()}-{next(self.ids)}"
+        os.rename(path, target)
+        with self.lock:
+            # Space is held until the cleaner has really freed it
+            self.trash_usage[target] = usage
+        self.trash.put(target)
+
+
+    def __clean(self):
+        while True:
+            path = self.trash.get()
+            if path is None:
+                return
+            try:
+                if os.path.isdir(path) and not os.path.islink(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            except OSError as e:
+                print(f"Failed to remove {path}: {e}", file=sys.stderr)
+            with self.lock:
+                self.trash_usage.pop(path, None)
+
+
+    def __fits_ram(self, expected):
+        if self.ram_dir is None or self.ram_max_bytes is None or expected > self.ram_max_bytes:
+            return False
+        with self.lock:
+            reserved = sum(self.ram_reserved.values())
+        return shutil.disk_usage(self.ram_dir).free - reserved >= expected
+
+
+    def acquire(self, size_kb=0):
+        expected = size_kb * 1024 * Workspace.expansion
+        root = self.ram_dir if self.__fits_ram(expected) else self.base_dir
+        work_dir = f"{root}/{next(self.ids)}"
+        os.makedirs(f"{work_dir}/repo")
+        with self.lock:
+            self.usage[work_dir] = (0, 0)
+            if root == self.ram_dir:
+                self.ram_reserved[work_dir] = expected
+        metrics.workspace_dirs.inc(placement="ram" if root == self.ram_dir else "disk")
+        return work_dir
+
+
+    def release(self, work_dir):
+        with self.lock:
+            usage = self.usage.pop(work_dir, (0, 0))
+            self.ram_reserved.pop(work_dir, None)
+        if not os.path.exists(work_dir):
+            return
+        root = self.ram_dir if self.ram_dir is not None and work_dir.startswith(f"{self.ram_dir}/") else self.base_dir
+        self.__discard(work_dir, root, usage)
+
+
+    def measured(self, work_dir):
+        with self.lock:
+            return self.usage.get(work_dir, (0, 0))
+
+
+    def check(self, work_dir, extra_bytes=0, extra_inodes=0):
+        size, inodes = directory_usage(work_dir)
+        size += extra_bytes
+        inodes += extra_inodes
+        with self.lock:
+            self.usage[work_dir] = (size, inodes)
+            total_bytes = sum(usage[0] for usage in self.usage.values())
+            total_bytes += sum(usage[0] for usage in self.trash_usage.values())
+            total_inodes = sum(usage[1] for usage in self.usage.values())
+            total_inodes += sum(usage[1] for usage in self.trash_usage.values())
+        for scope, value, limit, unit in [
+            ("repo", size, self.repo_max_bytes, "bytes"),
+            ("repo", inodes, self.repo_max_inodes, "inodes"),
+            ("total", total_bytes, self.total_max_bytes, "bytes"),
+            ("total", total_inodes, self.total_max_inodes, "inodes")
+        ]:
+            if limit is not None and value > limit:
+                metrics.workspace_quota_aborts.inc(scope=scope)
+                raise QuotaExceeded(f"{scope} workspace quota exceeded: {value} {unit} > {limit} {unit}")
+
+
+    def run(self, command, work_dir):
+        # The command is killed as soon as the checkout outgrows a quota, not after it has filled the disk.
+        # It gets its own process group, so helpers like git index-pack are killed with it
+        process = subprocess.Popen(command, start_new_session=True)
+        deadline = time.monotonic() + self.run_timeout if self.run_timeout is not None else None
+        interval = self.poll_interval
+        try:
+            while True:
+                try:
+                    wait_time = interval if deadline is None else max(0, min(interval, deadline - time.monotonic()))
+                    returncode = process.wait(timeout=wait_time)
+                    break
+                except subprocess.TimeoutExpired:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        metrics.workspace_quota_aborts.inc(scope="time")
+                        raise CommandTimeout(f"{command[0]} timed out after {self.run_timeout} s")
+                    start = time.perf_counter()
+                    self.check(work_dir)
+                    # Walking a large checkout is not free, it must not take most of the clone time
+                    interval = max(self.poll_interval, 4 * (time.perf_counter() - start))
+            self.check(work_dir)
+        except QuotaExceeded:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            process.wait()
+            raise
+        return 0 == returncode
+
+
+    def close(self):
+        self.trash.put(None)
+        self.cleaner.join()
+        for root in self.roots:
+            try:
+                os.rmdir(f"{root}/.trash")
+                os.rmdir(root)
+            except OSError as e:
+                print(f"Failed to remove workspace {root}: {e}", file=sys.stderr)
+
+
+def add_workspace_arguments(parser):
+    parser.add_argument("--ram-dir", type=str, default=None,
+                        help="Directory on a RAM-backed filesystem (tmpfs) for checkouts that fit")
+    parser.add_argument("--ram-max-size", type=int, default=256,
+                        help="Largest expected checkout in MB placed in --ram-dir")
+    parser.add_argument("--repo-quota", type=int, default=None, help="Checkout size limit in MB")
+    parser.add_argument("--repo-inodes", type=int, default=None, help="Checkout files and directories limit")
+    parser.add_argument("--total-quota", type=int, default=None, help="Size limit of all checkouts in MB")
+    parser.add_argument("--total-inodes", type=int, default=None, help="Files and directories limit of all checkouts")
+    parser.add_argument("--clone-timeout", type=int, default=1800,
+                        help="Seconds after which a clone is killed and the repository skipped")
+
+
+def __megabytes(value):
+    return value * 1024 * 1024 if value is not None else None
+
+
+def workspace_from_args(tmp_dir, args):
+    return Workspace(tmp_dir, args.ram_dir, __megabytes(args.ram_max_size), __megabytes(args.repo_quota),
+                     args.repo_inodes, __megabytes(args.total_quota), args.total_inodes, args.clone_timeout)